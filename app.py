@@ -4,14 +4,28 @@ Serves the Tiny Recursive Model for ARC-AGI puzzle solving
 """
 from fastapi import FastAPI, HTTPException, Request
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import HTMLResponse, JSONResponse
+from fastapi.responses import HTMLResponse, JSONResponse, StreamingResponse, PlainTextResponse, Response
 from pydantic import BaseModel, Field
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Callable
 import os
 import json
+import asyncio
+import dataclasses
 from pathlib import Path
 
-from inference import TRMInference, load_arc_task, get_sample_tasks
+from inference import TRMInference, EarlyExitPolicy, load_arc_task, get_sample_tasks
+from batching import MicroBatcher, BatcherConfig, QueueFullError
+from tta import TTAConfig
+from cache import PredictionCache, task_key
+from executor import InferenceExecutor, ExecutorConfig, ExecutorSaturated
+from replicas import ReplicaPool, ReplicaConfig
+from compiled import check_parity
+from instrumentation import profiler, format_metric
+from codec import BINARY_MEDIA_TYPE, dumps, pack_predictions
+from singleflight import SingleFlight
+from autotune import Autotuner
+from ensemble import TRMEnsemble, EnsembleConfig
+from result_store import ResultStore
 
 
 # Initialize FastAPI app
@@ -24,6 +38,30 @@ app = FastAPI(
 # Global model instance
 model: Optional[TRMInference] = None
 
+# Optional checkpoints voting with the model (TRM_ENSEMBLE_CHECKPOINTS)
+ensemble: Optional[TRMEnsemble] = None
+
+# Optional replica processes sharing the model's weights (TRM_REPLICAS > 0)
+replicas: Optional[ReplicaPool] = None
+
+# Dedicated threads for model calls, keeping the event loop free
+executor: Optional[InferenceExecutor] = None
+
+# Micro-batching scheduler in front of the model
+batcher: Optional[MicroBatcher] = None
+
+# Prediction cache for repeated tasks
+cache: Optional[PredictionCache] = None
+
+# Coalescing of identical solves that are still running
+flights: Optional[SingleFlight] = None
+
+# Thread and batch-size tuning for this host (TRM_AUTOTUNE)
+autotuner: Optional[Autotuner] = None
+
+# Append-only log of solve results (TRM_RESULT_STORE_DIR)
+result_store: Optional[ResultStore] = None
+
 
 # Pydantic models for API
 class GridInput(BaseModel):
@@ -51,14 +89,25 @@ class ARCTask(BaseModel):
 class SolveRequest(BaseModel):
     """Request to solve a puzzle"""
     task: ARCTask
+    task_id: Optional[str] = Field(None, description="Id recorded with the result in the result store (default: a hash of the task's grids)")
     max_steps: int = Field(16, ge=1, le=32, description="Maximum recursive reasoning steps")
     show_iterations: bool = Field(False, description="Return intermediate predictions")
+    stable_steps: Optional[int] = Field(None, ge=1, le=32, description="Stop once the prediction is unchanged for this many steps")
+    halt_threshold: Optional[float] = Field(None, gt=0.0, le=1.0, description="Stop once the halt confidence reaches this value")
+    bucketed: bool = Field(False, description="Run each grid at its size bucket's sequence length instead of 900 tokens (faster, but changes the answers for grids of up to 400 cells)")
+    tta_views: Optional[int] = Field(None, ge=1, le=256, description="Vote over this many dihedral/color-permuted views")
+    tta_vote: str = Field("majority", pattern="^(majority|confidence)$", description="Voting method for test-time augmentation")
+    trace: bool = Field(False, description="Return a Chrome trace-event timeline of this request (bypasses batching and the cache)")
 
 
 class SolveResponse(BaseModel):
     """Response with predictions"""
     predictions: List[Dict[str, Any]]
     message: str
+    tta: Optional[Dict[str, Any]] = None
+    ensemble: Optional[Dict[str, Any]] = None
+    cached: bool = False
+    trace: Optional[Dict[str, Any]] = None
 
 
 class ModelInfo(BaseModel):
@@ -67,13 +116,31 @@ class ModelInfo(BaseModel):
     parameters: int
     config: Dict[str, Any]
     checkpoint_loaded: bool
+    fingerprint: str
     device: str
+    precision: str
+    backend: str
+
+
+def verify_backend(model: TRMInference, num_tasks: int):
+    """Check a compiled step backend against eager on evaluation tasks, falling back to eager on mismatch"""
+    if num_tasks <= 0:
+        return
+    try:
+        report = check_parity(model, [task for _, task in get_sample_tasks(num_tasks)])
+    except Exception as e:
+        report = {'ok': False, 'error': str(e)}
+    if report['ok']:
+        print(f"✓ {model.backend} backend matches eager (max logit diff {report['max_logit_diff']:.2e})")
+    else:
+        print(f"✗ {model.backend} backend failed its parity check ({report}); using eager")
+        model.backend = 'eager'
 
 
 @app.on_event("startup")
 async def startup_event():
     """Initialize model on startup"""
-    global model
+    global model, ensemble, replicas, executor, batcher, cache, flights, autotuner, result_store
     try:
         checkpoint_path = os.environ.get("TRM_CHECKPOINT_PATH")
         device = "mps" if os.environ.get("USE_MPS", "false").lower() == "true" else "cpu"
@@ -82,6 +149,82 @@ async def startup_event():
     except Exception as e:
         print(f"✗ Error loading model: {e}")
         raise
+    
+    if model.backend != 'eager':
+        verify_backend(model, int(os.environ.get("TRM_BACKEND_CHECK_TASKS", 4)))
+    
+    executor_config = ExecutorConfig.from_env()
+    batcher_config = BatcherConfig.from_env()
+    replica_config = ReplicaConfig.from_env()
+    ensemble_config = EnsembleConfig.from_env()
+    if ensemble_config.enabled and replica_config.replicas == 0:
+        ensemble = TRMEnsemble(model, ensemble_config)
+        print(f"✓ Ensemble of {len(ensemble.members)} checkpoints ({ensemble_config.mode}, {ensemble_config.vote} vote)")
+    elif ensemble_config.enabled:
+        print("✗ TRM_ENSEMBLE_CHECKPOINTS is ignored with replicas; serving the single checkpoint")
+    autotuner = Autotuner()
+    if replica_config.replicas == 0:
+        tuned = await asyncio.get_running_loop().run_in_executor(None, autotuner.startup, ensemble or model)
+        if tuned is not None:
+            executor_config, batcher_config = autotuner.apply(tuned, executor_config, batcher_config)
+            interop = "" if autotuner.apply_interop(tuned) else " (inter-op threads apply at next start)"
+            print(f"✓ Autotuned ({autotuner.source}): {tuned.workers} worker(s) x {tuned.torch_threads} "
+                  f"thread(s), batch {tuned.max_batch}, {tuned.grids_per_second:.2f} grids/s{interop}")
+    else:
+        # Replicas pin their own cores and threads
+        replicas = ReplicaPool(model, replica_config)
+        await asyncio.get_running_loop().run_in_executor(None, replicas.wait_ready)
+        print(f"✓ {replica_config.replicas} model replica(s) on cores {replicas.cores}")
+        # Executor threads only wait on replicas, so one per replica is enough
+        executor_config = dataclasses.replace(
+            executor_config, workers=max(executor_config.workers, replica_config.replicas), torch_threads=1
+        )
+    
+    executor = InferenceExecutor(executor_config)
+    print(f"✓ Inference executor: {executor.config.workers} worker(s) x {executor.torch_threads} torch thread(s)")
+    
+    batcher = MicroBatcher(replicas or ensemble or model, batcher_config, executor=executor)
+    batcher.start()
+    print(f"✓ Micro-batching enabled: {batcher.config}")
+    
+    if cache is None:
+        cache = PredictionCache.from_env()
+    # Reduced precision can change answers, so it gets its own cache namespace
+    solver = ensemble or model
+    cache_namespace = solver.fingerprint if solver.precision == 'fp32' else f"{solver.fingerprint}-{solver.precision}"
+    if model.task_conditioner is not None:
+        # So do fitted task embeddings
+        cache_namespace = f"{cache_namespace}-tc{model.task_conditioner.config.tag}"
+    cache.bind(cache_namespace)
+    print(f"✓ Prediction cache bound to checkpoint {cache_namespace}")
+    
+    # Prefix reuse goes through the carry store, which only the in-process model can reach
+    flights = SingleFlight(prefix_reuse=replicas is None and solver.carry_store is not None)
+    
+    result_store = ResultStore.from_env()
+    if result_store is not None:
+        print(f"✓ Recording solve results to {result_store.store_dir} ({result_store.records} so far)")
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Stop the batching worker and inference threads"""
+    if batcher is not None:
+        await batcher.stop()
+    if executor is not None:
+        executor.shutdown()
+    if replicas is not None:
+        replicas.close()
+    if ensemble is not None:
+        ensemble.close()
+    if result_store is not None:
+        result_store.close()
+
+
+def overloaded(detail: str) -> HTTPException:
+    """503 response asking the client to retry once capacity frees up"""
+    retry_after = executor.retry_after() if executor is not None else 1
+    return HTTPException(status_code=503, detail=detail, headers={"Retry-After": str(retry_after)})
 
 
 @app.get("/", response_class=HTMLResponse)
@@ -99,12 +242,9 @@ async def get_model_info():
     if model is None:
         raise HTTPException(status_code=503, detail="Model not loaded")
     
-    # Count parameters
-    total_params = sum(p.numel() for p in model.model.parameters())
-    
     return ModelInfo(
         name="Tiny Recursive Model (TRM)",
-        parameters=total_params,
+        parameters=model.num_parameters,
         config={
             "H_cycles": model.config.H_cycles,
             "L_cycles": model.config.L_cycles,
@@ -112,44 +252,379 @@ async def get_model_info():
             "hidden_size": model.config.hidden_size,
             "halt_max_steps": model.config.halt_max_steps,
         },
-        checkpoint_loaded=False,  # We're using random init for now
-        device=model.device
+        checkpoint_loaded=model.checkpoint_loaded,
+        fingerprint=model.fingerprint,
+        device=model.device,
+        precision=model.precision,
+        backend=model.backend
+    )
+
+
+def request_task(request: SolveRequest) -> Dict[str, Any]:
+    """Convert the Pydantic task of a solve request to a plain dict"""
+    return {
+        'train': [{'input': ex.input, 'output': ex.output} for ex in request.task.train],
+        'test': [{'input': inp.input} for inp in request.task.test]
+    }
+
+
+def solve_options(request: SolveRequest) -> Dict[str, Any]:
+    """Keyword arguments for `TRMInference.solve_batch` from a solve request"""
+    return dict(
+        max_steps=request.max_steps,
+        show_iterations=request.show_iterations,
+        early_exit=EarlyExitPolicy(
+            stable_steps=request.stable_steps,
+            halt_threshold=request.halt_threshold
+        ),
+        bucketed=request.bucketed,
+        tta=TTAConfig(
+            num_views=request.tta_views,
+            vote=request.tta_vote,
+            chunk_size=int(os.environ.get("TRM_TTA_CHUNK", TTAConfig.chunk_size))
+        ) if request.tta_views else None,
+        array_grids=True
     )
 
 
-@app.post("/api/solve", response_model=SolveResponse)
-async def solve_puzzle(request: SolveRequest):
+def prefix_group(task: Dict[str, Any], options: Dict[str, Any]) -> Optional[str]:
+    """Key shared by requests that differ only in max_steps, when their solves can reuse each other's steps"""
+    if options['show_iterations'] or options['tta'] is not None or options['early_exit'].enabled:
+        return None
+    return cache.key(task, **{**options, 'max_steps': None})
+
+
+def traced_solve(task: Dict[str, Any], options: Dict[str, Any]):
+    """Solve one task on the in-process model (or ensemble) while collecting its Chrome trace events"""
+    with profiler.trace() as events:
+        with profiler.span('solve'):
+            results = (ensemble or model).solve_batch([task], **options)[0]
+    return results, events
+
+
+def record_result(request: SolveRequest, task: Dict[str, Any], results: Dict[str, Any]):
+    """Append a fresh (not cached) solve result to the result store, when enabled (blocking; call off the event loop)"""
+    if result_store is None:
+        return
+    solver = ensemble or model
+    options = request.model_dump(exclude={'task', 'task_id', 'trace'})
+    options['precision'] = solver.precision
+    result_store.append(request.task_id or task_key(task, '')[:16], solver.fingerprint, results, options)
+
+
+def solve_response(http_request: Request, **fields) -> Response:
+    """
+    Encode a SolveResponse without re-validating it
+    
+    Predictions are plain lists or numpy grids (`array_grids`), written with
+    the fast JSON encoder directly instead of through the response model.
+    Clients sending `Accept: application/x-trm-grids` get only the
+    predictions (with TTA and ensemble attempts), packed one byte per cell
+    (see `codec.pack_predictions`), with the message in an X-TRM-Message
+    header.
+    """
+    response = SolveResponse.model_construct(**fields)
+    if BINARY_MEDIA_TYPE in http_request.headers.get('accept', ''):
+        return Response(pack_predictions(response.predictions), media_type=BINARY_MEDIA_TYPE,
+                        headers={'X-TRM-Message': response.message.encode('ascii', 'ignore').decode().strip(),
+                                 'X-TRM-Cached': str(response.cached).lower()})
+    return Response(dumps(dict(response)), media_type='application/json')
+
+
+@app.post("/api/solve", response_model=SolveResponse,
+          responses={200: {'content': {BINARY_MEDIA_TYPE: {}}}})
+async def solve_puzzle(request: SolveRequest, http_request: Request):
     """
     Solve an ARC-AGI puzzle using the TRM model
     
     The model will recursively reason about the task and provide predictions.
     """
-    if model is None:
+    if model is None or batcher is None or cache is None or flights is None:
         raise HTTPException(status_code=503, detail="Model not loaded")
     
+    if ensemble is not None and request.tta_views:
+        raise HTTPException(status_code=400, detail="Test-time augmentation is not available with a checkpoint ensemble")
+    if request.tta_views and request.show_iterations:
+        raise HTTPException(status_code=400, detail="show_iterations is not available with test-time augmentation")
+    
     try:
-        # Convert Pydantic models to dict
-        task_dict = {
-            'train': [{'input': ex.input, 'output': ex.output} for ex in request.task.train],
-            'test': [{'input': inp.input} for inp in request.task.test]
-        }
+        task_dict = request_task(request)
+        options = solve_options(request)
         
-        # Run inference
-        results = model.solve(
-            task_dict,
-            max_steps=request.max_steps,
-            show_iterations=request.show_iterations
-        )
+        if request.trace:
+            results, events = await executor.run(traced_solve, task_dict, options)
+            await asyncio.to_thread(record_result, request, task_dict, results)
+            return solve_response(
+                http_request,
+                predictions=results['predictions'],
+                message="✓ Inference completed with tracing",
+                tta=results.get('tta'),
+                ensemble=results.get('ensemble'),
+                trace={'traceEvents': events, 'displayTimeUnit': 'ms'}
+            )
+        
+        key = cache.key(task_dict, **options)
+        # The disk tier does file I/O, kept off the event loop
+        results = await asyncio.to_thread(cache.get, key)
+        if results is not None:
+            return solve_response(
+                http_request,
+                predictions=results['predictions'],
+                message="✓ Served from prediction cache",
+                tta=results.get('tta'),
+                ensemble=results.get('ensemble'),
+                cached=True
+            )
         
-        return SolveResponse(
+        async def solve():
+            # Only the request that runs the solve stores it, not the duplicates sharing its result
+            results = await batcher.submit(task_dict, **options)
+            await asyncio.to_thread(cache.put, key, results)
+            await asyncio.to_thread(record_result, request, task_dict, results)
+            return results
+        
+        # Run inference (batched with other pending requests), unless an identical solve is running
+        results = await flights.run(key, solve, group=prefix_group(task_dict, options), max_steps=request.max_steps)
+        
+        return solve_response(
+            http_request,
             predictions=results['predictions'],
-            message="✓ Inference completed successfully"
+            message="✓ Inference completed successfully",
+            tta=results.get('tta'),
+            ensemble=results.get('ensemble')
         )
     
+    except (QueueFullError, ExecutorSaturated) as e:
+        raise overloaded(str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Inference error: {str(e)}")
 
 
+class SlotStreamingResponse(StreamingResponse):
+    """
+    Streaming response that gives back an executor slot once it is done
+    
+    The slot is released when the response finishes, fails, or the client
+    disconnects, even before the body generator started (an unstarted
+    async generator never runs its `finally`).
+    """
+    
+    def __init__(self, content, release: Callable[[], None], **kwargs):
+        super().__init__(content, **kwargs)
+        self._release = release
+    
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self._release()
+
+
+@app.post("/api/solve/stream")
+async def solve_puzzle_stream(request: SolveRequest):
+    """
+    Solve an ARC-AGI puzzle, streaming each step's prediction as server-sent events
+    
+    Events: `start` (grid shapes), one `step` per test input and step (full
+    `grid` the first time, then only the `changes` as [row, col, value]),
+    and `done` (steps used per test input). Every step is streamed, so
+    `show_iterations` has no effect; test-time augmentation and checkpoint
+    ensembles are not available in streaming mode.
+    """
+    if model is None or executor is None:
+        raise HTTPException(status_code=503, detail="Model not loaded")
+    
+    if request.tta_views:
+        raise HTTPException(status_code=400, detail="Test-time augmentation is not available in streaming mode")
+    if ensemble is not None:
+        raise HTTPException(status_code=400, detail="Streaming is not available with a checkpoint ensemble")
+    
+    try:
+        executor.acquire()
+    except ExecutorSaturated as e:
+        raise overloaded(str(e))
+    
+    try:
+        options = solve_options(request)
+        events = (replicas or model).solve_stream(
+            request_task(request),
+            max_steps=options['max_steps'],
+            early_exit=options['early_exit'],
+            bucketed=options['bucketed']
+        )
+    except BaseException:
+        executor.release()
+        raise
+    
+    async def encode():
+        # Each step is computed on an inference thread, never on the event loop
+        try:
+            async for event in executor.stream(events):
+                yield f"event: {event['event']}\ndata: {dumps(event).decode()}\n\n"
+        except Exception as e:
+            error = {'event': 'error', 'detail': f"Inference error: {str(e)}"}
+            yield f"event: error\ndata: {json.dumps(error)}\n\n"
+    
+    return SlotStreamingResponse(
+        encode(),
+        release=executor.release,
+        media_type="text/event-stream",
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+
+@app.get("/api/batching")
+async def get_batching_stats():
+    """Get micro-batching configuration, queue depth and counters"""
+    if batcher is None:
+        raise HTTPException(status_code=503, detail="Model not loaded")
+    return batcher.stats()
+
+
+@app.get("/api/executor")
+async def get_executor_stats():
+    """Get inference thread pool configuration, load and rejection counters"""
+    if executor is None:
+        raise HTTPException(status_code=503, detail="Model not loaded")
+    return executor.stats()
+
+
+@app.get("/api/replicas")
+async def get_replica_stats():
+    """Get replica processes, their core sets and outstanding jobs"""
+    if replicas is None:
+        return {'config': dataclasses.asdict(ReplicaConfig.from_env()), 'replicas': []}
+    return replicas.stats()
+
+
+@app.get("/api/ensemble")
+async def get_ensemble_stats():
+    """Get ensemble members, voting settings and run counters"""
+    if model is None:
+        raise HTTPException(status_code=503, detail="Model not loaded")
+    if ensemble is None:
+        return {'enabled': False}
+    return {'enabled': True, **ensemble.stats()}
+
+
+@app.get("/api/dedup")
+async def get_dedup_stats():
+    """Get in-flight solve coalescing counters"""
+    if flights is None:
+        raise HTTPException(status_code=503, detail="Model not loaded")
+    return flights.stats()
+
+
+@app.get("/api/autotune")
+async def get_autotune():
+    """Get autotuning settings and the thread/batch setting in use"""
+    if autotuner is None:
+        raise HTTPException(status_code=503, detail="Model not loaded")
+    return autotuner.stats()
+
+
+@app.post("/api/autotune")
+async def run_autotune():
+    """Benchmark thread and batch settings now, persist the fastest and switch the executor and batcher to it"""
+    if model is None or autotuner is None or executor is None or batcher is None:
+        raise HTTPException(status_code=503, detail="Model not loaded")
+    if replicas is not None:
+        raise HTTPException(status_code=409, detail="Replicas pin their own threads; autotuning applies to in-process serving")
+    if autotuner.running:
+        raise HTTPException(status_code=409, detail="Autotuning is already running")
+    # Serving continues meanwhile, so the numbers are only representative on an idle server
+    tuned = await asyncio.get_running_loop().run_in_executor(None, autotuner.tune, ensemble or model)
+    executor_config, batcher_config = autotuner.apply(tuned, executor.config, batcher.config)
+    executor.reconfigure(executor_config.workers, executor_config.torch_threads)
+    batcher.reconfigure(batcher_config.max_batch, executor_config.workers)
+    autotuner.apply_interop(tuned)
+    return autotuner.stats()
+
+
+@app.get("/api/results")
+async def get_result_store_stats():
+    """Get result store size and append counters"""
+    if model is None:
+        raise HTTPException(status_code=503, detail="Model not loaded")
+    if result_store is None:
+        return {'enabled': False}
+    return {'enabled': True, **result_store.stats()}
+
+
+@app.get("/api/cache")
+async def get_cache_stats():
+    """Get prediction cache size and hit/miss counters"""
+    if cache is None:
+        raise HTTPException(status_code=503, detail="Model not loaded")
+    return cache.stats()
+
+
+@app.delete("/api/cache")
+async def clear_cache():
+    """Drop all in-memory cached predictions"""
+    if cache is None:
+        raise HTTPException(status_code=503, detail="Model not loaded")
+    cache.clear()
+    return cache.stats()
+
+
+@app.get("/api/carry-store")
+async def get_carry_store_stats():
+    """Get latent carry store size and hit/miss counters (with replicas, each process keeps its own store)"""
+    if model is None:
+        raise HTTPException(status_code=503, detail="Model not loaded")
+    if model.carry_store is None:
+        return {'enabled': False}
+    return {'enabled': True, **model.carry_store.stats()}
+
+
+@app.get("/api/task-embeddings")
+async def get_task_embedding_stats():
+    """Get task conditioning settings, slot use and fitted-embedding cache counters"""
+    if model is None:
+        raise HTTPException(status_code=503, detail="Model not loaded")
+    if model.task_conditioner is None:
+        return {'enabled': False}
+    return {'enabled': True, **model.task_conditioner.stats()}
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """
+    Prometheus metrics
+    
+    Per-step stage timings, FLOPs and allocator statistics are aggregated only
+    with TRM_INSTRUMENT=true; executor, batching and cache counters are always
+    reported. With replicas, step metrics are summed over the replica
+    processes as of each one's last finished job.
+    """
+    lines = profiler.prometheus(dict(replicas.profiles) if replicas is not None else None)
+    if executor is not None:
+        stats = executor.stats()
+        lines += format_metric('trm_executor_pending', 'gauge', "Running and waiting inference jobs", [({}, stats['pending'])])
+        lines += format_metric('trm_executor_completed_total', 'counter', "Completed inference jobs", [({}, stats['completed'])])
+        lines += format_metric('trm_executor_rejected_total', 'counter', "Jobs rejected by admission control", [({}, stats['rejected'])])
+        lines += format_metric('trm_executor_busy_seconds_total', 'counter', "Time spent in inference jobs", [({}, stats['busy_seconds'])])
+    if batcher is not None:
+        stats = batcher.stats()
+        lines += format_metric('trm_batch_queue_size', 'gauge', "Requests waiting to be batched", [({}, stats['queue_size'])])
+        lines += format_metric('trm_batch_requests_total', 'counter', "Requests submitted to the batcher", [({}, stats['requests'])])
+        lines += format_metric('trm_batches_total', 'counter', "Batches dispatched", [({}, stats['batches'])])
+        lines += format_metric('trm_batch_rows_total', 'counter', "Test inputs dispatched in batches", [({}, stats['rows'])])
+    if cache is not None:
+        stats = cache.stats()
+        lines += format_metric('trm_cache_entries', 'gauge', "Predictions held in memory", [({}, stats['entries'])])
+        lines += format_metric('trm_cache_hits_total', 'counter', "Prediction cache hits",
+                               [({'tier': 'memory'}, stats['hits']), ({'tier': 'disk'}, stats['disk_hits'])])
+        lines += format_metric('trm_cache_misses_total', 'counter', "Prediction cache misses", [({}, stats['misses'])])
+    if flights is not None:
+        stats = flights.stats()
+        lines += format_metric('trm_dedup_in_flight', 'gauge', "Distinct solves running", [({}, stats['in_flight'])])
+        lines += format_metric('trm_dedup_hits_total', 'counter', "Requests coalesced with a running solve",
+                               [({'kind': 'exact'}, stats['exact_hits']), ({'kind': 'prefix'}, stats['prefix_hits'])])
+    return PlainTextResponse('\n'.join(lines) + '\n', media_type='text/plain; version=0.0.4')
+
+
 @app.get("/api/examples")
 async def get_examples():
     """Get sample ARC-AGI tasks from the evaluation set"""
@@ -0,0 +1,307 @@
+#!/usr/bin/env python3
+"""
+Thread and batch-size autotuning for CPU inference
+Benchmarks a representative solve over worker, intra-op thread and batch-size combinations and keeps the fastest per host
+"""
+import argparse
+import copy
+import dataclasses
+import json
+import os
+import random
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field, asdict
+from typing import Dict, List, Tuple, Any, Optional
+
+import torch
+
+from instrumentation import profiler
+
+
+def available_cores() -> int:
+    """Cores this process may run on (its affinity mask, not the machine's total)"""
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def thread_counts(cores: int) -> List[int]:
+    """Intra-op thread counts worth trying: powers of two up to `cores`, plus `cores` itself"""
+    counts = [1]
+    while counts[-1] * 2 <= cores:
+        counts.append(counts[-1] * 2)
+    if counts[-1] != cores:
+        counts.append(cores)
+    return counts
+
+
+def without_carry_store(model):
+    """
+    Shallow copy of a TRMInference or TRMEnsemble with no carry store
+
+    The copy shares weights, buffers and compiled steps with `model`, so it
+    benchmarks the same code paths, while the carry store that live requests
+    use is neither read nor filled.
+    """
+    clone = copy.copy(model)
+    if hasattr(model, 'members'):
+        clone.members = [without_carry_store(member) for member in model.members]
+    else:
+        clone.carry_store = None
+    return clone
+
+
+@dataclass
+class AutotuneConfig:
+    """What the autotuner tries, and when it runs"""
+    mode: str = 'off'                  # off, startup (reuse the saved result, tuning when none) or always
+    batch_sizes: List[int] = field(default_factory=lambda: [1, 4, 16])  # Test grids per model call
+    max_steps: int = 4                 # Recursion steps per benchmark solve
+    rounds: int = 2                    # Timed solves per worker (after one warm-up solve)
+    grid_side: int = 15                # Benchmark grids are side x side
+    tolerance: float = 0.05            # Candidates this close to the fastest count as ties
+    cache_dir: str = '.cache/autotune' # Tuned settings, one JSON file per host
+
+    @classmethod
+    def from_env(cls) -> "AutotuneConfig":
+        """Read TRM_AUTOTUNE, TRM_AUTOTUNE_BATCH_SIZES, TRM_AUTOTUNE_STEPS, TRM_AUTOTUNE_ROUNDS and TRM_AUTOTUNE_DIR"""
+        mode = os.environ.get("TRM_AUTOTUNE", cls.mode).lower()
+        mode = {'true': 'startup', 'false': 'off'}.get(mode, mode)
+        if mode not in ('off', 'startup', 'always'):
+            raise ValueError(f"TRM_AUTOTUNE must be off, startup or always, not {mode!r}")
+        batch_sizes = os.environ.get("TRM_AUTOTUNE_BATCH_SIZES")
+        return cls(
+            mode=mode,
+            batch_sizes=[int(b) for b in batch_sizes.split(',')] if batch_sizes else [1, 4, 16],
+            max_steps=int(os.environ.get("TRM_AUTOTUNE_STEPS", cls.max_steps)),
+            rounds=int(os.environ.get("TRM_AUTOTUNE_ROUNDS", cls.rounds)),
+            cache_dir=os.environ.get("TRM_AUTOTUNE_DIR") or cls.cache_dir,
+        )
+
+
+@dataclass
+class TuneResult:
+    """Fastest setting found for one host and model"""
+    workers: int               # Concurrent model calls (TRM_INFERENCE_WORKERS)
+    torch_threads: int         # Intra-op threads per worker (TRM_TORCH_THREADS)
+    interop_threads: int       # Inter-op pool size
+    max_batch: int             # Test grids per model call (TRM_MAX_BATCH)
+    grids_per_second: float
+    cores: int
+    profile: str
+    tuned_at: float
+    candidates: List[Dict[str, Any]] = field(default_factory=list)
+
+
+class Autotuner:
+    """
+    Benchmarks `solve_batch` for each (workers, threads, batch size) candidate and persists the winner
+
+    Every candidate uses all detected cores: `workers` concurrent solves of
+    `torch_threads` intra-op threads each, so workers x threads = cores and
+    the machine is never oversubscribed. Throughput is test grids per
+    second over all workers. Results are saved per host under `cache_dir`,
+    keyed by core count, torch version and model identity, so a restart on
+    the same machine reapplies them without benchmarking again.
+    """
+
+    def __init__(self, config: Optional[AutotuneConfig] = None):
+        self.config = config or AutotuneConfig.from_env()
+        self.result: Optional[TuneResult] = None
+        self.source: Optional[str] = None      # 'saved' or 'tuned'
+        self.interop_applied = False
+        self.running = False
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def profile(model, cores: Optional[int] = None) -> str:
+        """What a tuned setting depends on besides the host"""
+        return (f"{cores or available_cores()}c-torch{torch.__version__}-{model.fingerprint}"
+                f"-{model.precision}-{model.backend}-{model.device}")
+
+    def _path(self) -> str:
+        return os.path.join(self.config.cache_dir, f"{socket.gethostname()}.json")
+
+    def _read(self) -> Dict[str, Any]:
+        try:
+            with open(self._path(), 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def load(self, model) -> Optional[TuneResult]:
+        """The saved result for this host and model, if any"""
+        saved = self._read().get(self.profile(model))
+        if saved is None:
+            return None
+        try:
+            return TuneResult(**saved)
+        except TypeError:
+            return None
+
+    def save(self, result: TuneResult):
+        """Record a result in this host's file, next to results for other models"""
+        os.makedirs(self.config.cache_dir, exist_ok=True)
+        saved = self._read()
+        saved[result.profile] = asdict(result)
+        path = self._path()
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(saved, f, indent=2)
+        os.replace(tmp_path, path)
+
+    def candidates(self, cores: int) -> List[Tuple[int, int, int]]:
+        """(workers, torch_threads, batch size) combinations to benchmark"""
+        return [(cores // threads, threads, batch_size)
+                for threads in thread_counts(cores) for batch_size in self.config.batch_sizes]
+
+    def measure(self, model, workers: int, threads: int, batch_size: int,
+                rng: random.Random) -> float:
+        """
+        Test grids per second with `workers` concurrent `solve_batch` calls of `batch_size` grids
+
+        Solves run on a copy of `model` without its carry store, and the
+        profiler records nothing from them, so neither the carry store nor
+        the served metrics are touched by the benchmark.
+        """
+        side = self.config.grid_side
+        model = without_carry_store(model)
+
+        def make_task():
+            grids = [[[rng.randint(0, 9) for _ in range(side)] for _ in range(side)] for _ in range(batch_size)]
+            return {'train': [], 'test': [{'input': grid} for grid in grids]}
+
+        def solve(tasks):
+            with profiler.suspend():
+                for task in tasks:
+                    model.solve_batch([task], max_steps=self.config.max_steps)
+
+        with ThreadPoolExecutor(max_workers=workers, initializer=torch.set_num_threads,
+                                initargs=(threads,)) as pool:
+            warmup = [[make_task()] for _ in range(workers)]
+            list(pool.map(solve, warmup))
+            timed = [[make_task() for _ in range(self.config.rounds)] for _ in range(workers)]
+            start = time.perf_counter()
+            list(pool.map(solve, timed))
+            elapsed = time.perf_counter() - start
+        return workers * self.config.rounds * batch_size / elapsed
+
+    def tune(self, model, log=print) -> TuneResult:
+        """Benchmark every candidate on `model`, save the fastest and make it the current result"""
+        with self._lock:
+            if self.running:
+                raise RuntimeError("Autotuning is already running")
+            self.running = True
+        try:
+            cores = available_cores()
+            rng = random.Random(0)
+            measured = []
+            for workers, threads, batch_size in self.candidates(cores):
+                rate = self.measure(model, workers, threads, batch_size, rng)
+                measured.append({'workers': workers, 'torch_threads': threads,
+                                 'batch_size': batch_size, 'grids_per_second': rate})
+                log(f"  autotune: {workers} worker(s) x {threads} thread(s), batch {batch_size}: "
+                    f"{rate:.2f} grids/s")
+            # Within the noise of the fastest, smaller batches (less queueing per request) and more workers win
+            fastest = max(m['grids_per_second'] for m in measured)
+            best = min((m for m in measured if m['grids_per_second'] >= (1 - self.config.tolerance) * fastest),
+                       key=lambda m: (m['batch_size'], -m['workers']))
+            result = TuneResult(
+                workers=best['workers'],
+                torch_threads=best['torch_threads'],
+                # Eager solves do no inter-op work; one thread per worker avoids a pool of `cores` idle threads
+                interop_threads=best['workers'],
+                max_batch=best['batch_size'],
+                grids_per_second=best['grids_per_second'],
+                cores=cores,
+                profile=self.profile(model, cores),
+                tuned_at=time.time(),
+                candidates=measured,
+            )
+            self.save(result)
+            self.result, self.source = result, 'tuned'
+            return result
+        finally:
+            self.running = False
+
+    def startup(self, model, log=print) -> Optional[TuneResult]:
+        """Result to serve with per `config.mode`: None when off, else the saved one or a fresh tune"""
+        if self.config.mode == 'off':
+            return None
+        if self.config.mode == 'startup':
+            saved = self.load(model)
+            if saved is not None:
+                self.result, self.source = saved, 'saved'
+                return saved
+        return self.tune(model, log)
+
+    def apply_interop(self, result: TuneResult) -> bool:
+        """
+        Set the inter-op pool size (possible only before the process first uses it)
+
+        Returns:
+            True if applied; False means the setting takes effect at the next start
+        """
+        try:
+            torch.set_num_interop_threads(result.interop_threads)
+            self.interop_applied = True
+        except RuntimeError:
+            self.interop_applied = torch.get_num_interop_threads() == result.interop_threads
+        return self.interop_applied
+
+    @staticmethod
+    def apply(result: TuneResult, executor_config, batcher_config):
+        """
+        Executor and batcher configs with the tuned values, except where set explicitly in the environment
+
+        Returns:
+            (executor_config, batcher_config)
+        """
+        executor_fields = {}
+        if "TRM_INFERENCE_WORKERS" not in os.environ:
+            executor_fields['workers'] = result.workers
+        if "TRM_TORCH_THREADS" not in os.environ:
+            executor_fields['torch_threads'] = result.torch_threads
+        batcher_fields = {} if "TRM_MAX_BATCH" in os.environ else {'max_batch': result.max_batch}
+        return (dataclasses.replace(executor_config, **executor_fields),
+                dataclasses.replace(batcher_config, **batcher_fields))
+
+    def stats(self) -> Dict[str, Any]:
+        """Configuration, state and the current result"""
+        return {
+            'config': asdict(self.config),
+            'cores': available_cores(),
+            'running': self.running,
+            'source': self.source,
+            'interop_applied': self.interop_applied,
+            'interop_threads': torch.get_num_interop_threads(),
+            'result': asdict(self.result) if self.result is not None else None,
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tune inference threads and batch size for this host")
+    parser.add_argument('--checkpoint', default=os.environ.get("TRM_CHECKPOINT_PATH"), help="Model checkpoint")
+    parser.add_argument('--batch-sizes', type=lambda s: [int(b) for b in s.split(',')], default=None)
+    parser.add_argument('--max-steps', type=int, default=None)
+    parser.add_argument('--rounds', type=int, default=None)
+    args = parser.parse_args()
+
+    config = AutotuneConfig.from_env()
+    overrides = {name: value for name, value in (('batch_sizes', args.batch_sizes), ('max_steps', args.max_steps),
+                                                 ('rounds', args.rounds)) if value is not None}
+    tuner = Autotuner(dataclasses.replace(config, **overrides))
+
+    from inference import TRMInference
+    model = TRMInference(checkpoint_path=args.checkpoint)
+    result = tuner.tune(model)
+    print(f"\n✓ {result.workers} worker(s) x {result.torch_threads} thread(s), batch {result.max_batch}: "
+          f"{result.grids_per_second:.2f} grids/s on {result.cores} core(s)")
+    print(f"Saved to {tuner._path()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,232 @@
+"""
+Dynamic micro-batching for TRM inference
+Collects concurrent solve requests and runs their test grids through the model as one batch
+"""
+import asyncio
+import os
+import time
+from dataclasses import dataclass, field, asdict, replace
+from functools import partial
+from typing import Dict, List, Any, Optional
+
+
+@dataclass
+class BatcherConfig:
+    """Micro-batching knobs (trade p50 latency against throughput)"""
+    max_batch: int = 16        # Maximum test grids per model call
+    max_wait_ms: float = 5.0   # How long the first request waits for company
+    queue_depth: int = 64      # Pending requests before new ones are rejected
+
+    @classmethod
+    def from_env(cls) -> "BatcherConfig":
+        """Read TRM_MAX_BATCH, TRM_BATCH_WAIT_MS and TRM_QUEUE_DEPTH"""
+        return cls(
+            max_batch=int(os.environ.get("TRM_MAX_BATCH", cls.max_batch)),
+            max_wait_ms=float(os.environ.get("TRM_BATCH_WAIT_MS", cls.max_wait_ms)),
+            queue_depth=int(os.environ.get("TRM_QUEUE_DEPTH", cls.queue_depth)),
+        )
+
+
+class QueueFullError(Exception):
+    """Raised when the request queue is at capacity"""
+
+
+@dataclass
+class _Pending:
+    """A queued solve request waiting for its batch"""
+    task: Dict[str, Any]
+    options: Dict[str, Any]
+    future: asyncio.Future
+    enqueued: float = field(default_factory=time.perf_counter)
+
+    @property
+    def rows(self) -> int:
+        return len(self.task['test'])
+
+    @property
+    def key(self) -> tuple:
+        return tuple(sorted(self.options.items()))
+
+
+class MicroBatcher:
+    """Request queue plus a background worker that batches pending solves"""
+
+    def __init__(self, model, config: Optional[BatcherConfig] = None, executor=None):
+        """
+        Args:
+            model: Object exposing `solve_batch(tasks, **options)`
+            config: Batching configuration (defaults to environment settings)
+            executor: Optional `InferenceExecutor` to run batches on (default: the loop's executor)
+        """
+        self.model = model
+        self.config = config or BatcherConfig.from_env()
+        self.executor = executor
+        # One batch in flight per inference worker
+        self._slots = asyncio.Semaphore(executor.config.workers if executor else 1)
+        self._inflight = set()
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=self.config.queue_depth)
+        self._held: Optional[_Pending] = None
+        self._collecting: List[_Pending] = []
+        self._worker: Optional[asyncio.Task] = None
+
+        # Counters
+        self.requests = 0
+        self.rejected = 0
+        self.dispatched = 0
+        self.batches = 0
+        self.rows = 0
+        self.total_wait = 0.0
+        self.last_batch_rows = 0
+
+    def start(self):
+        """Start the background batching worker on the running event loop"""
+        if self._worker is None:
+            self._worker = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        """Cancel the worker and fail any requests still waiting (queued, held back, or collected but not yet run)"""
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+        for task in list(self._inflight):
+            task.cancel()
+        stranded, self._collecting = self._collecting, []
+        if self._held is not None:
+            stranded.append(self._held)
+            self._held = None
+        while not self.queue.empty():
+            stranded.append(self.queue.get_nowait())
+        self._fail(stranded, RuntimeError("Batcher stopped"))
+
+    @staticmethod
+    def _fail(batch: List[_Pending], error: BaseException):
+        for pending in batch:
+            if not pending.future.done():
+                pending.future.set_exception(error)
+
+    async def submit(self, task: Dict[str, Any], **options) -> Dict[str, Any]:
+        """
+        Queue a task and wait for its result
+        
+        Args:
+            task: ARC-AGI task dict
+            **options: Keyword arguments for `solve_batch` (must be hashable)
+        """
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self.queue.put_nowait(_Pending(task, options, future))
+        except asyncio.QueueFull:
+            self.rejected += 1
+            raise QueueFullError(f"Request queue is full ({self.config.queue_depth} pending)")
+        self.requests += 1
+        return await future
+
+    async def _next(self, timeout: Optional[float] = None) -> _Pending:
+        """Get the next pending request, honouring one held back from the last batch"""
+        if self._held is not None:
+            pending, self._held = self._held, None
+            return pending
+        if timeout is None:
+            return await self.queue.get()
+        return await asyncio.wait_for(self.queue.get(), timeout)
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            first = await self._next()
+            # Kept on the batcher so `stop` can fail requests taken off the queue but not yet dispatched
+            batch = self._collecting = [first]
+            rows = first.rows
+            deadline = loop.time() + self.config.max_wait_ms / 1000.0
+
+            # Collect more requests until the batch is full or the wait expires
+            while rows < self.config.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    pending = await self._next(timeout)
+                except asyncio.TimeoutError:
+                    break
+                if rows + pending.rows > self.config.max_batch:
+                    self._held = pending
+                    break
+                batch.append(pending)
+                rows += pending.rows
+
+            slots = self._slots
+            await slots.acquire()
+            task = loop.create_task(self._dispatch(batch))
+            self._collecting = []
+            self._inflight.add(task)
+            task.add_done_callback(partial(self._dispatched, slots))
+
+    def _dispatched(self, slots: asyncio.Semaphore, task: asyncio.Task):
+        self._inflight.discard(task)
+        slots.release()
+
+    def reconfigure(self, max_batch: int, slots: int):
+        """
+        Change the batch size limit and how many batches may be in flight
+
+        Batches already running finish on their old slots, so for a moment
+        up to the old plus the new number of batches can be in flight.
+        """
+        self.config = replace(self.config, max_batch=max_batch)
+        self._slots = asyncio.Semaphore(slots)
+
+    async def _dispatch(self, batch: List[_Pending]):
+        """Run a collected batch through the model and resolve each caller's future"""
+        loop = asyncio.get_running_loop()
+        now = time.perf_counter()
+        batch = [pending for pending in batch if not pending.future.done()]
+
+        # Requests can only share a recursion if they ask for the same settings
+        groups: Dict[tuple, List[_Pending]] = {}
+        for pending in batch:
+            groups.setdefault(pending.key, []).append(pending)
+
+        try:
+            for group in groups.values():
+                self.batches += 1
+                self.last_batch_rows = sum(pending.rows for pending in group)
+                self.rows += self.last_batch_rows
+                self.dispatched += len(group)
+                self.total_wait += sum(now - pending.enqueued for pending in group)
+
+                solve = partial(self.model.solve_batch, [pending.task for pending in group],
+                                **group[0].options)
+                try:
+                    if self.executor is not None:
+                        results = await self.executor.run(solve)
+                    else:
+                        results = await loop.run_in_executor(None, solve)
+                except Exception as e:
+                    self._fail(group, e)
+                    continue
+
+                for pending, result in zip(group, results):
+                    if not pending.future.done():
+                        pending.future.set_result(result)
+        except asyncio.CancelledError:
+            # Cancelled by `stop`: callers of groups not yet resolved would otherwise wait forever
+            self._fail(batch, RuntimeError("Batcher stopped"))
+            raise
+
+    def stats(self) -> Dict[str, Any]:
+        """Configuration and counters for monitoring"""
+        return {
+            'config': asdict(self.config),
+            'queue_size': self.queue.qsize() + (self._held is not None),
+            'requests': self.requests,
+            'rejected': self.rejected,
+            'batches': self.batches,
+            'rows': self.rows,
+            'last_batch_rows': self.last_batch_rows,
+            'avg_batch_rows': self.rows / self.batches if self.batches else 0.0,
+            'avg_wait_ms': 1000.0 * self.total_wait / self.dispatched if self.dispatched else 0.0,
+        }
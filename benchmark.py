@@ -0,0 +1,663 @@
+#!/usr/bin/env python3
+"""
+Benchmarks for TRM inference
+Runs offline on CPU with a randomly initialized model
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from typing import Dict, List, Tuple, Any
+
+import torch
+
+from inference import TRMInference, default_dataset_path, load_arc_task, get_sample_tasks
+from tta import TTAConfig
+
+
+def random_grid(height: int, width: int, rng: random.Random) -> List[List[int]]:
+    """Random ARC-style grid with colors 0-9"""
+    return [[rng.randint(0, 9) for _ in range(width)] for _ in range(height)]
+
+
+def make_task(grids: List[List[List[int]]]) -> Dict[str, Any]:
+    """Wrap test grids in an ARC task dict"""
+    return {'train': [], 'test': [{'input': grid} for grid in grids]}
+
+
+def timed(fn, repeats: int) -> float:
+    """Best wall time of `repeats` calls"""
+    best = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def bench_buckets(model: TRMInference, max_steps: int, batch_size: int, repeats: int,
+                  rng: random.Random) -> List[Dict[str, Any]]:
+    """Full 900-token padding vs size-bucketed execution, one row per bucket"""
+    results = []
+    for seq_len in model.seq_buckets:
+        side = int(seq_len ** 0.5)
+        task = make_task([random_grid(side, side, rng) for _ in range(batch_size)])
+        
+        full = timed(lambda: model.solve(task, max_steps=max_steps), repeats)
+        bucketed = timed(lambda: model.solve(task, max_steps=max_steps, bucketed=True), repeats)
+        results.append({
+            'bucket': seq_len,
+            'grid': f"{side}x{side}",
+            'full_s': full,
+            'bucketed_s': bucketed,
+            'speedup': full / bucketed,
+            'flops_ratio': model.step_flops(model.seq_len) / model.step_flops(seq_len),
+        })
+    return results
+
+
+def bench_tta(model: TRMInference, view_counts: List[int], max_steps: int, chunk_size: int,
+              rng: random.Random) -> List[Dict[str, Any]]:
+    """Views per second for test-time augmentation at several view counts"""
+    task = make_task([random_grid(rng.randint(3, 12), rng.randint(3, 12), rng)])
+    results = []
+    for num_views in view_counts:
+        config = TTAConfig(num_views=num_views, chunk_size=chunk_size)
+        report = model.solve_batch([task], max_steps=max_steps, tta=config)[0]['tta']
+        results.append({'views': num_views, **report})
+    return results
+
+
+def bench_dataset(dataset_path: str, lookups: int) -> Dict[str, Any]:
+    """Per-call json.load of the challenges file vs memory-mapped store lookups"""
+    from dataset_store import get_store
+    store = get_store(dataset_path)
+    task_ids = store.task_ids
+    
+    start = time.perf_counter()
+    with open(dataset_path, 'r') as f:
+        json.load(f)[task_ids[0]]
+    json_s = time.perf_counter() - start
+    
+    start = time.perf_counter()
+    for i in range(lookups):
+        store.get_arrays(task_ids[i % len(task_ids)])
+    arrays_us = 1e6 * (time.perf_counter() - start) / lookups
+    
+    start = time.perf_counter()
+    for i in range(lookups):
+        load_arc_task(task_ids[i % len(task_ids)], dataset_path)
+    task_us = 1e6 * (time.perf_counter() - start) / lookups
+    
+    return {'tasks': len(store), 'json_load_us': 1e6 * json_s,
+            'store_arrays_us': arrays_us, 'load_arc_task_us': task_us}
+
+
+def bench_backend(model: TRMInference, backends: List[str], num_tasks: int, max_steps: int,
+                  repeats: int) -> List[Dict[str, Any]]:
+    """Warm latency of each step backend on evaluation tasks, with its parity against eager"""
+    from compiled import check_parity
+    tasks = [task for _, task in get_sample_tasks(num_tasks)]
+    results = []
+    for backend in backends:
+        model.backend = backend
+        parity = check_parity(model, tasks, max_steps) if backend != 'eager' else None
+        model.solve_batch(tasks, max_steps=max_steps)  # Warm up (compilation, first-call setup)
+        seconds = timed(lambda: model.solve_batch(tasks, max_steps=max_steps), repeats)
+        results.append({'backend': backend, 'seconds': seconds, 'parity': parity})
+    return results
+
+
+def bench_precision(precisions: List[str], num_tasks: int, max_steps: int,
+                    repeats: int) -> List[Dict[str, Any]]:
+    """fp32 parity, latency and weight memory of each precision mode on evaluation tasks"""
+    from fast_start import model_tensors
+    from precision import compare_precisions
+    tasks = [task for _, task in get_sample_tasks(num_tasks)]
+    reference = TRMInference(precision='fp32')
+    weights = model_tensors(reference.model)
+    models = {
+        precision: reference if precision == 'fp32' else TRMInference(weights=weights, precision=precision)
+        for precision in precisions
+    }
+    return compare_precisions(reference, models, tasks, max_steps, repeats)
+
+
+def bench_allocations(model: TRMInference, batch_size: int, side: int, steps: Tuple[int, int],
+                      rng: random.Random) -> List[Dict[str, Any]]:
+    """
+    Tensor allocations per recursion step and per request
+    
+    Counts are split by running two step counts: the difference is the
+    per-step cost, the rest is fixed per request. 'model_per_step' is what one
+    forward of the inner model allocates on its own.
+    """
+    from instrumentation import AllocationCounter
+    task = make_task([random_grid(side, side, rng) for _ in range(batch_size)])
+    
+    def count(max_steps):
+        counter = AllocationCounter()
+        with counter:
+            model.solve_batch([task], max_steps=max_steps)
+        return counter
+    
+    inner = model.model.inner
+    batch = {
+        'inputs': torch.zeros(batch_size, model.seq_len, dtype=torch.int32, device=model.device),
+        'puzzle_identifiers': torch.zeros(batch_size, 1, dtype=torch.int32, device=model.device)
+    }
+    carry = inner.empty_carry(batch_size)
+    with torch.no_grad():
+        counter = AllocationCounter()
+        with counter:
+            inner(carry, batch)
+    model_per_step = counter.tensors
+    
+    short, long = steps
+    model.solve_batch([task], max_steps=short)  # Warm up
+    a, b = count(short), count(long)
+    per_step = (b.tensors - a.tensors) / (long - short)
+    per_step_bytes = (b.bytes - a.bytes) / (long - short)
+    return [{
+        'batch_size': batch_size,
+        'per_step': per_step,
+        'loop_per_step': per_step - model_per_step,
+        'model_per_step': model_per_step,
+        'per_step_mb': per_step_bytes / 2 ** 20,
+        'per_request': a.tensors - short * per_step,
+        'per_request_mb': (a.bytes - short * per_step_bytes) / 2 ** 20,
+    }]
+
+
+def _wait_for(url: str, deadline: float, data: bytes = None) -> bool:
+    """Poll a URL until it answers 200 or the deadline passes"""
+    while time.perf_counter() < deadline:
+        request = urllib.request.Request(url, data=data, headers={'Content-Type': 'application/json'})
+        try:
+            with urllib.request.urlopen(request, timeout=max(0.1, deadline - time.perf_counter())) as response:
+                if response.status == 200:
+                    return True
+        except OSError:
+            time.sleep(0.02)
+    return False
+
+
+def start_server(env: Dict[str, str], port: int) -> subprocess.Popen:
+    """Launch `uvicorn app:app` on localhost with extra environment variables"""
+    return subprocess.Popen(
+        [sys.executable, '-m', 'uvicorn', 'app:app', '--host', '127.0.0.1', '--port', str(port)],
+        cwd=os.path.dirname(os.path.abspath(__file__)), env={**os.environ, **env},
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+
+
+def time_startup(env: Dict[str, str], port: int, task: Dict[str, Any], timeout: float) -> Dict[str, float]:
+    """Start the API server and time the first successful /health and /api/solve"""
+    start = time.perf_counter()
+    deadline = start + timeout
+    server = start_server(env, port)
+    try:
+        base = f"http://127.0.0.1:{port}"
+        if not _wait_for(f"{base}/health", deadline):
+            raise RuntimeError("Server did not become healthy")
+        health_s = time.perf_counter() - start
+        body = json.dumps({'task': task, 'max_steps': 1}).encode()
+        if not _wait_for(f"{base}/api/solve", deadline, data=body):
+            raise RuntimeError("First /api/solve did not succeed")
+        return {'health_s': health_s, 'solve_s': time.perf_counter() - start}
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def bench_startup(checkpoint_path: str, runs: int, port: int, timeout: float,
+                  rng: random.Random) -> List[Dict[str, Any]]:
+    """
+    Time to first /health and first /api/solve, with and without the fast-start path
+    
+    Without a checkpoint, one is written from a randomly initialized model
+    (plus optimizer-sized padding, like a training checkpoint). Snapshots go
+    to a temporary TRM_MODEL_CACHE_DIR.
+    """
+    import torch
+    task = make_task([random_grid(5, 5, rng)])
+    with tempfile.TemporaryDirectory() as tmp:
+        if checkpoint_path is None:
+            checkpoint_path = os.path.join(tmp, 'random.pt')
+            state = TRMInference(fast_start=False).model.state_dict()
+            optimizer = {name: torch.zeros_like(tensor) for name, tensor in state.items()}
+            torch.save({'model_state_dict': state, 'optimizer_state_dict': optimizer}, checkpoint_path)
+        
+        env = {'TRM_CHECKPOINT_PATH': checkpoint_path, 'TRM_MODEL_CACHE_DIR': os.path.join(tmp, 'snapshots')}
+        modes = [
+            ('baseline', {'TRM_FAST_START': 'false'}),
+            ('fast, first start', {'TRM_FAST_START': 'true'}),
+            ('fast, snapshot', {'TRM_FAST_START': 'true'}),
+        ]
+        results = []
+        for mode, mode_env in modes:
+            timings = [time_startup({**env, **mode_env}, port, task, timeout)
+                       for _ in range(1 if mode == 'fast, first start' else runs)]
+            results.append({
+                'mode': mode,
+                'health_s': min(t['health_s'] for t in timings),
+                'solve_s': min(t['solve_s'] for t in timings),
+            })
+        return results
+
+
+# Default sweeps of the `suite` scenario, and the smaller ones used with --quick
+SUITE_SWEEPS = {
+    'grid_sides': [3, 5, 10, 15, 20, 25, 30],
+    'max_steps': [1, 2, 4, 8, 16, 32],
+    'batch_sizes': [1, 2, 4, 8, 16],
+    'tta_views': [1, 8, 16, 32],
+    'concurrency': [1, 4, 16],
+}
+QUICK_SWEEPS = {
+    'grid_sides': [3, 10, 30],
+    'max_steps': [1, 4, 16],
+    'batch_sizes': [1, 4],
+    'tta_views': [1, 8],
+    'concurrency': [1, 4],
+}
+SUITE_SCENARIOS = ('grid', 'steps', 'batch', 'tta', 'http')
+
+
+def reset_peak_rss(pid: int = None) -> bool:
+    """
+    Restart the peak resident set size (VmHWM) of this or another process from its current size
+    
+    Linux only (writes 5 to /proc/<pid>/clear_refs); returns False where that
+    is unsupported, in which case peaks cover the process's whole lifetime.
+    """
+    try:
+        with open(f"/proc/{pid or 'self'}/clear_refs", 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss_mb(pid: int = None) -> float:
+    """Peak resident set size of this or another process since its last `reset_peak_rss`"""
+    try:
+        with open(f"/proc/{pid or 'self'}/status") as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    if pid is None:
+        import resource
+        # Lifetime peak; ru_maxrss is in kB on Linux, bytes on macOS
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (2 ** 20 if sys.platform == 'darwin' else 1024)
+    return 0.0
+
+
+def summarize(scenario: str, params: Dict[str, Any], latencies: List[float], grids: int,
+              wall_s: float, steps: int, rss_mb: float, errors: int = 0) -> Dict[str, Any]:
+    """
+    One result row of the suite
+    
+    Args:
+        scenario: Scenario name ('grid', 'steps', ...)
+        params: What varies within the scenario (grid size, batch size, ...)
+        latencies: Seconds per call
+        grids: Test grids solved over all calls
+        wall_s: Wall time over all calls (less than the latency sum under concurrency)
+        steps: Recursion steps per call, for per-step time
+        rss_mb: Peak resident memory of the process doing the work, during this case
+        errors: Failed calls (HTTP only)
+    """
+    import numpy as np
+    ms = 1000 * np.asarray(latencies)
+    p50 = float(np.percentile(ms, 50))
+    return {
+        'scenario': scenario,
+        'params': params,
+        'calls': len(latencies),
+        'errors': errors,
+        'latency_ms': {
+            'p50': p50,
+            'p95': float(np.percentile(ms, 95)),
+            'p99': float(np.percentile(ms, 99)),
+            'mean': float(ms.mean()),
+        },
+        'grids_per_second': grids / wall_s,
+        'step_ms': p50 / max(1, steps),
+        'peak_rss_mb': rss_mb,
+    }
+
+
+def case_key(result: Dict[str, Any]) -> str:
+    """Identity of a suite result, for matching it against a baseline"""
+    return f"{result['scenario']}:{json.dumps(result['params'], sort_keys=True)}"
+
+
+def _calls(fn, repeats: int) -> Tuple[List[float], Any]:
+    """Latency of `repeats` calls after one warm-up call, plus the last result"""
+    result = fn()
+    latencies = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = fn()
+        latencies.append(time.perf_counter() - start)
+    return latencies, result
+
+
+def _steps_used(results: List[Dict[str, Any]]) -> int:
+    return max(p['steps'] for r in results for p in r['predictions'])
+
+
+def suite_inference(model: TRMInference, scenarios: List[str], sweeps: Dict[str, List[int]],
+                    max_steps: int, side: int, repeats: int, bucketed: bool,
+                    rng: random.Random) -> List[Dict[str, Any]]:
+    """
+    In-process scenarios of the suite: grid size, max_steps, batch size and TTA views
+    
+    Each scenario varies one dimension and holds the others at `max_steps`
+    steps, `side` x `side` grids and batch size 1.
+    """
+    def run(scenario, params, tasks, steps, tta=None):
+        reset_peak_rss()
+        latencies, results = _calls(
+            lambda: model.solve_batch(tasks, max_steps=steps, bucketed=bucketed, tta=tta), repeats)
+        grids = sum(len(task['test']) for task in tasks)
+        return summarize(scenario, params, latencies, grids * repeats, sum(latencies),
+                         _steps_used(results), peak_rss_mb())
+    
+    cases = []
+    if 'grid' in scenarios:
+        for n in sweeps['grid_sides']:
+            task = make_task([random_grid(n, n, rng)])
+            cases.append(run('grid', {'grid': f"{n}x{n}"}, [task], max_steps))
+    if 'steps' in scenarios:
+        task = make_task([random_grid(side, side, rng)])
+        for steps in sweeps['max_steps']:
+            cases.append(run('steps', {'max_steps': steps}, [task], steps))
+    if 'batch' in scenarios:
+        for batch_size in sweeps['batch_sizes']:
+            tasks = [make_task([random_grid(side, side, rng)]) for _ in range(batch_size)]
+            cases.append(run('batch', {'batch_size': batch_size}, tasks, max_steps))
+    if 'tta' in scenarios:
+        task = make_task([random_grid(side, side, rng)])
+        for num_views in sweeps['tta_views']:
+            cases.append(run('tta', {'views': num_views}, [task], max_steps, TTAConfig(num_views=num_views)))
+    return cases
+
+
+def _post_solve(url: str, task: Dict[str, Any], max_steps: int, timeout: float) -> Tuple[float, int]:
+    """Latency and steps used of one /api/solve call (steps is 0 if the call failed)"""
+    body = json.dumps({'task': task, 'max_steps': max_steps}).encode()
+    request = urllib.request.Request(url, data=body, headers={'Content-Type': 'application/json'})
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            result = json.load(response)
+    except OSError:
+        return time.perf_counter() - start, 0
+    return time.perf_counter() - start, max(p['steps'] for p in result['predictions'])
+
+
+def suite_http(concurrency_levels: List[int], requests: int, max_steps: int, side: int,
+               port: int, timeout: float, rng: random.Random) -> List[Dict[str, Any]]:
+    """
+    End-to-end /api/solve load against a uvicorn server at fixed concurrency levels
+    
+    Every request carries a fresh random grid, so the prediction cache never
+    answers. Peak RSS is the server's, per concurrency level.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    server = start_server({'TRM_CACHE_SIZE': '0'}, port)
+    try:
+        base = f"http://127.0.0.1:{port}"
+        if not _wait_for(f"{base}/health", time.perf_counter() + timeout):
+            raise RuntimeError("Server did not become healthy")
+        url = f"{base}/api/solve"
+        _post_solve(url, make_task([random_grid(side, side, rng)]), max_steps, timeout)  # Warm up
+        
+        cases = []
+        for concurrency in concurrency_levels:
+            tasks = [make_task([random_grid(side, side, rng)]) for _ in range(requests)]
+            reset_peak_rss(server.pid)
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                calls = list(pool.map(lambda task: _post_solve(url, task, max_steps, timeout), tasks))
+            wall_s = time.perf_counter() - start
+            
+            ok = [steps for _, steps in calls if steps]
+            cases.append(summarize(
+                'http', {'concurrency': concurrency}, [latency for latency, _ in calls], len(ok), wall_s,
+                max(ok, default=max_steps), peak_rss_mb(server.pid), errors=len(calls) - len(ok)
+            ))
+        return cases
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def compare_to_baseline(results: List[Dict[str, Any]], baseline: List[Dict[str, Any]],
+                        threshold: float) -> List[Dict[str, Any]]:
+    """
+    Cases whose p50 latency or grids/sec got worse than the baseline by more than `threshold`
+    
+    Cases missing from either side are skipped.
+    
+    Returns:
+        One dict per regressed metric with 'case', 'metric', 'baseline',
+        'current' and relative 'change'
+    """
+    previous = {case_key(r): r for r in baseline}
+    regressions = []
+    for result in results:
+        base = previous.get(case_key(result))
+        if base is None:
+            continue
+        metrics = [
+            ('latency_ms.p50', base['latency_ms']['p50'], result['latency_ms']['p50'], 1),
+            ('grids_per_second', base['grids_per_second'], result['grids_per_second'], -1),
+        ]
+        for metric, old, new, direction in metrics:
+            change = (new - old) / old if old else 0.0
+            if direction * change > threshold:
+                regressions.append({'case': case_key(result), 'metric': metric,
+                                    'baseline': old, 'current': new, 'change': change})
+    return regressions
+
+
+def run_suite(args, rng: random.Random) -> int:
+    """Run the suite, write/compare JSON and print a table; returns the exit status"""
+    import platform
+    import torch
+    sweeps = dict(QUICK_SWEEPS if args.quick else SUITE_SWEEPS)
+    overrides = {'grid_sides': args.grid_sides, 'max_steps': args.max_steps_sweep,
+                 'batch_sizes': args.batch_sizes, 'tta_views': args.tta_views, 'concurrency': args.concurrency}
+    sweeps.update({name: values for name, values in overrides.items() if values is not None})
+    repeats = args.repeats or (3 if args.quick else 10)
+    requests = args.requests or (8 if args.quick else 32)
+    
+    results = []
+    in_process = [s for s in args.scenarios if s != 'http']
+    if in_process:
+        torch.manual_seed(args.seed)
+        model = TRMInference(checkpoint_path=args.checkpoint)
+        results += suite_inference(model, in_process, sweeps, args.max_steps, args.side,
+                                   repeats, args.bucketed, rng)
+    if 'http' in args.scenarios:
+        results += suite_http(sweeps['concurrency'], requests, args.max_steps, args.side,
+                              args.port, args.timeout, rng)
+    
+    print(f"\n{'case':<32} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'grids/s':>8} {'step ms':>8} {'RSS MB':>7}")
+    for r in results:
+        params = ','.join(f"{k}={v}" for k, v in r['params'].items())
+        latency = r['latency_ms']
+        print(f"{r['scenario'] + ' ' + params:<32} {latency['p50']:>9.1f} {latency['p95']:>9.1f} "
+              f"{latency['p99']:>9.1f} {r['grids_per_second']:>8.2f} {r['step_ms']:>8.2f} {r['peak_rss_mb']:>7.0f}"
+              + (f"  ({r['errors']} errors)" if r['errors'] else ''))
+    
+    if args.output:
+        report = {
+            'meta': {
+                'timestamp': time.time(),
+                'host': platform.node(),
+                'python': platform.python_version(),
+                'torch': torch.__version__,
+                'cpu_count': os.cpu_count(),
+                'torch_threads': torch.get_num_threads(),
+                'seed': args.seed,
+                'repeats': repeats,
+                'max_steps': args.max_steps,
+                'side': args.side,
+                'bucketed': args.bucketed,
+            },
+            'results': results,
+        }
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\nWrote {args.output}")
+    
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['results']
+        regressions = compare_to_baseline(results, baseline, args.threshold)
+        matched = len({case_key(r) for r in results} & {case_key(r) for r in baseline})
+        print(f"\nCompared {matched} cases against {args.baseline} (threshold {args.threshold:.0%})")
+        for r in regressions:
+            print(f"  REGRESSION {r['case']} {r['metric']}: {r['baseline']:.2f} -> {r['current']:.2f} ({r['change']:+.1%})")
+        if regressions:
+            return 1
+        print("  No regressions")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark TRM inference")
+    subparsers = parser.add_subparsers(dest='scenario', required=True)
+    
+    buckets = subparsers.add_parser('buckets', help="Size-bucketed execution vs 900-token padding")
+    buckets.add_argument('--max-steps', type=int, default=2)
+    buckets.add_argument('--batch-size', type=int, default=4)
+    buckets.add_argument('--repeats', type=int, default=3)
+    
+    tta = subparsers.add_parser('tta', help="Test-time augmentation throughput")
+    tta.add_argument('--views', type=int, nargs='+', default=[1, 8, 16, 32])
+    tta.add_argument('--max-steps', type=int, default=2)
+    tta.add_argument('--chunk-size', type=int, default=64)
+    
+    dataset = subparsers.add_parser('dataset', help="Task lookup latency")
+    dataset.add_argument('--dataset', default=None, help="Challenges JSON (default: evaluation set)")
+    dataset.add_argument('--lookups', type=int, default=1000)
+    
+    backend = subparsers.add_parser('backend', help="Eager vs compiled recursion steps")
+    backend.add_argument('--backends', nargs='+', default=['eager', 'script', 'compile'])
+    backend.add_argument('--tasks', type=int, default=4)
+    backend.add_argument('--max-steps', type=int, default=4)
+    backend.add_argument('--repeats', type=int, default=3)
+    
+    precision = subparsers.add_parser('precision', help="fp32 vs bf16 vs int8 parity, latency and memory")
+    precision.add_argument('--precisions', nargs='+', default=['fp32', 'bf16', 'int8'])
+    precision.add_argument('--tasks', type=int, default=8)
+    precision.add_argument('--max-steps', type=int, default=4)
+    precision.add_argument('--repeats', type=int, default=2)
+    
+    startup = subparsers.add_parser('startup', help="Time to first /health and /api/solve")
+    startup.add_argument('--checkpoint', default=None, help="Checkpoint to serve (default: a random one)")
+    startup.add_argument('--runs', type=int, default=3)
+    startup.add_argument('--port', type=int, default=8765)
+    startup.add_argument('--timeout', type=float, default=120.0)
+    
+    allocations = subparsers.add_parser('allocations', help="Tensor allocations per recursion step and per request")
+    allocations.add_argument('--batch-size', type=int, default=4)
+    allocations.add_argument('--side', type=int, default=30)
+    allocations.add_argument('--steps', type=int, nargs=2, default=[4, 8], help="Two step counts to difference")
+    
+    suite = subparsers.add_parser('suite', help="Latency percentiles, throughput and memory sweeps, with JSON output")
+    suite.add_argument('--scenarios', nargs='+', choices=SUITE_SCENARIOS, default=list(SUITE_SCENARIOS))
+    suite.add_argument('--quick', action='store_true', help="Smaller sweeps and fewer repeats")
+    suite.add_argument('--grid-sides', type=int, nargs='+', default=None)
+    suite.add_argument('--steps', dest='max_steps_sweep', type=int, nargs='+', default=None)
+    suite.add_argument('--batch-sizes', type=int, nargs='+', default=None)
+    suite.add_argument('--views', dest='tta_views', type=int, nargs='+', default=None)
+    suite.add_argument('--concurrency', type=int, nargs='+', default=None)
+    suite.add_argument('--max-steps', type=int, default=4, help="Steps when not sweeping max_steps")
+    suite.add_argument('--side', type=int, default=10, help="Grid side when not sweeping grid size")
+    suite.add_argument('--bucketed', action='store_true')
+    suite.add_argument('--repeats', type=int, default=None, help="Timed calls per case (default: 10, quick: 3)")
+    suite.add_argument('--requests', type=int, default=None, help="HTTP requests per concurrency level (default: 32, quick: 8)")
+    suite.add_argument('--checkpoint', default=None, help="Checkpoint for in-process cases (default: random init)")
+    suite.add_argument('--output', default=None, help="Write results as JSON")
+    suite.add_argument('--baseline', default=None, help="Earlier --output to compare against")
+    suite.add_argument('--threshold', type=float, default=0.10, help="Relative change that counts as a regression")
+    suite.add_argument('--port', type=int, default=8765)
+    suite.add_argument('--timeout', type=float, default=120.0)
+    
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    
+    rng = random.Random(args.seed)
+    
+    if args.scenario == 'suite':
+        sys.exit(run_suite(args, rng))
+    
+    if args.scenario == 'startup':
+        results = bench_startup(args.checkpoint, args.runs, args.port, args.timeout, rng)
+        print(f"\n{'mode':<18} {'/health (s)':>11} {'/api/solve (s)':>14}")
+        for r in results:
+            print(f"{r['mode']:<18} {r['health_s']:>11.2f} {r['solve_s']:>14.2f}")
+        return
+    
+    if args.scenario == 'dataset':
+        result = bench_dataset(args.dataset or default_dataset_path(), args.lookups)
+        print(f"\nTasks: {result['tasks']}")
+        print(f"json.load per call:     {result['json_load_us']:>10.1f} us")
+        print(f"store.get_arrays:       {result['store_arrays_us']:>10.1f} us")
+        print(f"load_arc_task (lists):  {result['load_arc_task_us']:>10.1f} us")
+        return
+    
+    if args.scenario == 'precision':
+        results = bench_precision(args.precisions, args.tasks, args.max_steps, args.repeats)
+        print(f"\n{'mode':>5} {'exact':>6} {'cells':>6} {'seconds':>8} {'speedup':>8} {'weights (MB)':>12}")
+        for r in results:
+            print(f"{r['precision']:>5} {r['exact_match']:>6.1%} {r['cell_match']:>6.1%} {r['seconds']:>8.3f} "
+                  f"{r['speedup']:>7.2f}x {r['weight_mb']:>12.2f}")
+        return
+    
+    model = TRMInference()
+    
+    if args.scenario == 'buckets':
+        results = bench_buckets(model, args.max_steps, args.batch_size, args.repeats, rng)
+        print(f"\n{'bucket':>6} {'grid':>6} {'full (s)':>9} {'bucketed (s)':>12} {'speedup':>8} {'FLOPs ratio':>11}")
+        for r in results:
+            print(f"{r['bucket']:>6} {r['grid']:>6} {r['full_s']:>9.3f} {r['bucketed_s']:>12.3f} "
+                  f"{r['speedup']:>7.2f}x {r['flops_ratio']:>10.2f}x")
+    
+    elif args.scenario == 'tta':
+        results = bench_tta(model, args.views, args.max_steps, args.chunk_size, rng)
+        print(f"\n{'views':>6} {'seconds':>8} {'views/s':>8}")
+        for r in results:
+            print(f"{r['views']:>6} {r['seconds']:>8.3f} {r['views_per_second']:>8.1f}")
+    
+    elif args.scenario == 'allocations':
+        results = bench_allocations(model, args.batch_size, args.side, tuple(args.steps), rng)
+        print(f"\n{'batch':>6} {'per step':>8} {'loop':>6} {'model':>6} {'MB/step':>8} {'per request':>11} {'MB/request':>10}")
+        for r in results:
+            print(f"{r['batch_size']:>6} {r['per_step']:>8.1f} {r['loop_per_step']:>6.1f} {r['model_per_step']:>6} "
+                  f"{r['per_step_mb']:>8.1f} {r['per_request']:>11.1f} {r['per_request_mb']:>10.2f}")
+    
+    elif args.scenario == 'backend':
+        results = bench_backend(model, args.backends, args.tasks, args.max_steps, args.repeats)
+        print(f"\n{'backend':>8} {'seconds':>8} {'parity':>7} {'max |dlogit|':>12}")
+        for r in results:
+            parity = r['parity'] or {'ok': True, 'max_logit_diff': 0.0}
+            print(f"{r['backend']:>8} {r['seconds']:>8.3f} {'ok' if parity['ok'] else 'FAIL':>7} "
+                  f"{parity['max_logit_diff']:>12.2e}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+"""
+Content-addressed prediction cache for TRM inference
+LRU memory tier with an optional on-disk tier that survives restarts
+"""
+import dataclasses
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Optional
+
+import numpy as np
+
+from codec import dumps
+
+
+def _canonical(value: Any) -> Any:
+    """Convert solve options (dataclasses, tuples) to plain JSON values"""
+    if dataclasses.is_dataclass(value):
+        return {'__type__': type(value).__name__, **_canonical(dataclasses.asdict(value))}
+    if isinstance(value, dict):
+        return {str(k): _canonical(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_canonical(v) for v in value]
+    return value
+
+
+def task_key(task: Dict[str, Any], fingerprint: str, **options) -> str:
+    """
+    Hash of a canonicalized task, solve options and checkpoint fingerprint
+    
+    Only the grids of the task are hashed, so extra fields (ids, names,
+    expected outputs of test inputs) do not split the cache.
+    """
+    canonical = {
+        'fingerprint': fingerprint,
+        'train': [[ex['input'], ex['output']] for ex in task.get('train', [])],
+        'test': [inp['input'] for inp in task['test']],
+        'options': _canonical(options),
+    }
+    payload = json.dumps(canonical, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def _copy(value: Any) -> Any:
+    """Copy of a result's dicts, lists and numpy grids (rows of plain numbers are copied in one go)"""
+    if isinstance(value, dict):
+        return {k: _copy(v) for k, v in value.items()}
+    if isinstance(value, list):
+        if value and isinstance(value[0], (dict, list, np.ndarray)):
+            return [_copy(v) for v in value]
+        return list(value)
+    if isinstance(value, np.ndarray):
+        return value.copy()
+    return value
+
+
+class PredictionCache:
+    """
+    LRU cache of `solve` results
+
+    Entries are copied on the way in and out, so callers may annotate or
+    modify the results they put or get without touching the cached ones.
+    Safe to call from several threads (the API does its lookups off the
+    event loop).
+    """
+    
+    def __init__(self, max_entries: int = 256, disk_dir: Optional[str] = None):
+        """
+        Args:
+            max_entries: Memory tier size limit (0 disables the memory tier)
+            disk_dir: Directory for the persistent tier (None for memory only)
+        """
+        self.max_entries = max_entries
+        self.disk_dir = disk_dir
+        self.fingerprint: Optional[str] = None
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+    
+    @classmethod
+    def from_env(cls) -> "PredictionCache":
+        """Read TRM_CACHE_SIZE and TRM_PREDICTION_CACHE_DIR"""
+        return cls(
+            max_entries=int(os.environ.get("TRM_CACHE_SIZE", 256)),
+            disk_dir=os.environ.get("TRM_PREDICTION_CACHE_DIR") or None,
+        )
+    
+    def bind(self, fingerprint: str):
+        """Attach the cache to a checkpoint, dropping entries from any other one"""
+        with self._lock:
+            if fingerprint != self.fingerprint:
+                self._entries.clear()
+                self.fingerprint = fingerprint
+    
+    def key(self, task: Dict[str, Any], **options) -> str:
+        """Cache key for a task solved with the given options"""
+        if self.fingerprint is None:
+            raise RuntimeError("Cache is not bound to a checkpoint")
+        return task_key(task, self.fingerprint, **options)
+    
+    def _path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, key[:2], f"{key}.json")
+    
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Look up a result, promoting disk hits into memory"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+        if entry is not None:
+            return _copy(entry)
+        
+        if self.disk_dir:
+            path = self._path(key)
+            if os.path.exists(path):
+                try:
+                    with open(path, 'r') as f:
+                        value = json.load(f)
+                except (OSError, ValueError):
+                    value = None
+                if value is not None:
+                    cached = _copy(value)
+                    with self._lock:
+                        self.disk_hits += 1
+                        self._remember(key, cached)
+                    return value
+        
+        with self._lock:
+            self.misses += 1
+        return None
+    
+    def put(self, key: str, value: Dict[str, Any]):
+        """Store a result in memory and, if enabled, on disk"""
+        cached = _copy(value)
+        with self._lock:
+            self._remember(key, cached)
+        if self.disk_dir:
+            path = self._path(key)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            # Predictions may be numpy grids (`array_grids`); they are stored as lists
+            with open(tmp_path, 'wb') as f:
+                f.write(dumps(value))
+            os.replace(tmp_path, path)
+    
+    def _remember(self, key: str, value: Dict[str, Any]):
+        if self.max_entries <= 0:
+            return
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+    
+    def clear(self):
+        """Drop the memory tier (the disk tier is keyed by fingerprint and left alone)"""
+        with self._lock:
+            self._entries.clear()
+    
+    def stats(self) -> Dict[str, Any]:
+        """Size, configuration and hit/miss counters"""
+        lookups = self.hits + self.disk_hits + self.misses
+        return {
+            'fingerprint': self.fingerprint,
+            'entries': len(self._entries),
+            'max_entries': self.max_entries,
+            'disk_dir': self.disk_dir,
+            'hits': self.hits,
+            'disk_hits': self.disk_hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+        }
@@ -0,0 +1,167 @@
+"""
+Latent carry snapshots for TRM inference
+Keeps each solved test input's z_H/z_L and halting state so a later request for more steps resumes instead of recomputing
+"""
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Any, Optional
+
+import torch
+
+
+@dataclass
+class CarrySnapshot:
+    """Recursion state of one test input after `steps` steps"""
+    z_H: torch.Tensor       # [tokens, hidden]
+    z_L: torch.Tensor       # [tokens, hidden]
+    steps: int              # Recursion steps already run
+    halted: bool            # The model halted; further steps would not be run
+    preds: torch.Tensor     # [seq_len] argmax prediction after `steps`
+    q_halt: float           # Halt logit after `steps`
+    history: Optional[torch.Tensor] = None    # [steps, seq_len] uint8 argmax after every step
+    q_history: Optional[torch.Tensor] = None  # [steps] halt logit after every step
+
+    def prefix(self, steps: int) -> Optional["CarrySnapshot"]:
+        """
+        Result after an earlier step, from the history (None when not recorded)
+
+        The returned snapshot has no latent state, so it can answer a request
+        but not be resumed.
+        """
+        if self.history is None or not 0 < steps <= len(self.history):
+            return None
+        return CarrySnapshot(z_H=None, z_L=None, steps=steps, halted=False,
+                             preds=self.history[steps - 1].long(), q_halt=float(self.q_history[steps - 1]))
+
+
+class CarryStore:
+    """
+    Bounded LRU store of carry snapshots, keyed by model, sequence length and input row
+
+    Snapshots evicted from memory are spilled to `disk_dir` (when set) with
+    the latent state in fp16, halving their size; resuming from a spilled
+    snapshot is therefore close to, but not bit-identical with, an
+    uninterrupted run.
+    """
+
+    def __init__(self, max_entries: int = 64, disk_dir: Optional[str] = None):
+        """
+        Args:
+            max_entries: Snapshots held in memory (each is two [tokens, hidden] tensors)
+            disk_dir: Directory for spilled snapshots (None drops them on eviction)
+        """
+        self.max_entries = max_entries
+        self.disk_dir = disk_dir
+        self._entries: "OrderedDict[str, CarrySnapshot]" = OrderedDict()
+        # Inference threads share the store
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.spilled = 0
+
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    @classmethod
+    def from_env(cls) -> Optional["CarryStore"]:
+        """Read TRM_CARRY_STORE_SIZE and TRM_CARRY_STORE_DIR (None when both are unset)"""
+        max_entries = int(os.environ.get("TRM_CARRY_STORE_SIZE", 0))
+        disk_dir = os.environ.get("TRM_CARRY_STORE_DIR") or None
+        if max_entries <= 0 and disk_dir is None:
+            return None
+        return cls(max_entries=max_entries, disk_dir=disk_dir)
+
+    @staticmethod
+    def key(namespace: str, inputs: torch.Tensor, puzzle: str, seq_len: int) -> str:
+        """Key of one padded input row with puzzle `puzzle`, run at `seq_len` by the model identified by `namespace`"""
+        digest = hashlib.sha256(f"{namespace}:{seq_len}:{puzzle}:".encode())
+        digest.update(inputs.to(torch.int32).cpu().numpy().tobytes())
+        return digest.hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, key[:2], f"{key}.pt")
+
+    def get(self, key: str) -> Optional[CarrySnapshot]:
+        """Look up a snapshot, promoting spilled ones back into memory"""
+        with self._lock:
+            return self._get(key)
+
+    def _get(self, key: str) -> Optional[CarrySnapshot]:
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return self._entries[key]
+
+        if self.disk_dir:
+            path = self._path(key)
+            if os.path.exists(path):
+                try:
+                    snapshot = CarrySnapshot(**torch.load(path, map_location='cpu'))
+                    snapshot.preds = snapshot.preds.long()
+                except Exception:
+                    snapshot = None
+                if snapshot is not None:
+                    self.disk_hits += 1
+                    if self.max_entries > 0:
+                        self._remember(key, snapshot)
+                    return snapshot
+
+        self.misses += 1
+        return None
+
+    def put(self, key: str, snapshot: CarrySnapshot):
+        """Store a snapshot, replacing any older one for the same key"""
+        with self._lock:
+            if self.max_entries > 0:
+                self._remember(key, snapshot)
+            else:
+                self._spill(key, snapshot)
+
+    def _remember(self, key: str, snapshot: CarrySnapshot):
+        self._entries[key] = snapshot
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._spill(*self._entries.popitem(last=False))
+
+    def _spill(self, key: str, snapshot: CarrySnapshot):
+        if not self.disk_dir:
+            return
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        torch.save({
+            'z_H': snapshot.z_H.half(),
+            'z_L': snapshot.z_L.half(),
+            'steps': snapshot.steps,
+            'halted': snapshot.halted,
+            'preds': snapshot.preds.to(torch.uint8),
+            'q_halt': snapshot.q_halt,
+            'history': snapshot.history,
+            'q_history': snapshot.q_history,
+        }, tmp_path)
+        os.replace(tmp_path, path)
+        self.spilled += 1
+
+    def clear(self):
+        """Drop all in-memory snapshots (spilled ones stay on disk)"""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Size, configuration and hit/miss counters"""
+        lookups = self.hits + self.disk_hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'max_entries': self.max_entries,
+            'disk_dir': self.disk_dir,
+            'hits': self.hits,
+            'disk_hits': self.disk_hits,
+            'misses': self.misses,
+            'spilled': self.spilled,
+            'hit_rate': (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+        }
@@ -0,0 +1,172 @@
+"""
+Grid encoding helpers for TRM inference
+Vectorized grid decoding/cropping, fast JSON and compact binary responses, 4-bit cell packing, and delta encoding of step-by-step predictions
+"""
+import itertools
+import json
+import struct
+from typing import Dict, List, Tuple, Any, Optional
+
+import numpy as np
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Media type of `pack_predictions` responses
+BINARY_MEDIA_TYPE = 'application/x-trm-grids'
+
+_BINARY_MAGIC = b'TRMG'
+_BINARY_VERSION = 2
+
+
+def flatten_grid(grid: List[List[int]]) -> np.ndarray:
+    """Row-major int32 cells of a grid, without building an intermediate Python list"""
+    return np.fromiter(itertools.chain.from_iterable(grid), dtype=np.int32)
+
+
+def encode_grids(grids: List[List[List[int]]], seq_len: int, out: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Flatten grids into one zero-padded [len(grids), seq_len] int32 batch
+    
+    Cells are written straight into `out` (allocated if not given; must be
+    zeroed beyond each grid). Grids larger than `seq_len` are truncated.
+    """
+    if out is None:
+        out = np.zeros((len(grids), seq_len), dtype=np.int32)
+    for row, grid in enumerate(grids):
+        cells = flatten_grid(grid)[:seq_len]
+        out[row, :len(cells)] = cells
+    return out
+
+
+def decode_grids(preds: np.ndarray, shapes: List[Tuple[int, int]], as_arrays: bool = False) -> List[Any]:
+    """
+    Crop each row of flat predictions [N, seq_len] to its (height, width) grid, one reshape per row
+    
+    With `as_arrays`, grids are uint8 [height, width] views instead of
+    nested lists, which skips the per-cell Python objects entirely.
+    """
+    if as_arrays:
+        preds = preds.astype(np.uint8)
+        return [preds[row, :height * width].reshape(height, width) for row, (height, width) in enumerate(shapes)]
+    return [preds[row, :height * width].reshape(height, width).tolist()
+            for row, (height, width) in enumerate(shapes)]
+
+
+def dumps(value: Any) -> bytes:
+    """JSON-encode a response payload (orjson when installed, numpy arrays allowed)"""
+    if orjson is not None:
+        return orjson.dumps(value, option=orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(value, separators=(',', ':'),
+                      default=lambda o: o.tolist() if isinstance(o, np.ndarray) else o.item()).encode()
+
+
+def _pack_grid(parts: List[bytes], grid):
+    if isinstance(grid, np.ndarray):
+        parts.append(struct.pack('<BB', *grid.shape))
+        parts.append(grid.astype(np.uint8, copy=False).tobytes())
+    else:
+        parts.append(struct.pack('<BB', len(grid), len(grid[0])))
+        parts.append(bytes(itertools.chain.from_iterable(grid)))
+
+
+def pack_predictions(predictions: List[Dict[str, Any]]) -> bytes:
+    """
+    Compact binary encoding of solve predictions (one byte per cell)
+    
+    Grids may be nested lists or numpy arrays.
+    Layout (little-endian): b'TRMG', version u8, count u16, then per
+    prediction: steps u16, iteration count u16, attempt count u8, the final
+    grid, then (TTA and ensemble votes only) agreement f64 and each attempt
+    grid, and each iteration as step u16 plus grid. A grid is height u8,
+    width u8 and height * width row-major cell bytes.
+    """
+    parts = [_BINARY_MAGIC, struct.pack('<BH', _BINARY_VERSION, len(predictions))]
+    for prediction in predictions:
+        iterations = prediction.get('iterations') or []
+        attempts = prediction.get('attempts') or []
+        parts.append(struct.pack('<HHB', prediction['steps'], len(iterations), len(attempts)))
+        _pack_grid(parts, prediction['prediction'])
+        if attempts:
+            parts.append(struct.pack('<d', prediction['agreement']))
+            for attempt in attempts:
+                _pack_grid(parts, attempt)
+        for iteration in iterations:
+            parts.append(struct.pack('<H', iteration['step']))
+            _pack_grid(parts, iteration['prediction'])
+    return b''.join(parts)
+
+
+def unpack_predictions(data: bytes) -> List[Dict[str, Any]]:
+    """Decode `pack_predictions` output back into prediction dicts"""
+    if data[:4] != _BINARY_MAGIC:
+        raise ValueError("Not a TRM grid payload")
+    version, count = struct.unpack_from('<BH', data, 4)
+    if version != _BINARY_VERSION:
+        raise ValueError(f"Unsupported TRM grid payload version {version}")
+    offset = 7
+    
+    def grid():
+        nonlocal offset
+        height, width = struct.unpack_from('<BB', data, offset)
+        offset += 2
+        cells = np.frombuffer(data, dtype=np.uint8, count=height * width, offset=offset)
+        offset += height * width
+        return cells.reshape(height, width).tolist()
+    
+    predictions = []
+    for _ in range(count):
+        steps, num_iterations, num_attempts = struct.unpack_from('<HHB', data, offset)
+        offset += 5
+        prediction = {'prediction': grid(), 'steps': steps}
+        if num_attempts:
+            prediction['agreement'], = struct.unpack_from('<d', data, offset)
+            offset += 8
+            prediction['attempts'] = [grid() for _ in range(num_attempts)]
+        if num_iterations:
+            iterations = []
+            for _ in range(num_iterations):
+                step, = struct.unpack_from('<H', data, offset)
+                offset += 2
+                iterations.append({'step': step, 'prediction': grid()})
+            prediction['iterations'] = iterations
+        predictions.append(prediction)
+    return predictions
+
+
+def pack_cells(cells: np.ndarray) -> bytes:
+    """
+    Two cells per byte (high nibble first), padded with a zero nibble to a whole byte
+    
+    Cells must be 0-15, which covers the ten ARC colors.
+    """
+    cells = np.asarray(cells, dtype=np.uint8).ravel()
+    if cells.size and cells.max() > 15:
+        raise ValueError("Cell values must fit in 4 bits")
+    if cells.size % 2:
+        cells = np.append(cells, np.uint8(0))
+    return ((cells[0::2] << 4) | cells[1::2]).tobytes()
+
+
+def unpack_cells(data, count: int, offset: int = 0) -> np.ndarray:
+    """First `count` cells of `pack_cells` output starting at byte `offset` of `data`, as uint8"""
+    packed = np.frombuffer(data, dtype=np.uint8, count=(count + 1) // 2, offset=offset)
+    cells = np.empty(2 * len(packed), dtype=np.uint8)
+    cells[0::2] = packed >> 4
+    cells[1::2] = packed & 0x0F
+    return cells[:count]
+
+
+def grid_delta(previous: np.ndarray, current: np.ndarray) -> List[List[int]]:
+    """
+    Cells that changed between two predictions of the same grid
+    
+    Returns:
+        [[row, col, value], ...] for every cell where `current` differs from `previous`
+    """
+    changed = np.flatnonzero(previous != current)
+    width = current.shape[1]
+    return np.stack([changed // width, changed % width, current.ravel()[changed]], axis=1).tolist()
+
@@ -0,0 +1,178 @@
+"""
+Compiled execution backends for the TRM recursion step
+Wraps one ACT step in a flat-tensor function that torch.compile, TorchScript or ONNX Runtime can run
+"""
+import os
+import tempfile
+import time
+from typing import Dict, List, Tuple, Any
+
+import torch
+from torch import nn
+
+BACKENDS = ('eager', 'compile', 'script', 'onnx')
+
+# Flat names of the step function's inputs and outputs (carry first, then batch)
+STEP_INPUTS = ('z_H', 'z_L', 'steps', 'halted', 'current_inputs', 'current_puzzle_identifiers',
+               'inputs', 'puzzle_identifiers')
+STEP_OUTPUTS = ('z_H', 'z_L', 'steps', 'halted', 'current_inputs', 'current_puzzle_identifiers',
+                'logits', 'q_halt_logits', 'q_continue_logits')
+
+
+def _flatten_carry(carry) -> Tuple[torch.Tensor, ...]:
+    return (carry.inner_carry.z_H, carry.inner_carry.z_L, carry.steps, carry.halted,
+            carry.current_data['inputs'], carry.current_data['puzzle_identifiers'])
+
+
+def _make_carry(template, z_H, z_L, steps, halted, current_inputs, current_puzzle_identifiers):
+    """Carry of the same dataclass types as `template` holding the given tensors"""
+    return type(template)(
+        inner_carry=type(template.inner_carry)(z_H=z_H, z_L=z_L),
+        steps=steps,
+        halted=halted,
+        current_data={'inputs': current_inputs, 'puzzle_identifiers': current_puzzle_identifiers}
+    )
+
+
+class StepFunction(nn.Module):
+    """One ACT step of a TinyRecursiveReasoningModel_ACTV1 with the carry passed as plain tensors"""
+
+    def __init__(self, model: nn.Module, template):
+        """
+        Args:
+            model: The ACT model
+            template: Any carry of the model, used for its dataclass types
+        """
+        super().__init__()
+        self.model = model
+        self.template = template
+
+    def forward(self, z_H, z_L, steps, halted, current_inputs, current_puzzle_identifiers,
+                inputs, puzzle_identifiers):
+        carry = _make_carry(self.template, z_H, z_L, steps, halted, current_inputs, current_puzzle_identifiers)
+        carry, outputs = self.model(carry, {'inputs': inputs, 'puzzle_identifiers': puzzle_identifiers})
+        return (*_flatten_carry(carry), outputs['logits'], outputs['q_halt_logits'], outputs['q_continue_logits'])
+
+
+class CompiledStep:
+    """
+    Drop-in replacement for `model(carry, batch)` running a compiled step
+
+    Also exposes `initial_carry` so the recursion loop can use it wherever it
+    would use the model itself.
+    """
+
+    def __init__(self, model: nn.Module, backend: str, example_batch: Dict[str, torch.Tensor]):
+        """
+        Args:
+            model: TinyRecursiveReasoningModel_ACTV1 in eval mode
+            backend: 'compile', 'script' or 'onnx'
+            example_batch: Batch used for tracing/export (any batch size)
+        """
+        self.model = model
+        self.backend = backend
+        self.template = model.initial_carry(example_batch)
+        self.step = StepFunction(model, self.template).eval()
+        example = self._flatten(self.template, example_batch)
+
+        if backend == 'compile':
+            self._run = torch.compile(self.step, backend='inductor', dynamic=True)
+        elif backend == 'script':
+            with torch.no_grad():
+                # Not frozen: freezing folds the example batch size into reshapes
+                self._run = torch.jit.trace(self.step, example, check_trace=False)
+        elif backend == 'onnx':
+            self._run = self._export_onnx(example)
+        else:
+            raise ValueError(f"Unknown backend: {backend} (expected one of {', '.join(BACKENDS)})")
+
+    @staticmethod
+    def _flatten(carry, batch: Dict[str, torch.Tensor]) -> Tuple[torch.Tensor, ...]:
+        return (*_flatten_carry(carry), batch['inputs'], batch['puzzle_identifiers'])
+
+    def _export_onnx(self, example: Tuple[torch.Tensor, ...]):
+        try:
+            import onnxruntime
+        except ImportError:
+            raise ImportError("The 'onnx' backend requires the 'onnxruntime' package")
+
+        path = os.path.join(tempfile.mkdtemp(prefix='trm-onnx-'), 'step.onnx')
+        with torch.no_grad():
+            torch.onnx.export(
+                self.step, example, path,
+                input_names=list(STEP_INPUTS), output_names=list(STEP_OUTPUTS),
+                dynamic_axes={name: {0: 'batch'} for name in STEP_INPUTS + STEP_OUTPUTS}
+            )
+        session = onnxruntime.InferenceSession(path, providers=['CPUExecutionProvider'])
+
+        def run(*tensors):
+            feeds = {name: tensor.cpu().numpy() for name, tensor in zip(STEP_INPUTS, tensors)}
+            return tuple(torch.from_numpy(array) for array in session.run(list(STEP_OUTPUTS), feeds))
+        return run
+
+    def initial_carry(self, batch: Dict[str, torch.Tensor]):
+        return self.model.initial_carry(batch)
+
+    def __call__(self, carry, batch: Dict[str, torch.Tensor]):
+        out = self._run(*self._flatten(carry, batch))
+        carry = _make_carry(self.template, *out[:6])
+        return carry, {'logits': out[6], 'q_halt_logits': out[7], 'q_continue_logits': out[8]}
+
+
+def backend_from_env() -> str:
+    """Read TRM_BACKEND (default: eager)"""
+    backend = os.environ.get("TRM_BACKEND", "eager").lower()
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown TRM_BACKEND: {backend} (expected one of {', '.join(BACKENDS)})")
+    return backend
+
+
+def check_parity(model, tasks: List[Dict[str, Any]], max_steps: int = 4,
+                 atol: float = 1e-3) -> Dict[str, Any]:
+    """
+    Compare a compiled backend against eager execution
+
+    Runs every test input of `tasks` through both paths and compares final
+    predictions and the logits of the first step.
+
+    Args:
+        model: TRMInference with a non-eager backend
+        tasks: ARC-AGI task dicts, e.g. from the evaluation set
+        max_steps: Recursion steps per task
+        atol: Largest acceptable absolute difference of first-step logits
+
+    Returns:
+        Dict with 'ok', 'max_logit_diff', 'predictions_match' (fraction of
+        test inputs with identical predictions) and per-path 'seconds'
+    """
+    # One step on the first task's inputs, straight from both step functions (also warms up the backend)
+    inputs = model.pad_inputs([t['input'] for t in tasks[0]['test']]).to(model.device)
+    batch = {'inputs': inputs, 'puzzle_identifiers': torch.zeros(len(inputs), 1, dtype=torch.int32, device=model.device)}
+    with torch.no_grad():
+        _, eager_out = model.model(model.model.initial_carry(batch), batch)
+        step = model.step_for(model.model)
+        _, backend_out = step(step.initial_carry(batch), batch)
+    diff = float((eager_out['logits'] - backend_out['logits']).abs().max())
+
+    backend = model.backend
+    timings, results = {}, {}
+    try:
+        for name in ('eager', backend):
+            model.backend = name
+            start = time.perf_counter()
+            results[name] = model.solve_batch(tasks, max_steps=max_steps)
+            timings[name] = time.perf_counter() - start
+    finally:
+        model.backend = backend
+
+    eager_preds = [p['prediction'] for r in results['eager'] for p in r['predictions']]
+    backend_preds = [p['prediction'] for r in results[backend] for p in r['predictions']]
+    matches = sum(a == b for a, b in zip(eager_preds, backend_preds)) / max(1, len(eager_preds))
+
+    return {
+        'backend': backend,
+        'ok': diff <= atol and matches == 1.0,
+        'max_logit_diff': diff,
+        'predictions_match': matches,
+        'seconds': timings,
+    }
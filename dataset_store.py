@@ -0,0 +1,302 @@
+"""
+Indexed, memory-mapped store for ARC-AGI challenge files
+Converts a challenges JSON once into uint8 grid data plus a task index for O(1), zero-copy lookups
+"""
+import fcntl
+import hashlib
+import json
+import mmap
+import os
+import shutil
+import tempfile
+import time
+from typing import Dict, List, Any, Optional
+
+import numpy as np
+
+STORE_VERSION = 2
+
+# Files of one build of the store
+_STORE_FILES = ('grids.bin', 'offsets.npy', 'shapes.npy', 'tasks.npy', 'index.json')
+
+
+def _file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _writable(path: str) -> bool:
+    """Whether `path` can be created or written (checked at its nearest existing ancestor)"""
+    while not os.path.exists(path):
+        parent = os.path.dirname(path)
+        if parent == path:
+            return False
+        path = parent
+    return os.access(path, os.W_OK)
+
+
+def user_cache_dir() -> str:
+    """Per-user cache directory for dataset stores ($XDG_CACHE_HOME/trm/datasets)"""
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'trm', 'datasets')
+
+
+class ARCDatasetStore:
+    """
+    Binary store for an ARC-AGI challenges (or combined challenges + solutions) file
+
+    Each build of the store is a subdirectory of the store directory, named
+    by the CURRENT file:
+        grids.bin    all grid cells as uint8, row-major, back to back
+        offsets.npy  int64 [num_grids + 1] start of each grid in grids.bin
+        shapes.npy   uint8 [num_grids, 2] height and width of each grid
+        tasks.npy    int64 [num_tasks, 4] first grid, num train pairs, num test inputs,
+                     whether test inputs carry an output grid
+        index.json   task ids in file order plus the source file's mtime/size/hash
+
+    A rebuild writes a new subdirectory and then atomically replaces
+    CURRENT, so readers always see a complete build: the old one until the
+    swap, the new one after. The previous build is kept so that a reader
+    that has just read CURRENT can still open it; older ones are removed.
+
+    Each task's grids are stored as train input/output pairs followed by its
+    test inputs (each followed by its output when present).
+    """
+
+    def __init__(self, source_path: str, store_dir: Optional[str] = None, verify_hash: bool = False):
+        """
+        Args:
+            source_path: Path to the ARC-AGI challenges JSON
+            store_dir: Where to keep the converted store (default: `<source>.store`,
+                or a subdirectory of TRM_DATASET_CACHE_DIR when set; falls back to
+                `user_cache_dir()` when the dataset's directory is read-only)
+            verify_hash: Also compare the source file's sha256 when checking staleness
+        """
+        self.source_path = os.path.abspath(source_path)
+        if store_dir is None:
+            cache_dir = os.environ.get("TRM_DATASET_CACHE_DIR")
+            name = os.path.basename(self.source_path) + '.store'
+            store_dir = os.path.join(cache_dir, name) if cache_dir else self.source_path + '.store'
+            if not cache_dir and not _writable(store_dir):
+                # Named after the source's full path, so same-named files in other directories do not collide
+                path_hash = hashlib.sha256(self.source_path.encode()).hexdigest()[:12]
+                store_dir = os.path.join(user_cache_dir(), f"{path_hash}-{name}")
+        self.store_dir = store_dir
+        self.verify_hash = verify_hash
+        self.refresh()
+
+    def _current(self) -> Optional[str]:
+        """Directory of the build named by CURRENT (None if there is none)"""
+        try:
+            with open(os.path.join(self.store_dir, 'CURRENT'), 'r') as f:
+                name = f.read().strip()
+        except OSError:
+            return None
+        return os.path.join(self.store_dir, name) if name else None
+
+    def _source_stat(self) -> Dict[str, Any]:
+        stat = os.stat(self.source_path)
+        return {'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size}
+
+    def is_stale(self) -> bool:
+        """True if the store is missing, from another version, or older than the source file"""
+        build_dir = self._current()
+        if build_dir is None:
+            return True
+        try:
+            with open(os.path.join(build_dir, 'index.json'), 'r') as f:
+                meta = json.load(f)['source']
+        except (OSError, ValueError, KeyError):
+            return True
+        if meta.get('version') != STORE_VERSION:
+            return True
+        stat = self._source_stat()
+        if meta['size'] != stat['size']:
+            return True
+        if meta['mtime_ns'] != stat['mtime_ns'] or self.verify_hash:
+            if meta['sha256'] != _file_sha256(self.source_path):
+                return True
+            if meta['mtime_ns'] != stat['mtime_ns']:
+                # Touched but unchanged: keep the store and remember the new mtime
+                self._update_index(build_dir, source=dict(meta, **stat))
+        return False
+
+    @staticmethod
+    def _update_index(build_dir: str, **fields):
+        index_path = os.path.join(build_dir, 'index.json')
+        with open(index_path, 'r') as f:
+            index = json.load(f)
+        index.update(fields)
+        tmp_path = f"{index_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(index, f)
+        os.replace(tmp_path, index_path)
+
+    def refresh(self):
+        """Rebuild the store if the source changed, then (re)open it"""
+        if self.is_stale():
+            os.makedirs(self.store_dir, exist_ok=True)
+            # One process builds at a time; the others wait and then use its build
+            with open(os.path.join(self.store_dir, '.lock'), 'w') as lock:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+                if self.is_stale():
+                    self.build()
+        self._open()
+
+    def build(self):
+        """Convert the source JSON into a new build and atomically make it the current one"""
+        with open(self.source_path, 'r') as f:
+            data = json.load(f)
+
+        cells: List[np.ndarray] = []
+        shapes: List[tuple] = []
+        tasks: List[tuple] = []
+
+        def add(grid):
+            array = np.asarray(grid, dtype=np.uint8)
+            cells.append(array.ravel())
+            shapes.append(array.shape)
+
+        for task in data.values():
+            tests = task['test']
+            has_outputs = bool(tests) and all('output' in inp for inp in tests)
+            tasks.append((len(shapes), len(task['train']), len(tests), int(has_outputs)))
+            for example in task['train']:
+                add(example['input'])
+                add(example['output'])
+            for inp in tests:
+                add(inp['input'])
+                if has_outputs:
+                    add(inp['output'])
+
+        sizes = np.array([len(c) for c in cells], dtype=np.int64)
+        offsets = np.zeros(len(cells) + 1, dtype=np.int64)
+        np.cumsum(sizes, out=offsets[1:])
+
+        os.makedirs(self.store_dir, exist_ok=True)
+        tmp_dir = tempfile.mkdtemp(dir=self.store_dir, prefix='.build-')
+        try:
+            with open(os.path.join(tmp_dir, 'grids.bin'), 'wb') as f:
+                for c in cells:
+                    f.write(c.tobytes())
+            np.save(os.path.join(tmp_dir, 'offsets.npy'), offsets)
+            np.save(os.path.join(tmp_dir, 'shapes.npy'), np.array(shapes, dtype=np.uint8).reshape(-1, 2))
+            np.save(os.path.join(tmp_dir, 'tasks.npy'), np.array(tasks, dtype=np.int64).reshape(-1, 4))
+            with open(os.path.join(tmp_dir, 'index.json'), 'w') as f:
+                json.dump({
+                    'source': {
+                        'version': STORE_VERSION,
+                        'path': self.source_path,
+                        'sha256': _file_sha256(self.source_path),
+                        **self._source_stat()
+                    },
+                    'task_ids': list(data.keys())
+                }, f)
+
+            name = f"build-{time.time_ns()}-{os.getpid()}"
+            os.rename(tmp_dir, os.path.join(self.store_dir, name))
+        except BaseException:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+
+        previous = self._current()
+        pointer = os.path.join(self.store_dir, 'CURRENT')
+        tmp_pointer = f"{pointer}.{os.getpid()}.tmp"
+        with open(tmp_pointer, 'w') as f:
+            f.write(name)
+        os.replace(tmp_pointer, pointer)
+        self._prune(keep={name, os.path.basename(previous) if previous else None})
+
+    def _prune(self, keep: set):
+        """
+        Remove builds other than `keep`, and files of the single-directory layout of version 1
+
+        Runs under the build lock, so any unfinished build left is from a crashed builder.
+        """
+        for entry in os.listdir(self.store_dir):
+            path = os.path.join(self.store_dir, entry)
+            if (entry.startswith('build-') and entry not in keep) or entry.startswith('.build-'):
+                shutil.rmtree(path, ignore_errors=True)
+            elif entry in _STORE_FILES:
+                os.remove(path)
+
+    def _open(self):
+        build_dir = self._current()
+        with open(os.path.join(build_dir, 'index.json'), 'r') as f:
+            index = json.load(f)
+        self.task_ids: List[str] = index['task_ids']
+        self._rows = {task_id: row for row, task_id in enumerate(self.task_ids)}
+        self._stat = {k: index['source'][k] for k in ('mtime_ns', 'size')}
+
+        # Grid cells stay memory-mapped; plain ndarray views avoid np.memmap slicing overhead
+        grids_path = os.path.join(build_dir, 'grids.bin')
+        if os.path.getsize(grids_path) > 0:
+            with open(grids_path, 'rb') as f:
+                self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self._cells = np.frombuffer(self._mmap, dtype=np.uint8)
+        else:
+            self._cells = np.zeros(0, dtype=np.uint8)
+
+        # The tables are small; Python lists make each lookup a couple of list indexings
+        self._offsets = np.load(os.path.join(build_dir, 'offsets.npy')).tolist()
+        self._shapes = np.load(os.path.join(build_dir, 'shapes.npy')).tolist()
+        self._tasks = np.load(os.path.join(build_dir, 'tasks.npy')).tolist()
+
+    def source_changed(self) -> bool:
+        """Cheap check (one stat call) whether the source differs from what was opened"""
+        return self._source_stat() != self._stat
+
+    def __len__(self) -> int:
+        return len(self.task_ids)
+
+    def __contains__(self, task_id: str) -> bool:
+        return task_id in self._rows
+
+    def grid(self, index: int) -> np.ndarray:
+        """Read-only [height, width] uint8 view of a stored grid"""
+        start = self._offsets[index]
+        height, width = self._shapes[index]
+        return self._cells[start:start + height * width].reshape(height, width)
+
+    def get_arrays(self, task_id: str) -> Dict[str, Any]:
+        """Task with grids as zero-copy numpy views into the memory-mapped store"""
+        first, num_train, num_test, has_outputs = self._tasks[self._rows[task_id]]
+        train = [
+            {'input': self.grid(first + 2 * i), 'output': self.grid(first + 2 * i + 1)}
+            for i in range(num_train)
+        ]
+
+        test, index = [], first + 2 * num_train
+        for _ in range(num_test):
+            entry = {'input': self.grid(index)}
+            index += 1
+            if has_outputs:
+                entry['output'] = self.grid(index)
+                index += 1
+            test.append(entry)
+        return {'train': train, 'test': test}
+
+    def get_task(self, task_id: str) -> Dict[str, Any]:
+        """Task with grids as nested lists, in the same format as the source JSON"""
+        arrays = self.get_arrays(task_id)
+        return {
+            split: [{k: v.tolist() for k, v in entry.items()} for entry in entries]
+            for split, entries in arrays.items()
+        }
+
+
+_stores: Dict[str, ARCDatasetStore] = {}
+
+
+def get_store(source_path: str) -> ARCDatasetStore:
+    """Shared store for a source file, rebuilt automatically when the file changes"""
+    key = os.path.abspath(source_path)
+    store = _stores.get(key)
+    if store is None:
+        store = _stores[key] = ARCDatasetStore(key)
+    elif store.source_changed():
+        store.refresh()
+    return store
@@ -0,0 +1,336 @@
+"""
+Checkpoint ensembles for TRM inference
+Runs several checkpoints in one process on a shared, once-padded batch and votes on their predictions
+"""
+import contextlib
+import hashlib
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field, asdict
+from typing import Dict, List, Tuple, Any, Optional
+
+import numpy as np
+import torch
+from torch.func import functional_call, stack_module_state, vmap
+
+from inference import (TRMInference, RowBlock, PackedGroup, EarlyExitPolicy,
+                       TinyRecursiveReasoningModel_ACTV1InnerCarry)
+from instrumentation import profiler
+from precision import autocast
+from tta import vote
+
+
+@dataclass
+class EnsembleConfig:
+    """Checkpoints voting with the primary one, and how they run"""
+    checkpoints: List[str] = field(default_factory=list)  # Extra checkpoints (the primary model votes too)
+    weights: Optional[List[float]] = None  # Vote weight per member, primary first (default: equal)
+    vote: str = 'majority'                 # 'majority' or 'confidence' (weighted by halt confidence)
+    mode: str = 'threads'                  # 'threads' (one thread per member) or 'stacked' (vmap over stacked weights)
+
+    @classmethod
+    def from_env(cls) -> "EnsembleConfig":
+        """Read TRM_ENSEMBLE_CHECKPOINTS, TRM_ENSEMBLE_WEIGHTS, TRM_ENSEMBLE_VOTE and TRM_ENSEMBLE_MODE"""
+        checkpoints = os.environ.get("TRM_ENSEMBLE_CHECKPOINTS", "")
+        weights = os.environ.get("TRM_ENSEMBLE_WEIGHTS")
+        return cls(
+            checkpoints=[path for path in checkpoints.split(',') if path],
+            weights=[float(w) for w in weights.split(',')] if weights else None,
+            vote=os.environ.get("TRM_ENSEMBLE_VOTE", cls.vote),
+            mode=os.environ.get("TRM_ENSEMBLE_MODE", cls.mode),
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.checkpoints)
+
+
+class StackedMembers:
+    """
+    Members' inner models stacked parameter-wise, stepping all of them at once with `torch.func.vmap`
+
+    The stacked weights are copies, built once per sequence length. Every row
+    runs exactly min(max_steps, halt_max_steps) steps (rows only halt at
+    `halt_max_steps` in eval mode), without carry store or early exit.
+    """
+
+    def __init__(self, members: List[TRMInference]):
+        self.members = members
+        self._stacks: Dict[int, Tuple[Dict[str, torch.Tensor], Dict[str, torch.Tensor], Any]] = {}
+
+    def _stack(self, seq_len: int):
+        if seq_len not in self._stacks:
+            inners = [member.model_for(seq_len).inner for member in self.members]
+            params, buffers = stack_module_state(inners)
+            # Built fresh rather than deep-copied, which would also copy hooks (e.g. the profiler's)
+            with torch.device('meta'):
+                skeleton = type(inners[0])(inners[0].config).eval()
+            self._stacks[seq_len] = (params, buffers, skeleton)
+        return self._stacks[seq_len]
+
+    def run(self, group: PackedGroup, max_steps: int) -> List[Tuple[torch.Tensor, torch.Tensor, torch.Tensor]]:
+        """
+        Run one packed group through every member
+
+        Returns:
+            Per member: (argmax preds [n, seq_len], q_halt_logits [n], steps used [n]), on CPU
+        """
+        primary = self.members[0]
+        params, buffers, skeleton = self._stack(group.seq_len)
+
+        def step(params, buffers, z_H, z_L, inputs, puzzle_ids):
+            carry, logits, (q_halt, _) = functional_call(
+                skeleton, (params, buffers),
+                (TinyRecursiveReasoningModel_ACTV1InnerCarry(z_H=z_H, z_L=z_L),
+                 {'inputs': inputs, 'puzzle_identifiers': puzzle_ids})
+            )
+            return carry.z_H, carry.z_L, logits, q_halt
+
+        stepped = vmap(step, in_dims=(0, 0, 0, 0, None, None))
+        inputs = group.inputs.to(primary.device)
+        puzzle_ids = group.puzzle_ids[:, None].to(primary.device)
+        shape = (len(self.members), len(inputs), group.seq_len + skeleton.puzzle_emb_len, skeleton.config.hidden_size)
+        z_H = buffers['H_init'][:, None, None, :].expand(shape).contiguous()
+        z_L = buffers['L_init'][:, None, None, :].expand(shape).contiguous()
+
+        num_steps = min(max_steps, primary.config.halt_max_steps)
+        with torch.no_grad(), autocast(primary.precision, primary.device):
+            for _ in range(num_steps):
+                z_H, z_L, logits, q_halt = stepped(params, buffers, z_H, z_L, inputs, puzzle_ids)
+        preds = logits.argmax(dim=-1).cpu()
+        q_halt = q_halt.float().cpu()
+        steps = torch.full((len(inputs),), num_steps, dtype=torch.int32)
+        return [(preds[k], q_halt[k], steps) for k in range(len(self.members))]
+
+
+class TRMEnsemble:
+    """
+    Several checkpoints answering as one solver, with `solve`/`solve_batch` like TRMInference
+
+    Test grids are flattened and padded once and the packed batch is shared
+    by every member. Members share the primary model's buffer pool and carry
+    store (carry keys include each member's fingerprint). Each test input's
+    answer is the candidate grid with the most vote weight across members;
+    the top two candidates are returned as 'attempts'.
+    """
+
+    def __init__(self, primary: TRMInference, config: Optional[EnsembleConfig] = None):
+        """
+        Args:
+            primary: Loaded model; its checkpoint is the first member
+            config: Extra checkpoints and voting settings (defaults to environment settings)
+        """
+        self.config = config or EnsembleConfig.from_env()
+        if self.config.vote not in ('majority', 'confidence'):
+            raise ValueError(f"Unknown vote method: {self.config.vote}")
+        if self.config.mode not in ('threads', 'stacked'):
+            raise ValueError(f"Unknown ensemble mode: {self.config.mode}")
+
+        self.members = [primary]
+        for checkpoint_path in self.config.checkpoints:
+            member = TRMInference(checkpoint_path=checkpoint_path, device=primary.device,
+                                  backend=primary.backend, precision=primary.precision)
+            member.carry_store = primary.carry_store
+            self.members.append(member)
+
+        weights = self.config.weights or [1.0] * len(self.members)
+        if len(weights) != len(self.members):
+            raise ValueError(f"Got {len(weights)} ensemble weights for {len(self.members)} members")
+        self.weights = torch.tensor(weights)
+
+        if self.config.mode == 'stacked' and primary.precision == 'int8':
+            raise ValueError("Stacked ensembles need fp32 or bf16 weights (int8 blocks cannot be stacked)")
+        self.stacked = StackedMembers(self.members) if self.config.mode == 'stacked' else None
+        self._pool = ThreadPoolExecutor(max_workers=max(1, len(self.members) - 1),
+                                        thread_name_prefix='trm-ensemble')
+
+        self.solves = 0
+        self.stacked_runs = 0
+        self.threaded_runs = 0
+
+    @property
+    def primary(self) -> TRMInference:
+        return self.members[0]
+
+    @property
+    def fingerprint(self) -> str:
+        """Hash of the members' weights and the voting settings"""
+        digest = hashlib.sha256()
+        for member in self.members:
+            digest.update(member.fingerprint.encode())
+        digest.update(f"{self.config.vote}:{self.weights.tolist()}".encode())
+        return digest.hexdigest()[:16]
+
+    @property
+    def precision(self) -> str:
+        return self.primary.precision
+
+    @property
+    def backend(self) -> str:
+        return self.primary.backend
+
+    @property
+    def device(self) -> str:
+        return self.primary.device
+
+    @property
+    def carry_store(self):
+        # Stacked runs neither read nor write carries
+        return self.primary.carry_store if self.stacked is None else None
+
+    def solve(self, task: Dict[str, Any], max_steps: int = 16, **options) -> Dict[str, Any]:
+        """Solve one task (see `solve_batch`)"""
+        return self.solve_batch([task], max_steps=max_steps, **options)[0]
+
+    def solve_stream(self, task: Dict[str, Any], **options):
+        """Stream the primary checkpoint's steps (streams are not voted on)"""
+        return self.primary.solve_stream(task, **options)
+
+    def solve_batch(self, tasks: List[Dict[str, Any]], max_steps: int = 16,
+                    show_iterations: bool = False,
+                    early_exit: Optional[EarlyExitPolicy] = None,
+                    bucketed: bool = False,
+                    tta=None,
+                    array_grids: bool = False) -> List[Dict[str, Any]]:
+        """
+        Solve tasks with every member and vote on each test input
+
+        Args:
+            tasks: List of ARC-AGI task dicts
+            max_steps: Maximum recursive reasoning steps
+            show_iterations: If True, return the primary member's intermediate predictions
+            early_exit: Optional policy for stopping rows before max_steps
+            bucketed: If True, run each size bucket at its own sequence length
+            tta: Not supported; test-time augmentation runs on single models
+            array_grids: If True, return grids as uint8 numpy arrays
+
+        Returns:
+            One result dict per task. Each prediction has the voted 'prediction',
+            the top-2 'attempts', the 'agreement' (share of the vote for the
+            winner) and the max 'steps' used; each result has an 'ensemble' report
+        """
+        if tta is not None:
+            raise ValueError("Ensembles do not combine with test-time augmentation")
+        start = time.perf_counter()
+        self.solves += 1
+
+        blocks = []
+        for task in tasks:
+            for test_idx, test_input in enumerate(task['test']):
+                grid = test_input['input']
+                blocks.append(RowBlock(
+                    inputs=self.primary.preprocess_grid(grid).unsqueeze(0),
+                    puzzle_ids=torch.tensor([test_idx], dtype=torch.int32),
+                    shapes=[(len(grid), len(grid[0]))]
+                ))
+        packed = self.primary.pack_blocks(blocks, bucketed)
+
+        with contextlib.ExitStack() as stack:
+            member_ids = [stack.enter_context(member._conditioning(tasks, bucketed)) for member in self.members]
+            conditioned = any(pid is not None for ids in member_ids for pid in ids)
+            stackable = not (show_iterations or conditioned or (early_exit is not None and early_exit.enabled))
+            if self.stacked is not None and stackable:
+                member_runs = self._run_stacked(blocks, packed, max_steps)
+            else:
+                member_runs = self._run_threaded(tasks, blocks, packed, member_ids, max_steps,
+                                                 show_iterations, early_exit)
+
+        rows = []
+        for i, block in enumerate(blocks):
+            height, width = block.shapes[0]
+            preds = torch.stack([runs[i]['preds'][0] for runs in member_runs])
+            q_halt = torch.stack([runs[i]['q_halt_logits'][0] for runs in member_runs])
+            weights = self.weights * torch.sigmoid(q_halt) if self.config.vote == 'confidence' else self.weights
+            candidates, scores = vote(preds, weights)
+            grids = [candidate.view(height, width).numpy() for candidate in candidates[:2]]
+            grids = [grid.astype(np.uint8) if array_grids else grid.tolist() for grid in grids]
+            row = {
+                'prediction': grids[0],
+                'attempts': grids,
+                'agreement': float(scores[0] / scores.sum()),
+                'steps': max(int(runs[i]['steps'][0]) for runs in member_runs)
+            }
+            if show_iterations:
+                row['iterations'] = [
+                    {'step': it['step'], 'prediction': it['prediction'] if array_grids else it['prediction'].tolist()}
+                    for it in member_runs[0][i]['iterations'][0]
+                ]
+            rows.append(row)
+
+        report = {'members': len(self.members), 'mode': self.config.mode, 'vote': self.config.vote,
+                  'seconds': time.perf_counter() - start}
+        results, offset = [], 0
+        for task in tasks:
+            num_tests = len(task['test'])
+            results.append({'predictions': rows[offset:offset + num_tests], 'ensemble': report})
+            offset += num_tests
+        return results
+
+    def _run_stacked(self, blocks: List[RowBlock], packed: List[PackedGroup],
+                     max_steps: int) -> List[List[Dict[str, Any]]]:
+        """Per-member runs (as from `run_blocks`) of all members stepped together"""
+        self.stacked_runs += 1
+        member_runs = [[None] * len(blocks) for _ in self.members]
+        for group in packed:
+            for runs, (preds, q_halt, steps) in zip(member_runs, self.stacked.run(group, max_steps)):
+                TRMInference._split_group(blocks, group, runs, preds, q_halt, steps, [[] for _ in group.shapes])
+        return member_runs
+
+    def _run_threaded(self, tasks: List[Dict[str, Any]], blocks: List[RowBlock], packed: List[PackedGroup],
+                      member_ids: List[List[Optional[int]]], max_steps: int, show_iterations: bool,
+                      early_exit: Optional[EarlyExitPolicy]) -> List[List[Dict[str, Any]]]:
+        """Per-member runs, one member per thread, splitting this thread's intra-op threads between them"""
+        self.threaded_runs += 1
+        threads = torch.get_num_threads() // len(self.members)
+        if threads < 1:
+            # Too few cores to give each member its own; concurrent members would only contend
+            return [member.run_packed(blocks, self._with_puzzle_ids(tasks, blocks, packed, ids), max_steps,
+                                      show_iterations, early_exit)
+                    for member, ids in zip(self.members, member_ids)]
+
+        # Member threads follow the caller's profiler suspension (see `Profiler.suspend`)
+        suspended = profiler.suspended
+
+        def run(member, task_ids):
+            member_packed = self._with_puzzle_ids(tasks, blocks, packed, task_ids)
+            previous = torch.get_num_threads()
+            torch.set_num_threads(threads)
+            try:
+                with profiler.suspend() if suspended else contextlib.nullcontext():
+                    return member.run_packed(blocks, member_packed, max_steps, show_iterations, early_exit)
+            finally:
+                torch.set_num_threads(previous)
+
+        futures = [self._pool.submit(run, member, ids) for member, ids in zip(self.members[1:], member_ids[1:])]
+        primary_runs = run(self.primary, member_ids[0])
+        return [primary_runs] + [future.result() for future in futures]
+
+    @staticmethod
+    def _with_puzzle_ids(tasks: List[Dict[str, Any]], blocks: List[RowBlock], packed: List[PackedGroup],
+                         task_ids: List[Optional[int]]) -> List[PackedGroup]:
+        """The shared groups with a member's fitted-embedding puzzle ids, where it has them"""
+        if all(pid is None for pid in task_ids):
+            return packed
+        block_ids = [test_idx if task_id is None else task_id
+                     for task, task_id in zip(tasks, task_ids) for test_idx in range(len(task['test']))]
+        return [PackedGroup(group.seq_len, group.members, group.inputs,
+                            torch.tensor([block_ids[i] for i in group.members], dtype=torch.int32), group.shapes)
+                for group in packed]
+
+    def close(self):
+        """Stop the member threads"""
+        self._pool.shutdown(wait=False)
+
+    def stats(self) -> Dict[str, Any]:
+        """Members, configuration and run counters"""
+        return {
+            'config': asdict(self.config),
+            'members': [{'checkpoint': member.checkpoint_path, 'fingerprint': member.fingerprint}
+                        for member in self.members],
+            'weights': self.weights.tolist(),
+            'fingerprint': self.fingerprint,
+            'solves': self.solves,
+            'stacked_runs': self.stacked_runs,
+            'threaded_runs': self.threaded_runs,
+        }
@@ -0,0 +1,319 @@
+#!/usr/bin/env python3
+"""
+Bulk offline evaluation of TRM over an ARC-AGI challenge set
+Batches every test input through a pool of model replicas, writes a Kaggle submission and scores it when solutions exist
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, List, Any, Optional, Callable
+
+from inference import TRMInference, EarlyExitPolicy, default_dataset_path, BUCKETING_WARNING
+from dataset_store import get_store
+from tta import TTAConfig
+
+
+def default_solutions_path(challenges_path: str) -> Optional[str]:
+    """Solutions file next to a challenges file (arc-agi_X_challenges.json -> arc-agi_X_solutions.json)"""
+    directory, name = os.path.split(challenges_path)
+    if 'challenges' not in name:
+        return None
+    return os.path.join(directory, name.replace('challenges', 'solutions'))
+
+
+def make_batches(tasks: Dict[str, Dict[str, Any]], batch_size: int) -> List[List[str]]:
+    """
+    Pack whole tasks into batches of about `batch_size` test inputs
+
+    Tasks are ordered by their largest test grid, so each batch holds grids
+    of similar size (and, when bucketed, mostly one size bucket).
+    """
+    def largest(task_id):
+        return max(len(t['input']) * len(t['input'][0]) for t in tasks[task_id]['test'])
+
+    batches, current, rows = [], [], 0
+    for task_id in sorted(tasks, key=largest):
+        current.append(task_id)
+        rows += len(tasks[task_id]['test'])
+        if rows >= batch_size:
+            batches.append(current)
+            current, rows = [], 0
+    if current:
+        batches.append(current)
+    return batches
+
+
+def submission_entry(result: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Kaggle attempts for one task's solve result (the second attempt repeats the first without TTA)"""
+    entry = []
+    for prediction in result['predictions']:
+        attempts = prediction.get('attempts') or [prediction['prediction']]
+        entry.append({'attempt_1': attempts[0], 'attempt_2': attempts[1] if len(attempts) > 1 else attempts[0]})
+    return entry
+
+
+def score_submission(submission: Dict[str, List[Dict[str, Any]]],
+                     solutions: Dict[str, List[List[List[int]]]]) -> Dict[str, Any]:
+    """
+    ARC Prize scoring: a test input counts if either attempt matches exactly, a task scores the fraction of its test inputs
+
+    Returns:
+        Dict with 'score' (mean task score over scored tasks), 'tasks',
+        'solved_tests' and 'tests'
+    """
+    task_scores, solved, total = [], 0, 0
+    for task_id, expected in solutions.items():
+        if task_id not in submission:
+            continue
+        hits = sum(
+            solution in (attempts['attempt_1'], attempts['attempt_2'])
+            for attempts, solution in zip(submission[task_id], expected)
+        )
+        task_scores.append(hits / len(expected))
+        solved += hits
+        total += len(expected)
+    return {
+        'score': sum(task_scores) / len(task_scores) if task_scores else 0.0,
+        'tasks': len(task_scores),
+        'solved_tests': solved,
+        'tests': total,
+    }
+
+
+class Progress:
+    """
+    Append-only JSONL record of finished tasks, for resuming interrupted runs
+
+    The first line holds the run settings; a run only resumes a file written
+    with the same settings. A file whose header was never completely written
+    is started over. On resume, a partially written last line is cut off
+    before new records are appended after it.
+    """
+
+    def __init__(self, path: str, settings: Dict[str, Any], resume: bool):
+        self.path = path
+        self.done: Dict[str, List[Dict[str, Any]]] = {}
+        self._lock = threading.Lock()
+
+        lines = []
+        if resume and os.path.exists(path):
+            with open(path, 'rb') as f:
+                lines = f.read().splitlines(keepends=True)
+            try:
+                header = json.loads(lines[0]) if lines and lines[0].endswith(b'\n') else None
+            except ValueError:
+                header = None
+            if not isinstance(header, dict):
+                lines = []
+            elif header.get('settings') != settings:
+                raise SystemExit(f"{path} was written with different settings; pass --restart to start over")
+
+        if lines:
+            valid = len(lines[0])
+            for line in lines[1:]:
+                if not line.endswith(b'\n'):
+                    break
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break
+                self.done[record['task_id']] = record['entry']
+                valid += len(line)
+            os.truncate(path, valid)
+            self._file = open(path, 'a')
+        else:
+            self._file = open(path, 'w')
+            self._write({'settings': settings})
+
+    def _write(self, record: Dict[str, Any]):
+        self._file.write(json.dumps(record, separators=(',', ':')) + '\n')
+        self._file.flush()
+
+    def add(self, task_id: str, entry: List[Dict[str, Any]]):
+        with self._lock:
+            self.done[task_id] = entry
+            self._write({'task_id': task_id, 'entry': entry})
+
+    def close(self):
+        self._file.close()
+
+
+def evaluate(solver, tasks: Dict[str, Dict[str, Any]], progress: Progress, batch_size: int,
+             workers: int, options: Dict[str, Any],
+             record: Optional[Callable[[str, Dict[str, Any]], None]] = None) -> Dict[str, Any]:
+    """
+    Solve every task not yet in `progress`, `workers` batches at a time
+
+    Args:
+        solver: TRMInference or ReplicaPool (anything with `solve_batch`)
+        tasks: Task dicts by id
+        progress: Finished tasks; new results are appended as batches complete
+        batch_size: Test inputs per `solve_batch` call
+        workers: Batches in flight (one per replica)
+        options: Keyword arguments for `solve_batch`
+        record: Called with each task id and its full result (e.g. `ResultStore.append`)
+
+    Returns:
+        Dict with 'tasks', 'tests' and 'seconds' of this run (resumed tasks excluded)
+    """
+    pending = {task_id: task for task_id, task in tasks.items() if task_id not in progress.done}
+    batches = make_batches(pending, batch_size)
+    total_tests = sum(len(task['test']) for task in pending.values())
+    print(f"{len(progress.done)} task(s) already done, {len(pending)} to go "
+          f"({total_tests} test inputs in {len(batches)} batches)")
+
+    def run(batch):
+        results = solver.solve_batch([pending[task_id] for task_id in batch], **options)
+        for task_id, result in zip(batch, results):
+            if record is not None:
+                record(task_id, result)
+            progress.add(task_id, submission_entry(result))
+        return sum(len(pending[task_id]['test']) for task_id in batch)
+
+    start = time.perf_counter()
+    done_tests = 0
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        futures = [pool.submit(run, batch) for batch in batches]
+        for future in as_completed(futures):
+            done_tests += future.result()
+            elapsed = time.perf_counter() - start
+            rate = done_tests / elapsed
+            eta = (total_tests - done_tests) / rate if rate else 0.0
+            print(f"  {done_tests}/{total_tests} test inputs, {rate:.2f}/s, ETA {eta:.0f}s", flush=True)
+    return {'tasks': len(pending), 'tests': total_tests, 'seconds': time.perf_counter() - start}
+
+
+def write_json(path: str, value: Any):
+    """Write JSON atomically"""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(value, f, separators=(',', ':'))
+    os.replace(tmp_path, path)
+
+
+def run_settings(args: argparse.Namespace, challenges_path: str, model) -> Dict[str, Any]:
+    """Everything that changes a run's answers, checked before resuming its progress file"""
+    return {
+        'challenges': os.path.abspath(challenges_path),
+        'fingerprint': model.fingerprint,
+        'precision': model.precision,
+        # Fitted task embeddings change answers too (TRM_TASK_CONDITIONING)
+        'task_conditioning': model.task_conditioner.config.tag if model.task_conditioner is not None else None,
+        'max_steps': args.max_steps,
+        'bucketed': args.bucketed,
+        'halt_threshold': args.halt_threshold,
+        'stable_steps': args.stable_steps,
+        'tta_views': args.tta_views,
+        # Stacked members run without early exit, so the mode matters as well as the vote
+        'ensemble': [os.path.abspath(path) for path in args.ensemble.split(',')] if args.ensemble else None,
+        'ensemble_vote': args.ensemble_vote if args.ensemble else None,
+        'ensemble_mode': args.ensemble_mode if args.ensemble else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluate TRM over an ARC-AGI challenge set")
+    parser.add_argument('--challenges', default=None, help="Challenges JSON (default: evaluation set)")
+    parser.add_argument('--solutions', default=None, help="Solutions JSON (default: next to the challenges, if present)")
+    parser.add_argument('--output', default='submission.json', help="Kaggle submission to write")
+    parser.add_argument('--checkpoint', default=os.environ.get("TRM_CHECKPOINT_PATH"), help="Model checkpoint")
+    parser.add_argument('--workers', type=int, default=0,
+                        help="Replica processes (0 runs in this process)")
+    parser.add_argument('--batch-size', type=int, default=16, help="Test inputs per batched model call")
+    parser.add_argument('--max-steps', type=int, default=16)
+    parser.add_argument('--bucketed', action='store_true',
+                        help="Run grids at their size bucket's sequence length (changes answers for grids up to 20x20)")
+    parser.add_argument('--halt-threshold', type=float, default=None)
+    parser.add_argument('--stable-steps', type=int, default=None)
+    parser.add_argument('--tta-views', type=int, default=None, help="Vote over augmented views (gives two attempts)")
+    parser.add_argument('--ensemble', default=None,
+                        help="Comma-separated extra checkpoints voting with --checkpoint (gives two attempts)")
+    parser.add_argument('--ensemble-vote', default='majority', choices=['majority', 'confidence'])
+    parser.add_argument('--ensemble-mode', default='threads', choices=['threads', 'stacked'])
+    parser.add_argument('--limit', type=int, default=None, help="Only the first N tasks")
+    parser.add_argument('--restart', action='store_true', help="Ignore saved progress")
+    parser.add_argument('--results', default=None,
+                        help="Result store directory to append every solve to (with iterations if --show-iterations)")
+    parser.add_argument('--show-iterations', action='store_true', help="Record per-step predictions in --results")
+    args = parser.parse_args()
+
+    challenges_path = args.challenges or default_dataset_path()
+    store = get_store(challenges_path)
+    task_ids = store.task_ids[:args.limit] if args.limit else store.task_ids
+    tasks = {task_id: store.get_task(task_id) for task_id in task_ids}
+
+    options = dict(
+        max_steps=args.max_steps,
+        bucketed=args.bucketed,
+        early_exit=EarlyExitPolicy(stable_steps=args.stable_steps, halt_threshold=args.halt_threshold),
+        tta=TTAConfig(num_views=args.tta_views) if args.tta_views else None,
+        show_iterations=args.show_iterations,
+    )
+
+    if args.show_iterations and not args.results:
+        raise SystemExit("--show-iterations only affects what --results records")
+    if args.show_iterations and args.tta_views:
+        raise SystemExit("--show-iterations and --tta-views do not combine")
+    if args.ensemble and args.workers > 0:
+        raise SystemExit("--ensemble runs in this process; use it without --workers")
+    if args.ensemble and args.tta_views:
+        raise SystemExit("--ensemble and --tta-views do not combine")
+    if args.bucketed:
+        print(f"⚠️  {BUCKETING_WARNING}", file=sys.stderr)
+    model = TRMInference(checkpoint_path=args.checkpoint)
+    if args.ensemble:
+        from ensemble import TRMEnsemble, EnsembleConfig
+        model = TRMEnsemble(model, EnsembleConfig(checkpoints=args.ensemble.split(','), vote=args.ensemble_vote,
+                                                  mode=args.ensemble_mode))
+        print(f"✓ Ensemble of {len(model.members)} checkpoints")
+    settings = run_settings(args, challenges_path, model)
+    progress = Progress(args.output + '.progress.jsonl', settings, resume=not args.restart)
+
+    result_store, record = None, None
+    if args.results:
+        from result_store import ResultStore
+        result_store = ResultStore(args.results)
+        recorded = {k: v for k, v in settings.items() if k != 'fingerprint'}
+
+        def record(task_id, result):
+            result_store.append(task_id, model.fingerprint, result, recorded)
+
+    pool = None
+    if args.workers > 0:
+        from replicas import ReplicaPool, ReplicaConfig
+        pool = ReplicaPool(model, ReplicaConfig(replicas=args.workers))
+        pool.wait_ready()
+        print(f"✓ {args.workers} replica(s) on cores {pool.cores}")
+
+    try:
+        run = evaluate(pool or model, tasks, progress, args.batch_size, args.workers, options, record)
+    finally:
+        progress.close()
+        if result_store is not None:
+            result_store.close()
+        if pool is not None:
+            pool.close()
+
+    submission = {task_id: progress.done[task_id] for task_id in task_ids}
+    write_json(args.output, submission)
+    print(f"\n✓ Wrote {args.output} ({len(submission)} tasks)")
+    if run['tests']:
+        print(f"Throughput: {run['tests'] / run['seconds']:.2f} test inputs/s, "
+              f"{run['tasks'] / run['seconds']:.2f} tasks/s ({run['seconds']:.1f}s)")
+
+    solutions_path = args.solutions or default_solutions_path(challenges_path)
+    if solutions_path and os.path.exists(solutions_path):
+        with open(solutions_path, 'r') as f:
+            report = score_submission(submission, json.load(f))
+        print(f"Score: {report['score']:.4f} over {report['tasks']} tasks "
+              f"({report['solved_tests']}/{report['tests']} test inputs solved)")
+    elif args.solutions:
+        print(f"⚠️  Solutions file {solutions_path} not found; skipping scoring", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+"""
+Dedicated inference executor for the TRM API
+Runs CPU-bound model work off the event loop with bounded admission and Retry-After hints
+"""
+import asyncio
+import math
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, asdict, replace
+from functools import partial
+from typing import Dict, Any, Optional, Iterator, AsyncIterator
+
+import torch
+
+
+@dataclass
+class ExecutorConfig:
+    """Inference thread pool settings"""
+    workers: int = 1                      # Inference threads (concurrent model calls)
+    torch_threads: Optional[int] = None   # Intra-op threads per worker (default: cores / workers)
+    max_pending: int = 8                  # Running + waiting jobs before new ones are rejected
+
+    @classmethod
+    def from_env(cls) -> "ExecutorConfig":
+        """Read TRM_INFERENCE_WORKERS, TRM_TORCH_THREADS and TRM_MAX_PENDING"""
+        torch_threads = os.environ.get("TRM_TORCH_THREADS")
+        return cls(
+            workers=int(os.environ.get("TRM_INFERENCE_WORKERS", cls.workers)),
+            torch_threads=int(torch_threads) if torch_threads else None,
+            max_pending=int(os.environ.get("TRM_MAX_PENDING", cls.max_pending)),
+        )
+
+
+class ExecutorSaturated(Exception):
+    """Raised when the executor's admission queue is full"""
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"Inference capacity exhausted, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+class InferenceExecutor:
+    """Thread pool dedicated to model calls, with a bounded admission queue"""
+
+    def __init__(self, config: Optional[ExecutorConfig] = None):
+        self.config = config or ExecutorConfig.from_env()
+        self._pool = self._start_pool()
+
+        self.pending = 0
+        self.completed = 0
+        self.rejected = 0
+        self.busy_seconds = 0.0
+        self._avg_job_seconds: Optional[float] = None
+
+    def _start_pool(self) -> ThreadPoolExecutor:
+        self.torch_threads = self.config.torch_threads or max(1, (os.cpu_count() or 1) // self.config.workers)
+        return ThreadPoolExecutor(
+            max_workers=self.config.workers,
+            thread_name_prefix='trm-inference',
+            initializer=torch.set_num_threads,
+            initargs=(self.torch_threads,)
+        )
+
+    def reconfigure(self, workers: int, torch_threads: Optional[int]):
+        """
+        Switch to a new thread pool with `workers` threads of `torch_threads` intra-op threads each
+
+        Jobs already submitted finish on the old pool; admission counters
+        carry over.
+        """
+        old = self._pool
+        self.config = replace(self.config, workers=workers, torch_threads=torch_threads)
+        self._pool = self._start_pool()
+        old.shutdown(wait=False)
+
+    def acquire(self):
+        """Reserve an admission slot, or raise ExecutorSaturated"""
+        if self.pending >= self.config.max_pending:
+            self.rejected += 1
+            raise ExecutorSaturated(self.retry_after())
+        self.pending += 1
+
+    def release(self):
+        """Give back a slot reserved with `acquire`"""
+        self.pending -= 1
+
+    def retry_after(self) -> int:
+        """Seconds until a slot is likely to free up, from the average job time"""
+        per_job = self._avg_job_seconds or 1.0
+        return max(1, math.ceil(per_job * self.pending / self.config.workers))
+
+    async def _call(self, fn, *args, job: bool = True, **kwargs):
+        start = time.perf_counter()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._pool, partial(fn, *args, **kwargs))
+        finally:
+            elapsed = time.perf_counter() - start
+            self.busy_seconds += elapsed
+            if job:
+                self._record_job(elapsed)
+
+    def _record_job(self, elapsed: float):
+        self.completed += 1
+        # Exponentially weighted average of job time for Retry-After
+        if self._avg_job_seconds is None:
+            self._avg_job_seconds = elapsed
+        else:
+            self._avg_job_seconds = 0.8 * self._avg_job_seconds + 0.2 * elapsed
+
+    async def run(self, fn, *args, **kwargs):
+        """Run `fn(*args, **kwargs)` on an inference thread (raises ExecutorSaturated when full)"""
+        self.acquire()
+        try:
+            return await self._call(fn, *args, **kwargs)
+        finally:
+            self.release()
+
+    async def stream(self, iterator: Iterator[Any]) -> AsyncIterator[Any]:
+        """
+        Pull items from a blocking iterator on inference threads
+
+        The caller must hold a slot from `acquire` for the lifetime of the stream.
+        """
+        done = object()
+        start = time.perf_counter()
+        while True:
+            item = await self._call(next, iterator, done, job=False)
+            if item is done:
+                self._record_job(time.perf_counter() - start)
+                return
+            yield item
+
+    def shutdown(self):
+        """Stop the worker threads once running jobs finish"""
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> Dict[str, Any]:
+        """Configuration, load and counters for monitoring"""
+        return {
+            'config': asdict(self.config),
+            'torch_threads': self.torch_threads,
+            'pending': self.pending,
+            'completed': self.completed,
+            'rejected': self.rejected,
+            'busy_seconds': self.busy_seconds,
+            'avg_job_seconds': self._avg_job_seconds,
+            'retry_after': self.retry_after(),
+        }
@@ -0,0 +1,167 @@
+"""
+Fast model construction for TRM inference
+Loads checkpoints memory-mapped and caches a fully materialized model snapshot so restarts skip random init
+"""
+import hashlib
+import json
+import os
+from typing import Dict, Any, Optional
+
+import torch
+from torch import nn
+from torch.overrides import TorchFunctionMode
+
+SNAPSHOT_VERSION = 1
+
+
+def load_checkpoint_state(path: str, device: str = "cpu") -> Dict[str, torch.Tensor]:
+    """
+    Model state dict from a training checkpoint or a .safetensors file
+
+    `torch.load` checkpoints are memory-mapped, so tensors that are never
+    used (optimizer state, EMA copies) are never read from disk.
+    """
+    if path.endswith('.safetensors'):
+        try:
+            from safetensors.torch import load_file
+        except ImportError:
+            raise ImportError("Loading .safetensors checkpoints requires the 'safetensors' package")
+        return load_file(path, device=device)
+
+    try:
+        checkpoint = torch.load(path, map_location=device, mmap=True)
+    except RuntimeError:
+        # Legacy (non-zipfile) checkpoints cannot be memory-mapped
+        checkpoint = torch.load(path, map_location=device)
+    return checkpoint.get('model_state_dict', checkpoint)
+
+
+def model_tensors(model: nn.Module) -> Dict[str, torch.Tensor]:
+    """Every parameter and buffer of a model, including non-persistent buffers such as RoPE tables"""
+    tensors = {name: param.detach() for name, param in model.named_parameters()}
+    tensors.update(model.named_buffers())
+    return tensors
+
+
+class _SkipInit(TorchFunctionMode):
+    """
+    Replace random fills with zero fills while a model is constructed
+
+    Zeros rather than no-ops, so rejection loops such as nn.init.trunc_normal_'s
+    still terminate.
+    """
+
+    RANDOM_FILLS = {
+        torch.Tensor.uniform_, torch.Tensor.normal_, torch.Tensor.random_, torch.Tensor.bernoulli_,
+        torch.Tensor.exponential_, torch.Tensor.geometric_, torch.Tensor.cauchy_, torch.Tensor.log_normal_,
+    }
+
+    def __torch_function__(self, func, types, args=(), kwargs=None):
+        if func in self.RANDOM_FILLS:
+            return args[0].zero_()
+        return func(*args, **(kwargs or {}))
+
+
+def build_model(model_cls, model_config: Dict[str, Any], tensors: Dict[str, torch.Tensor]) -> nn.Module:
+    """
+    Construct a model without random initialization and adopt `tensors` without copying
+
+    `tensors` is either every parameter and buffer (as returned by
+    `model_tensors`) or a checkpoint's state dict, whose non-persistent
+    buffers (such as RoPE tables) the constructor computes. Like a strict
+    `load_state_dict`, missing or unknown names and shape mismatches raise
+    ValueError; tensors of another dtype are converted (and so copied).
+    Construction still runs on CPU rather than the meta device: meta
+    `arange` pulls in torch._dynamo, which costs more at startup than the
+    allocations it saves.
+    """
+    with _SkipInit():
+        model = model_cls(model_config)
+
+    expected = model_tensors(model)
+    missing = sorted(set(model.state_dict()) - set(tensors))
+    if missing:
+        raise ValueError(f"No tensors for {', '.join(missing)}")
+    unexpected = sorted(set(tensors) - set(expected))
+    if unexpected:
+        raise ValueError(f"Unexpected tensors {', '.join(unexpected)}")
+
+    for name, tensor in tensors.items():
+        if tensor.shape != expected[name].shape:
+            raise ValueError(f"{name} has shape {tuple(tensor.shape)}, expected {tuple(expected[name].shape)}")
+        if tensor.dtype != expected[name].dtype:
+            tensor = tensor.to(expected[name].dtype)
+        module_name, _, attr = name.rpartition('.')
+        module = model.get_submodule(module_name)
+        if attr in module._parameters:
+            module._parameters[attr] = nn.Parameter(tensor, requires_grad=module._parameters[attr].requires_grad)
+        else:
+            module._buffers[attr] = tensor
+    return model
+
+
+def snapshot_path(checkpoint_path: str) -> str:
+    """Where the snapshot for a checkpoint lives (next to it, or under TRM_MODEL_CACHE_DIR)"""
+    checkpoint_path = os.path.abspath(checkpoint_path)
+    name = os.path.basename(checkpoint_path) + '.fast.pt'
+    cache_dir = os.environ.get("TRM_MODEL_CACHE_DIR")
+    if not cache_dir:
+        return os.path.join(os.path.dirname(checkpoint_path), name)
+    # Named after the checkpoint's full path, so same-named checkpoints in other directories do not collide
+    path_hash = hashlib.sha256(checkpoint_path.encode()).hexdigest()[:12]
+    return os.path.join(cache_dir, f"{path_hash}-{name}")
+
+
+def snapshot_key(checkpoint_path: str, config_path: str) -> str:
+    """Identity of a checkpoint file (path, size, mtime) plus the architecture config it is built with"""
+    stat = os.stat(checkpoint_path)
+    digest = hashlib.sha256(json.dumps({
+        'version': SNAPSHOT_VERSION,
+        'torch': torch.__version__,
+        'checkpoint': [os.path.abspath(checkpoint_path), stat.st_size, stat.st_mtime_ns],
+    }).encode())
+    with open(config_path, 'rb') as f:
+        digest.update(f.read())
+    return digest.hexdigest()
+
+
+def load_snapshot(checkpoint_path: str, config_path: str, device: str = "cpu") -> Optional[Dict[str, Any]]:
+    """
+    Memory-mapped snapshot for a checkpoint, or None if it is missing or stale
+
+    Returns:
+        Dict with the resolved 'arch' config, 'model_config', checkpoint
+        'fingerprint' and all model 'tensors'
+    """
+    path = snapshot_path(checkpoint_path)
+    if not os.path.exists(path):
+        return None
+    try:
+        snapshot = torch.load(path, map_location=device, mmap=True)
+    except Exception as e:
+        print(f"⚠️  Ignoring unreadable model snapshot {path}: {e}")
+        return None
+    if snapshot.get('key') != snapshot_key(checkpoint_path, config_path):
+        return None
+    return snapshot
+
+
+def save_snapshot(checkpoint_path: str, config_path: str, arch: Dict[str, Any],
+                  model_config: Dict[str, Any], fingerprint: str, model: nn.Module):
+    """Write the snapshot for a checkpoint atomically (failures only print a warning)"""
+    path = snapshot_path(checkpoint_path)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        torch.save({
+            'key': snapshot_key(checkpoint_path, config_path),
+            'arch': arch,
+            'model_config': model_config,
+            'fingerprint': fingerprint,
+            'tensors': {name: tensor.cpu() for name, tensor in model_tensors(model).items()},
+        }, tmp_path)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        print(f"⚠️  Could not write model snapshot {path}: {e}")
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
@@ -4,41 +4,162 @@ Handles model loading and prediction for ARC-AGI tasks
 """
 import sys
 import os
+import time
+import contextlib
 import torch
-import json
-from typing import Dict, List, Tuple, Any
+import hashlib
+import dataclasses
+from dataclasses import dataclass
+from types import SimpleNamespace
+from typing import Dict, List, Tuple, Any, Optional, Iterator
 import numpy as np
 
+from codec import grid_delta, flatten_grid, encode_grids, decode_grids
+from dataset_store import get_store
+from compiled import CompiledStep, backend_from_env
+from precision import QUANTIZED_BLOCKS, autocast, precision_from_env, quantize_blocks
+from fast_start import load_checkpoint_state, build_model, load_snapshot, save_snapshot, snapshot_path
+from instrumentation import profiler
+from carry_store import CarryStore, CarrySnapshot
+from task_conditioning import ConditioningConfig, TaskConditioner
+
 # Add the TinyRecursiveModels to Python path
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'TinyRecursiveModels'))
 
-from models.recursive_reasoning.trm import TinyRecursiveReasoningModel_ACTV1
-from omegaconf import OmegaConf
+from models.recursive_reasoning.trm import (
+    TinyRecursiveReasoningModel_ACTV1, TinyRecursiveReasoningModel_ACTV1Carry, TinyRecursiveReasoningModel_ACTV1InnerCarry
+)
+
+
+# Padded sequence lengths for size-bucketed execution (10x10, 15x15, 20x20, 30x30)
+SEQ_BUCKETS = (100, 225, 400, 900)
+
+# Attention sees the padding tokens, so bucketing is an approximation, not a speedup of the same computation
+BUCKETING_WARNING = ("Bucketed execution changes the answers for grids of up to 400 cells (20x20), "
+                     "which run with fewer padding tokens; results are not comparable to unbucketed runs")
+
+
+def load_arch_config(config_path: str) -> Dict[str, Any]:
+    """Resolved architecture settings from a TRM arch yaml (OmegaConf is only imported when needed)"""
+    from omegaconf import OmegaConf
+    return OmegaConf.to_container(OmegaConf.load(config_path), resolve=True)
+
+
+@dataclass(frozen=True)
+class EarlyExitPolicy:
+    """When to stop recursing a test input before `max_steps`"""
+    stable_steps: Optional[int] = None      # Stop once the argmax grid is unchanged for K steps
+    halt_threshold: Optional[float] = None  # Stop once sigmoid(q_halt) reaches this confidence
+
+    @property
+    def enabled(self) -> bool:
+        return self.stable_steps is not None or self.halt_threshold is not None
+
+
+def checkpoint_fingerprint(checkpoint_path: str) -> str:
+    """Content hash of a checkpoint file (what `TRMInference.fingerprint` reports once it is loaded)"""
+    digest = hashlib.sha256()
+    with open(checkpoint_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()[:16]
+
+
+def _select_rows(carry, keep: torch.Tensor):
+    """Keep only the given batch rows of an ACT carry"""
+    inner = carry.inner_carry
+    inner = dataclasses.replace(inner, **{
+        f.name: getattr(inner, f.name)[keep] for f in dataclasses.fields(inner)
+    })
+    return dataclasses.replace(
+        carry,
+        inner_carry=inner,
+        steps=carry.steps[keep],
+        halted=carry.halted[keep],
+        current_data={k: v[keep] for k, v in carry.current_data.items()}
+    )
+
+
+@dataclass
+class RowBlock:
+    """Batch rows that share a grid area, e.g. one test input or all its augmented views"""
+    inputs: torch.Tensor             # [n, area] flattened grids
+    puzzle_ids: torch.Tensor         # [n] puzzle identifiers
+    shapes: List[Tuple[int, int]]    # (height, width) of each row
+
+
+@dataclass
+class PackedGroup:
+    """Blocks running at one sequence length, padded and concatenated into one batch"""
+    seq_len: int
+    members: List[int]               # Indexes of the blocks in this group, in batch order
+    inputs: torch.Tensor             # [n, seq_len] padded rows
+    puzzle_ids: torch.Tensor         # [n]
+    shapes: List[Tuple[int, int]]    # (height, width) of each row
+
+
+@dataclass
+class CarryPlan:
+    """How the rows of one batch start: from scratch, from a stored carry, or with a stored result"""
+    keys: Optional[List[str]]                                          # Carry store key per row (None: store unused)
+    runs: List[Tuple[int, List[int], Optional[List[CarrySnapshot]]]]  # (start step, rows, their snapshots)
+    reused: List[Tuple[int, CarrySnapshot]]                           # Rows already answered by a snapshot
 
 
 class TRMInference:
     """Wrapper for TRM model inference"""
     
-    def __init__(self, checkpoint_path: str = None, device: str = "cpu"):
+    def __init__(self, checkpoint_path: str = None, device: str = "cpu",
+                 weights: Optional[Dict[str, torch.Tensor]] = None,
+                 fast_start: Optional[bool] = None, backend: Optional[str] = None,
+                 precision: Optional[str] = None):
         """
         Initialize TRM model for inference
         
         Args:
             checkpoint_path: Path to model checkpoint (if None, uses random initialization)
             device: Device to run model on ('cpu', 'mps', or 'cuda')
+            weights: All model tensors (see `fast_start.model_tensors`) to use directly
+                instead of loading the checkpoint (e.g. weights shared by a replica pool)
+            fast_start: Build from a cached snapshot of the checkpoint when one is
+                available, and write one otherwise (default: TRM_FAST_START, on)
+            backend: How recursion steps run: 'eager', 'compile' (torch.compile),
+                'script' (TorchScript trace) or 'onnx' (ONNX Runtime) (default: TRM_BACKEND)
+            precision: 'fp32', 'bf16' (autocast) or 'int8' (dynamically quantized
+                reasoning blocks, CPU only) (default: TRM_PRECISION)
         """
         self.device = device if torch.backends.mps.is_available() and device == "mps" else "cpu"
         print(f"Using device: {self.device}")
         
-        # Load config
+        self.checkpoint_path = checkpoint_path
+        self.checkpoint_loaded = bool(checkpoint_path and os.path.exists(checkpoint_path))
+        self._fingerprint = None
+        if fast_start is None:
+            fast_start = os.environ.get("TRM_FAST_START", "true").lower() == "true"
+        
+        # Load config (a matching snapshot already holds it, resolved)
         config_path = os.path.join(os.path.dirname(__file__), 
                                    'TinyRecursiveModels/config/arch/trm.yaml')
-        self.config = OmegaConf.load(config_path)
+        snapshot = None
+        if fast_start and self.checkpoint_loaded and weights is None:
+            snapshot = load_snapshot(checkpoint_path, config_path, self.device)
+        arch = snapshot['arch'] if snapshot is not None else load_arch_config(config_path)
+        self.config = SimpleNamespace(**arch)
         
         # Set model parameters for ARC-AGI
-        model_config = {
+        self.seq_len = 900  # 30x30 grid max
+        self.seq_buckets = SEQ_BUCKETS
+        self._bucket_models = {}
+        self.backend = backend or backend_from_env()
+        self.precision = precision or precision_from_env()
+        if self.precision == 'int8' and self.device != 'cpu':
+            raise ValueError("int8 precision is only supported on CPU")
+        self._compiled_steps = {}
+        # Optional store of latent carries, so requests for more steps resume (TRM_CARRY_STORE_SIZE)
+        self.carry_store = CarryStore.from_env()
+        self.model_config = model_config = {
             'batch_size': 1,
-            'seq_len': 900,  # 30x30 grid max
+            'seq_len': self.seq_len,
             'puzzle_emb_ndim': self.config.puzzle_emb_ndim,
             'num_puzzle_identifiers': 1000,
             'vocab_size': 11,  # 0-9 colors + padding
@@ -59,42 +180,179 @@ class TRMInference:
             'puzzle_emb_len': self.config.puzzle_emb_len,
             'no_ACT_continue': self.config.no_ACT_continue,
         }
+        if snapshot is not None and snapshot['model_config'] != model_config:
+            snapshot = None
         
-        # Initialize model
-        self.model = TinyRecursiveReasoningModel_ACTV1(model_config)
-        self.model.eval()
-        
-        # Load checkpoint if provided
-        if checkpoint_path and os.path.exists(checkpoint_path):
+        # Initialize model, skipping random init whenever the tensors are already at hand
+        if weights is not None:
+            # Adopt the tensors as-is so shared memory stays shared
+            self.model = build_model(TinyRecursiveReasoningModel_ACTV1, model_config, weights)
+        elif snapshot is not None:
+            print(f"Loading checkpoint from {checkpoint_path} (snapshot {snapshot_path(checkpoint_path)})")
+            self.model = build_model(TinyRecursiveReasoningModel_ACTV1, model_config, snapshot['tensors'])
+            self._fingerprint = snapshot['fingerprint']
+        elif self.checkpoint_loaded:
             print(f"Loading checkpoint from {checkpoint_path}")
-            checkpoint = torch.load(checkpoint_path, map_location=self.device)
-            self.model.load_state_dict(checkpoint['model_state_dict'])
+            self.model = build_model(TinyRecursiveReasoningModel_ACTV1, model_config,
+                                     load_checkpoint_state(checkpoint_path, self.device))
+            if fast_start:
+                save_snapshot(checkpoint_path, config_path, arch, model_config, self.fingerprint, self.model)
         else:
+            self.model = TinyRecursiveReasoningModel_ACTV1(model_config)
             print("⚠️  Using randomly initialized model (no checkpoint provided)")
             print("   The model will not produce meaningful predictions until trained.")
+        self.model.eval()
         
         # Move model to device (keeping in float32 for CPU/MPS)
         self.model = self.model.to(self.device)
+        self.num_parameters = sum(p.numel() for p in self.model.parameters())
+        if self.precision == 'int8':
+            quantize_blocks(self.model)
+        
+        # Optional per-task puzzle embeddings fitted to the training pairs (TRM_TASK_CONDITIONING)
+        conditioning = ConditioningConfig.from_env()
+        self.task_conditioner = TaskConditioner(self, conditioning) if conditioning.enabled else None
         
+    @property
+    def fingerprint(self) -> str:
+        """
+        Content hash identifying the loaded weights
+        
+        Hashes the checkpoint file when one was loaded, otherwise the
+        randomly initialized parameters (which differ on every start).
+        """
+        if self._fingerprint is None:
+            if self.checkpoint_loaded:
+                self._fingerprint = checkpoint_fingerprint(self.checkpoint_path)
+            else:
+                digest = hashlib.sha256()
+                for name, tensor in self.model.state_dict().items():
+                    digest.update(name.encode())
+                    digest.update(tensor.detach().cpu().contiguous().view(-1).view(torch.uint8).numpy().tobytes())
+                self._fingerprint = digest.hexdigest()[:16]
+        return self._fingerprint
+    
+    def _conditioning(self, tasks: List[Dict[str, Any]], bucketed: bool = False):
+        """Context manager yielding each task's fitted-embedding puzzle id, or None (see TaskConditioner.assign)"""
+        if self.task_conditioner is None:
+            return contextlib.nullcontext([None] * len(tasks))
+        return self.task_conditioner.assign(tasks, bucketed)
+    
+    def _puzzle_key(self, puzzle_id: int) -> str:
+        """What a puzzle id stands for, for keying stored results (a task's embedding for conditioned slots)"""
+        if self.task_conditioner is None:
+            return str(puzzle_id)
+        return self.task_conditioner.puzzle_key(puzzle_id)
+    
+    @contextlib.contextmanager
+    def _no_grad_scope(self):
+        """Inference numerics (no autograd, and autocast for bf16) on the calling thread"""
+        with torch.no_grad(), autocast(self.precision, self.device):
+            yield
+    
+    @property
+    def carry_namespace(self) -> str:
+        """Identity of the weights and numerics that carry snapshots depend on"""
+        return f"{self.fingerprint}-{self.precision}"
+    
     def preprocess_grid(self, grid: List[List[int]]) -> torch.Tensor:
         """Convert a 2D grid to tensor format"""
-        # Flatten grid
-        flat = [cell for row in grid for cell in row]
-        return torch.tensor(flat, dtype=torch.int32)
+        return torch.from_numpy(flatten_grid(grid))
     
     def postprocess_output(self, output: torch.Tensor, height: int, width: int) -> List[List[int]]:
         """Convert model output back to 2D grid"""
         # Get predictions
-        preds = output.argmax(dim=-1).cpu().numpy()
+        return self._grid_from_preds(output.argmax(dim=-1), height, width)
+    
+    def _grid_from_preds(self, preds: torch.Tensor, height: int, width: int) -> List[List[int]]:
+        """Convert flat argmax predictions back to 2D grid"""
+        return preds.cpu().numpy()[:height * width].reshape(height, width).tolist()
+    
+    def pad_input(self, grid: List[List[int]], seq_len: Optional[int] = None) -> torch.Tensor:
+        """Flatten a grid and pad (or truncate) it to `seq_len` (default: the model sequence length)"""
+        return self.pad_inputs([grid], seq_len)[0]
+    
+    def pad_inputs(self, grids: List[List[List[int]]], seq_len: Optional[int] = None) -> torch.Tensor:
+        """Flatten grids straight into one padded [len(grids), seq_len] batch (see `codec.encode_grids`)"""
+        return torch.from_numpy(encode_grids(grids, seq_len or self.seq_len))
+    
+    def bucket_for(self, height: int, width: int) -> int:
+        """Smallest bucket sequence length that holds a grid"""
+        for seq_len in self.seq_buckets:
+            if height * width <= seq_len:
+                return seq_len
+        return self.seq_len
+    
+    def step_flops(self, seq_len: Optional[int] = None, batch_size: int = 1) -> int:
+        """Approximate forward FLOPs of one ACT step (matmuls and attention only)"""
+        seq_len = seq_len or self.seq_len
+        cfg = self.model_config
+        hidden = cfg['hidden_size']
+        tokens = seq_len + self.model.inner.puzzle_emb_len
+        inter = -(round(cfg['expansion'] * hidden * 2 / 3) // -256) * 256  # SwiGLU width
+        
+        per_block = (
+            2 * tokens * hidden * 4 * hidden    # qkv + output projections
+            + 2 * 2 * tokens * tokens * hidden  # scores and weighted sum
+            + 2 * tokens * hidden * 3 * inter   # gate/up + down projections
+        )
+        blocks = cfg['L_layers'] * cfg['H_cycles'] * (cfg['L_cycles'] + 1)
+        head = 2 * tokens * hidden * cfg['vocab_size']
+        return batch_size * (blocks * per_block + head)
+    
+    def model_for(self, seq_len: int) -> TinyRecursiveReasoningModel_ACTV1:
+        """
+        Model running at a shorter sequence length, sharing weights with `self.model`
+        
+        The bucket model is built once per length (see `build_shared_model`).
+        """
+        if seq_len == self.seq_len:
+            return self.model
+        if seq_len not in self._bucket_models:
+            self._bucket_models[seq_len] = self.build_shared_model(seq_len)
+        return self._bucket_models[seq_len]
+    
+    def build_shared_model(self, seq_len: int) -> TinyRecursiveReasoningModel_ACTV1:
+        """
+        New model instance at `seq_len` whose parameters alias the main model's tensors
+        
+        RoPE tables are rebuilt for the length and learned position embeddings
+        are sliced to match.
+        """
+        shared_model = TinyRecursiveReasoningModel_ACTV1({**self.model_config, 'seq_len': seq_len})
+        if self.precision == 'int8':
+            # Packed int8 weights cannot alias through a state dict, so share the quantized blocks
+            for name in QUANTIZED_BLOCKS:
+                if hasattr(self.model.inner, name):
+                    setattr(shared_model.inner, name, getattr(self.model.inner, name))
+        state = self.model.state_dict()
+        pos_key = 'inner.embed_pos.embedding_weight'
+        if pos_key in state:
+            state[pos_key] = state[pos_key][:seq_len + self.model.inner.puzzle_emb_len]
+        shared_model.load_state_dict(state, assign=True)
+        return shared_model.to(self.device).eval()
+    
+    def step_for(self, model: TinyRecursiveReasoningModel_ACTV1):
+        """
+        Callable running one recursion step of `model` on the configured backend
         
-        # Reshape to grid
-        grid = []
-        for i in range(height):
-            row = preds[i * width:(i + 1) * width].tolist()
-            grid.append(row)
-        return grid
+        Eager mode returns the model itself; compiled steps are built on first
+        use, once per backend and sequence length.
+        """
+        if self.backend == 'eager':
+            return model
+        key = (self.backend, model.config.seq_len)
+        if key not in self._compiled_steps:
+            example = {
+                'inputs': torch.zeros(2, model.config.seq_len, dtype=torch.int32, device=self.device),
+                'puzzle_identifiers': torch.zeros(2, 1, dtype=torch.int32, device=self.device)
+            }
+            self._compiled_steps[key] = CompiledStep(model, self.backend, example)
+        return self._compiled_steps[key]
     
-    def solve(self, task: Dict[str, Any], max_steps: int = 16, show_iterations: bool = False) -> Dict[str, Any]:
+    def solve(self, task: Dict[str, Any], max_steps: int = 16, show_iterations: bool = False,
+              batched: bool = True, early_exit: Optional[EarlyExitPolicy] = None,
+              bucketed: bool = False) -> Dict[str, Any]:
         """
         Solve an ARC-AGI task
         
@@ -102,10 +360,24 @@ class TRMInference:
             task: ARC-AGI task dict with 'train' (demo pairs) and 'test' (test inputs)
             max_steps: Maximum recursive reasoning steps
             show_iterations: If True, return intermediate predictions
+            batched: If True, run all test inputs through the recursion as one batch
+            early_exit: Optional policy for stopping before max_steps (batched path only)
+            bucketed: If True, run each grid at its size bucket's sequence length (batched path
+                only; changes the answers for grids of up to 400 cells, see `solve_batch`)
             
         Returns:
-            Dict with 'predictions' and optionally 'iterations'
+            Dict with 'predictions' (each with 'prediction', 'steps' and optionally 'iterations')
         """
+        if batched:
+            return self.solve_batch([task], max_steps=max_steps, show_iterations=show_iterations,
+                                    early_exit=early_exit, bucketed=bucketed)[0]
+        
+        with self._conditioning([task]) as (task_puzzle_id,):
+            return self._solve_sequential(task, max_steps, show_iterations, task_puzzle_id)
+    
+    def _solve_sequential(self, task: Dict[str, Any], max_steps: int, show_iterations: bool,
+                          task_puzzle_id: Optional[int] = None) -> Dict[str, Any]:
+        """`solve` one test input at a time (puzzle id: the task's fitted slot, else the test index)"""
         results = {'predictions': []}
         
         # Process each test input
@@ -114,30 +386,30 @@ class TRMInference:
             height, width = len(input_grid), len(input_grid[0])
             
             # Prepare input
-            input_tensor = self.preprocess_grid(input_grid)
-            
-            # Pad to seq_len
-            seq_len = 900  # 30x30 max
-            if len(input_tensor) < seq_len:
-                input_tensor = torch.nn.functional.pad(
-                    input_tensor, (0, seq_len - len(input_tensor)), value=0
-                )
-            else:
-                input_tensor = input_tensor[:seq_len]
+            input_tensor = self.pad_input(input_grid)
+            puzzle_id = test_idx if task_puzzle_id is None else task_puzzle_id
             
             # Create batch
             batch = {
                 'inputs': input_tensor.unsqueeze(0).to(self.device),
-                'puzzle_identifiers': torch.tensor([[test_idx]], dtype=torch.int32).to(self.device)
+                'puzzle_identifiers': torch.tensor([[puzzle_id]], dtype=torch.int32).to(self.device)
             }
             
             # Run inference with recursive steps
             iterations = []
-            with torch.no_grad():
+            instrumented = profiler.active
+            if instrumented:
+                profiler.attach(self.model)
+            with torch.no_grad(), autocast(self.precision, self.device):
+                step_fn = self.step_for(self.model)
                 carry = self.model.initial_carry(batch)
                 
                 for step in range(max_steps):
-                    carry, outputs = self.model(carry, batch)
+                    if instrumented:
+                        start = time.perf_counter()
+                    carry, outputs = step_fn(carry, batch)
+                    if instrumented:
+                        profiler.record_step(start, time.perf_counter(), 1, self.step_flops(), self.device)
                     
                     if show_iterations:
                         pred_grid = self.postprocess_output(
@@ -153,15 +425,540 @@ class TRMInference:
                         break
                 
                 # Final prediction
-                final_output = outputs['logits'][0][:height * width]
-                final_grid = self.postprocess_output(final_output, height, width)
+                with profiler.span('postprocess'):
+                    final_output = outputs['logits'][0][:height * width]
+                    final_grid = self.postprocess_output(final_output, height, width)
             
-            result = {'prediction': final_grid}
+            result = {'prediction': final_grid, 'steps': step + 1}
             if show_iterations:
                 result['iterations'] = iterations
             results['predictions'].append(result)
         
         return results
+    
+    def solve_batch(self, tasks: List[Dict[str, Any]], max_steps: int = 16,
+                    show_iterations: bool = False,
+                    early_exit: Optional[EarlyExitPolicy] = None,
+                    bucketed: bool = False,
+                    tta=None,
+                    array_grids: bool = False) -> List[Dict[str, Any]]:
+        """
+        Solve several ARC-AGI tasks with a single batched recursion
+        
+        Every test input of every task becomes one row of a [B, seq_len] batch.
+        Rows finish independently (ACT halt or early-exit policy) and are
+        dropped from the active batch, so they use no further compute.
+        
+        With `bucketed=True` rows are grouped by the smallest bucket in
+        `seq_buckets` that holds the grid, and each group runs at that
+        sequence length. Small grids then cost a fraction of the 900-token
+        compute, but their answers change: attention sees the padding
+        tokens, so a grid in the 100/225/400 buckets is solved as a different
+        input than at 900 tokens (only grids of more than 400 cells match the
+        full-length run). Treat bucketed results as a separate configuration.
+        
+        Args:
+            tasks: List of ARC-AGI task dicts
+            max_steps: Maximum recursive reasoning steps
+            show_iterations: If True, return intermediate predictions
+            early_exit: Optional policy for stopping rows before max_steps
+            bucketed: If True, run each size bucket at its own sequence length
+            tta: Optional `tta.TTAConfig`; if given, vote over augmented views
+                (not combinable with `show_iterations`)
+            array_grids: If True, return predicted grids as uint8 numpy arrays
+                instead of nested lists (cheaper to build and to serialize;
+                ignored with `tta`)
+            
+        Returns:
+            One result dict per task, in the same format as `solve`
+        """
+        if tta is not None:
+            if show_iterations:
+                raise ValueError("show_iterations is not available with test-time augmentation")
+            from tta import solve_tta
+            with self._conditioning(tasks, bucketed) as task_puzzle_ids:
+                return solve_tta(self, tasks, max_steps, tta, early_exit, bucketed, task_puzzle_ids)
+        
+        with self._conditioning(tasks, bucketed) as task_puzzle_ids:
+            blocks = []
+            with profiler.span('preprocess'):
+                for task, task_puzzle_id in zip(tasks, task_puzzle_ids):
+                    for test_idx, test_input in enumerate(task['test']):
+                        grid = test_input['input']
+                        blocks.append(RowBlock(
+                            inputs=self.preprocess_grid(grid).unsqueeze(0),
+                            puzzle_ids=torch.tensor([test_idx if task_puzzle_id is None else task_puzzle_id],
+                                                    dtype=torch.int32),
+                            shapes=[(len(grid), len(grid[0]))]
+                        ))
+            
+            runs = self.run_blocks(blocks, max_steps, show_iterations, early_exit, bucketed)
+        
+        rows = []
+        with profiler.span('postprocess'):
+            for block, run in zip(blocks, runs):
+                height, width = block.shapes[0]
+                prediction = run['preds'][0].view(height, width).numpy()
+                result = {
+                    'prediction': prediction.astype(np.uint8) if array_grids else prediction.tolist(),
+                    'steps': int(run['steps'][0])
+                }
+                if show_iterations:
+                    result['iterations'] = [
+                        {'step': it['step'], 'prediction': it['prediction'] if array_grids else it['prediction'].tolist()}
+                        for it in run['iterations'][0]
+                    ]
+                rows.append(result)
+        
+        # Split rows back into per-task results
+        results, offset = [], 0
+        for task in tasks:
+            num_tests = len(task['test'])
+            results.append({'predictions': rows[offset:offset + num_tests]})
+            offset += num_tests
+        return results
+    
+    def _group_by_seq_len(self, shapes: List[Tuple[int, int]], bucketed: bool) -> Dict[int, List[int]]:
+        """Group indices of grids by the sequence length they run at"""
+        groups: Dict[int, List[int]] = {}
+        for index, (height, width) in enumerate(shapes):
+            seq_len = self.bucket_for(height, width) if bucketed else self.seq_len
+            groups.setdefault(seq_len, []).append(index)
+        return groups
+    
+    def solve_stream(self, task: Dict[str, Any], max_steps: int = 16,
+                     early_exit: Optional[EarlyExitPolicy] = None,
+                     bucketed: bool = False) -> Iterator[Dict[str, Any]]:
+        """
+        Solve a task, yielding each step's predictions as soon as they are computed
+        
+        Grids are delta-encoded: the first event for a test input carries the
+        full grid, later ones only the cells that changed since the previous
+        step. Only the previous prediction of each test input is kept in memory.
+        
+        Yields:
+            {'event': 'start', 'tests': [[height, width], ...]}
+            {'event': 'step', 'test_index', 'step', and 'grid' or 'changes' ([[row, col, value], ...])}
+            {'event': 'done', 'steps': steps used per test input}
+        """
+        shapes = [(len(test['input']), len(test['input'][0])) for test in task['test']]
+        yield {'event': 'start', 'tests': [list(shape) for shape in shapes]}
+        
+        steps_used = [0] * len(shapes)
+        with self._conditioning([task], bucketed) as (task_puzzle_id,):
+            for seq_len, members in self._group_by_seq_len(shapes, bucketed).items():
+                inputs = self.pad_inputs([task['test'][i]['input'] for i in members], seq_len)
+                puzzle_ids = torch.tensor(members if task_puzzle_id is None else [task_puzzle_id] * len(members),
+                                          dtype=torch.int32)
+                plan = self._carry_plan(inputs, puzzle_ids, seq_len, max_steps, early_exit)
+                
+                # Test inputs answered by a stored carry get a single event for their last step
+                for row, snapshot in plan.reused:
+                    test_index = members[row]
+                    height, width = shapes[test_index]
+                    grid = snapshot.preds[:height * width].view(height, width).tolist()
+                    yield {'event': 'step', 'test_index': test_index, 'step': snapshot.steps, 'grid': grid}
+                    steps_used[test_index] = snapshot.steps
+                
+                for start_step, run_rows, snapshots in plan.runs:
+                    index = torch.tensor(run_rows)
+                    batch = self._stage_batch(inputs, puzzle_ids, index)
+                    steps = self._recurse_steps(batch, [shapes[members[row]] for row in run_rows], max_steps, early_exit,
+                                                self.model_for(seq_len), with_preds=True,
+                                                resume=(start_step, snapshots) if start_step else None,
+                                                carry_keys=[plan.keys[row] for row in run_rows] if plan.keys else None)
+                    previous: Dict[int, np.ndarray] = {}
+                    while True:
+                        try:
+                            step, rows, preds = next(steps)
+                        except StopIteration as stop:
+                            run = stop.value
+                            break
+                        
+                        preds = preds.cpu().numpy()
+                        for pos, row in enumerate(rows.tolist()):
+                            test_index = members[run_rows[row]]
+                            height, width = shapes[test_index]
+                            grid = preds[pos, :height * width].reshape(height, width)
+                            
+                            event = {'event': 'step', 'test_index': test_index, 'step': step}
+                            if test_index in previous:
+                                event['changes'] = grid_delta(previous[test_index], grid)
+                            else:
+                                event['grid'] = grid.tolist()
+                            previous[test_index] = grid
+                            yield event
+                    
+                    for pos, row in enumerate(run_rows):
+                        steps_used[members[row]] = int(run['steps'][pos])
+            
+        yield {'event': 'done', 'steps': steps_used}
+    
+    def run_blocks(self, blocks: List[RowBlock], max_steps: int = 16,
+                   show_iterations: bool = False,
+                   early_exit: Optional[EarlyExitPolicy] = None,
+                   bucketed: bool = False,
+                   max_rows: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        Run blocks of flattened grids through the batched recursion
+        
+        Blocks are grouped by the sequence length they run at (900, or their
+        size bucket when `bucketed`), padded and concatenated into one batch
+        per group. `max_rows` splits each group into chunks to bound memory.
+        
+        Returns:
+            One dict per block with cropped argmax 'preds' [n, area], final
+            'q_halt_logits' [n], 'steps' used [n] and per-row 'iterations'
+        """
+        return self.run_packed(blocks, self.pack_blocks(blocks, bucketed), max_steps, show_iterations,
+                               early_exit, max_rows)
+    
+    def pack_blocks(self, blocks: List[RowBlock], bucketed: bool = False) -> List[PackedGroup]:
+        """Group blocks by the sequence length they run at and pad each group into one batch"""
+        groups = self._group_by_seq_len([block.shapes[0] for block in blocks], bucketed)
+        
+        packed = []
+        for seq_len, members in groups.items():
+            # Pad in place into one preallocated batch
+            inputs = torch.zeros(sum(len(blocks[i].shapes) for i in members), seq_len,
+                                 dtype=blocks[members[0]].inputs.dtype)
+            offset = 0
+            for i in members:
+                block_inputs = blocks[i].inputs[:, :seq_len]
+                inputs[offset:offset + len(block_inputs), :block_inputs.shape[-1]] = block_inputs
+                offset += len(block_inputs)
+            packed.append(PackedGroup(
+                seq_len=seq_len,
+                members=members,
+                inputs=inputs,
+                puzzle_ids=torch.cat([blocks[i].puzzle_ids for i in members]),
+                shapes=[shape for i in members for shape in blocks[i].shapes]
+            ))
+        return packed
+    
+    def run_packed(self, blocks: List[RowBlock], packed: List[PackedGroup], max_steps: int = 16,
+                   show_iterations: bool = False,
+                   early_exit: Optional[EarlyExitPolicy] = None,
+                   max_rows: Optional[int] = None) -> List[Dict[str, Any]]:
+        """`run_blocks` on groups already built by `pack_blocks` (which other models can share)"""
+        runs: List[Optional[Dict[str, Any]]] = [None] * len(blocks)
+        for group in packed:
+            preds, q_halt, steps, iterations = self._run_group(group.inputs, group.puzzle_ids, group.shapes,
+                                                               group.seq_len, max_steps, show_iterations,
+                                                               early_exit, max_rows)
+            self._split_group(blocks, group, runs, preds, q_halt, steps, iterations)
+        return runs
+    
+    @staticmethod
+    def _split_group(blocks: List[RowBlock], group: PackedGroup, runs: List[Optional[Dict[str, Any]]],
+                     preds: torch.Tensor, q_halt: torch.Tensor, steps: torch.Tensor, iterations: List[Any]):
+        """Fill `runs` with each block's rows of a finished group"""
+        offset = 0
+        for i in group.members:
+            n = len(blocks[i].shapes)
+            area = blocks[i].inputs.shape[-1]
+            runs[i] = {
+                'preds': preds[offset:offset + n, :area],
+                'q_halt_logits': q_halt[offset:offset + n],
+                'steps': steps[offset:offset + n],
+                'iterations': iterations[offset:offset + n]
+            }
+            offset += n
+    
+    def _run_group(self, inputs: torch.Tensor, puzzle_ids: torch.Tensor, shapes: List[Tuple[int, int]],
+                   seq_len: int, max_steps: int, show_iterations: bool = False,
+                   early_exit: Optional[EarlyExitPolicy] = None,
+                   max_rows: Optional[int] = None) -> Tuple[torch.Tensor, torch.Tensor, torch.Tensor, List[Any]]:
+        """
+        Run padded rows of one sequence length in chunks of `max_rows`, resuming from stored carries where possible
+        
+        Returns:
+            (argmax preds [n, seq_len], q_halt_logits [n], steps used [n], per-row iterations), on CPU
+        """
+        num_rows = len(shapes)
+        preds = torch.zeros(num_rows, seq_len, dtype=torch.long)
+        q_halt = torch.zeros(num_rows)
+        steps = torch.zeros(num_rows, dtype=torch.int32)
+        iterations = [[] for _ in shapes]
+        
+        # Iteration lists need every step, so those requests start over (their carries are still stored)
+        plan = self._carry_plan(inputs, puzzle_ids, seq_len, max_steps, early_exit, resume=not show_iterations)
+        for row, snapshot in plan.reused:
+            preds[row] = snapshot.preds
+            q_halt[row] = snapshot.q_halt
+            steps[row] = snapshot.steps
+        
+        for start_step, rows, snapshots in plan.runs:
+            chunk = max_rows or len(rows)
+            for start in range(0, len(rows), chunk):
+                part = rows[start:start + chunk]
+                index = torch.tensor(part)
+                batch = self._stage_batch(inputs, puzzle_ids, index)
+                run = self._recurse(batch, [shapes[row] for row in part], max_steps, show_iterations, early_exit,
+                                    model=self.model_for(seq_len),
+                                    resume=(start_step, snapshots[start:start + chunk]) if start_step else None,
+                                    carry_keys=[plan.keys[row] for row in part] if plan.keys else None)
+                preds[index] = run['logits'].argmax(dim=-1).cpu()
+                q_halt[index] = run['q_halt_logits'].float().cpu()
+                steps[index] = run['steps'].cpu()
+                for row, row_iterations in zip(part, run['iterations']):
+                    iterations[row] = row_iterations
+        return preds, q_halt, steps, iterations
+    
+    def _stage_batch(self, inputs: torch.Tensor, puzzle_ids: torch.Tensor, index: torch.Tensor) -> Dict[str, torch.Tensor]:
+        """Model batch of the rows at `index`"""
+        return {
+            'inputs': inputs[index].to(self.device),
+            'puzzle_identifiers': puzzle_ids[index, None].to(self.device)
+        }
+    
+    def _carry_plan(self, inputs: torch.Tensor, puzzle_ids: torch.Tensor, seq_len: int, max_steps: int,
+                    early_exit: Optional[EarlyExitPolicy] = None, resume: bool = True) -> CarryPlan:
+        """
+        Decide for each row whether to start fresh, resume a stored carry, or reuse a stored result
+        
+        The carry store is bypassed under an early-exit policy, whose
+        stability counters are not part of a snapshot. A snapshot past
+        `max_steps` cannot be rewound, but answers from its per-step history.
+        
+        Args:
+            inputs: Padded rows [n, seq_len]
+            puzzle_ids: Puzzle identifier per row [n]
+        """
+        rows = list(range(len(inputs)))
+        if self.carry_store is None or (early_exit is not None and early_exit.enabled):
+            return CarryPlan(keys=None, runs=[(0, rows, None)], reused=[])
+        
+        keys = [self.carry_store.key(self.carry_namespace, inputs[row], self._puzzle_key(int(puzzle_ids[row])), seq_len)
+                for row in rows]
+        fresh, resumed, reused = [], {}, []
+        for row, key in zip(rows, keys):
+            snapshot = self.carry_store.get(key) if resume else None
+            if snapshot is not None and snapshot.steps > max_steps:
+                snapshot = snapshot.prefix(max_steps)
+            if snapshot is None:
+                fresh.append(row)
+            elif snapshot.halted or snapshot.steps == max_steps:
+                reused.append((row, snapshot))
+            else:
+                resumed.setdefault(snapshot.steps, []).append((row, snapshot))
+        
+        runs = [(0, fresh, None)] if fresh else []
+        for start_step, members in sorted(resumed.items()):
+            runs.append((start_step, [row for row, _ in members], [snapshot for _, snapshot in members]))
+        return CarryPlan(keys, runs, reused)
+    
+    @staticmethod
+    def _restore_carry(carry, batch: Dict[str, torch.Tensor], snapshots: List[CarrySnapshot]):
+        """Carry continuing every row of `batch` from its snapshot"""
+        inner = carry.inner_carry
+        z_H = torch.stack([snapshot.z_H for snapshot in snapshots]).to(inner.z_H.device, inner.z_H.dtype)
+        z_L = torch.stack([snapshot.z_L for snapshot in snapshots]).to(inner.z_L.device, inner.z_L.dtype)
+        return dataclasses.replace(
+            carry,
+            inner_carry=dataclasses.replace(inner, z_H=z_H, z_L=z_L),
+            steps=torch.tensor([snapshot.steps for snapshot in snapshots], dtype=carry.steps.dtype,
+                               device=carry.steps.device),
+            halted=torch.zeros_like(carry.halted),
+            current_data={k: v.clone() for k, v in batch.items()}
+        )
+    
+    def _recurse(self, batch: Dict[str, torch.Tensor], shapes: List[Tuple[int, int]],
+                 max_steps: int, show_iterations: bool = False,
+                 early_exit: Optional[EarlyExitPolicy] = None,
+                 model: Optional[TinyRecursiveReasoningModel_ACTV1] = None,
+                 resume: Optional[Tuple[int, List[CarrySnapshot]]] = None,
+                 carry_keys: Optional[List[str]] = None) -> Dict[str, Any]:
+        """
+        Run the ACT recursion over a batch (with `self.model` unless another model is given)
+        
+        Returns:
+            Dict with final 'logits' [B, seq_len, vocab], 'q_halt_logits' [B],
+            'steps' used per row [B] and per-row 'iterations' (uint8 grid arrays)
+        """
+        iterations = [[] for _ in shapes]
+        steps = self._recurse_steps(batch, shapes, max_steps, early_exit, model,
+                                    with_preds=show_iterations, resume=resume, carry_keys=carry_keys)
+        while True:
+            try:
+                step, rows, preds = next(steps)
+            except StopIteration as stop:
+                run = stop.value
+                break
+            if show_iterations:
+                rows = rows.tolist()
+                grids = decode_grids(preds.cpu().numpy(), [shapes[row] for row in rows], as_arrays=True)
+                for row, grid in zip(rows, grids):
+                    iterations[row].append({'step': step, 'prediction': grid})
+        
+        run['iterations'] = iterations
+        return run
+    
+    def _recurse_steps(self, batch: Dict[str, torch.Tensor], shapes: List[Tuple[int, int]],
+                       max_steps: int, early_exit: Optional[EarlyExitPolicy] = None,
+                       model: Optional[TinyRecursiveReasoningModel_ACTV1] = None,
+                       with_preds: bool = False,
+                       resume: Optional[Tuple[int, List[CarrySnapshot]]] = None,
+                       carry_keys: Optional[List[str]] = None):
+        """
+        Generator running the ACT recursion one step at a time
+        
+        Rows leave the active batch as soon as they finish (model halt or
+        early-exit policy); their last logits are kept as the final output.
+        
+        With `resume=(start_step, snapshots)` every row continues from its
+        stored carry at `start_step` instead of the initial carry. With
+        `carry_keys`, each row's final carry is put in the carry store.
+        
+        Any thread may resume the generator (e.g. `InferenceExecutor.stream`
+        pulls each step on whichever worker is free): every step enters
+        no_grad and autocast on the thread running it.
+        
+        Yields:
+            (step, rows, preds) after every step, where `rows` are the original
+            row indices that were active and `preds` their argmax predictions
+            [len(rows), seq_len] (None unless `with_preds`)
+            
+        Returns:
+            Dict with final 'logits' [B, seq_len, vocab], 'q_halt_logits' [B]
+            and 'steps' used per row [B]
+        """
+        model = model or self.model
+        step_fn = self.step_for(model)
+        early_exit = early_exit or EarlyExitPolicy()
+        num_rows = len(shapes)
+        areas = torch.tensor([height * width for height, width in shapes], device=self.device)
+        
+        # Maps positions in the active batch back to original rows
+        rows = torch.arange(num_rows, device=self.device)
+        steps = torch.zeros(num_rows, dtype=torch.int32, device=self.device)
+        final_logits, final_q_halt = None, None
+        prev_preds, stable = None, None
+        start_step = resume[0] if resume is not None else 0
+        final_carries = {} if carry_keys is not None else None
+        if final_carries is not None:
+            # Per-step predictions and halt logits, so shorter requests can be answered later
+            history = torch.zeros(num_rows, max(0, max_steps - start_step), batch['inputs'].shape[1], dtype=torch.uint8)
+            q_history = torch.zeros(num_rows, max(0, max_steps - start_step))
+        
+        def keep_carries(mask: torch.Tensor):
+            # Latent state and halt flag of the masked active rows, by original row
+            for pos in mask.nonzero().flatten().tolist():
+                final_carries[int(rows[pos])] = (carry.inner_carry.z_H[pos].cpu().clone(),
+                                                 carry.inner_carry.z_L[pos].cpu().clone(),
+                                                 bool(carry.halted[pos]))
+        
+        instrumented = profiler.active
+        if instrumented:
+            profiler.attach(model)
+            seq_len = batch['inputs'].shape[1]
+        
+        # Grad mode and autocast are per-thread state, and whoever drives this generator
+        # may resume it on another thread, so every stretch between yields enters them itself
+        with self._no_grad_scope():
+            carry = model.initial_carry(batch)
+            if resume is not None:
+                carry = self._restore_carry(carry, batch, resume[1])
+        
+        for step in range(start_step, max_steps):
+            with self._no_grad_scope():
+                if instrumented:
+                    start = time.perf_counter()
+                carry, outputs = step_fn(carry, batch)
+                if instrumented:
+                    profiler.record_step(start, time.perf_counter(), len(rows),
+                                         self.step_flops(seq_len, len(rows)), self.device)
+                logits = outputs['logits']
+                q_halt = outputs['q_halt_logits']
+                
+                if final_logits is None:
+                    final_logits = logits.clone()
+                    final_q_halt = q_halt.clone()
+                elif len(rows) == num_rows:
+                    final_logits.copy_(logits)
+                    final_q_halt.copy_(q_halt)
+                else:
+                    final_logits[rows] = logits
+                    final_q_halt[rows] = q_halt
+                if len(rows) == num_rows:
+                    steps.fill_(step + 1)
+                else:
+                    steps[rows] = step + 1
+                
+                finished = carry.halted.to(self.device)
+                
+                preds = None
+                if with_preds or early_exit.stable_steps is not None or final_carries is not None:
+                    preds = logits.argmax(dim=-1)
+                if final_carries is not None:
+                    history[rows.cpu(), step - start_step] = preds.to(torch.uint8).cpu()
+                    q_history[rows.cpu(), step - start_step] = q_halt.float().cpu()
+            
+            yield step + 1, rows, preds if with_preds else None
+            
+            with self._no_grad_scope(), profiler.span('halting'):
+                if early_exit.stable_steps is not None:
+                    # Only cells inside the grid count towards stability
+                    valid = torch.arange(preds.shape[-1], device=self.device) < areas[rows, None]
+                    if prev_preds is None:
+                        stable = torch.zeros(len(rows), dtype=torch.int32, device=self.device)
+                    else:
+                        unchanged = ((preds == prev_preds) | ~valid).all(dim=-1)
+                        stable = torch.where(unchanged, stable + 1, 0)
+                    prev_preds = preds
+                    finished = finished | (stable >= early_exit.stable_steps)
+                
+                if early_exit.halt_threshold is not None:
+                    finished = finished | (torch.sigmoid(q_halt) >= early_exit.halt_threshold)
+                
+                if finished.all():
+                    break
+                
+                # Drop finished rows so they use no further compute
+                if finished.any():
+                    if final_carries is not None:
+                        keep_carries(finished)
+                    keep = ~finished
+                    rows = rows[keep]
+                    carry = _select_rows(carry, keep.to(carry.halted.device))
+                    batch = {k: v[keep] for k, v in batch.items()}
+                    if prev_preds is not None:
+                        prev_preds, stable = prev_preds[keep], stable[keep]
+        
+        if final_carries is not None:
+            with self._no_grad_scope():
+                keep_carries(torch.ones(len(rows), dtype=torch.bool))
+                for row, (z_H, z_L, halted) in final_carries.items():
+                    row_steps = int(steps[row])
+                    row_history = history[row, :row_steps - start_step]
+                    row_q_history = q_history[row, :row_steps - start_step]
+                    if resume is not None:
+                        earlier = resume[1][row]
+                        if earlier.history is None:
+                            row_history = row_q_history = None
+                        else:
+                            row_history = torch.cat([earlier.history, row_history])
+                            row_q_history = torch.cat([earlier.q_history, row_q_history])
+                    self.carry_store.put(carry_keys[row], CarrySnapshot(
+                        z_H=z_H, z_L=z_L, steps=row_steps, halted=halted,
+                        preds=final_logits[row].argmax(dim=-1).cpu(), q_halt=float(final_q_halt[row]),
+                        history=row_history.clone() if row_history is not None else None,
+                        q_history=row_q_history.clone() if row_q_history is not None else None
+                    ))
+        
+        return {
+            'logits': final_logits,
+            'q_halt_logits': final_q_halt,
+            'steps': steps.cpu()
+        }
+
+
+def default_dataset_path() -> str:
+    """Path to the ARC-AGI evaluation challenges JSON"""
+    return os.path.join(
+        os.path.dirname(__file__),
+        'TinyRecursiveModels/kaggle/combined/arc-agi_evaluation_challenges.json'
+    )
 
 
 def load_arc_task(task_id: str, dataset_path: str = None) -> Dict[str, Any]:
@@ -175,33 +972,19 @@ def load_arc_task(task_id: str, dataset_path: str = None) -> Dict[str, Any]:
     Returns:
         Task dict with 'train' and 'test'
     """
-    if dataset_path is None:
-        dataset_path = os.path.join(
-            os.path.dirname(__file__),
-            'TinyRecursiveModels/kaggle/combined/arc-agi_evaluation_challenges.json'
-        )
-    
-    with open(dataset_path, 'r') as f:
-        data = json.load(f)
+    store = get_store(dataset_path or default_dataset_path())
     
-    if task_id not in data:
+    if task_id not in store:
         raise ValueError(f"Task {task_id} not found in dataset")
     
-    return data[task_id]
+    return store.get_task(task_id)
 
 
-def get_sample_tasks(num_tasks: int = 5) -> List[Tuple[str, Dict[str, Any]]]:
+def get_sample_tasks(num_tasks: int = 5, dataset_path: str = None) -> List[Tuple[str, Dict[str, Any]]]:
     """Get sample tasks from the evaluation set"""
-    dataset_path = os.path.join(
-        os.path.dirname(__file__),
-        'TinyRecursiveModels/kaggle/combined/arc-agi_evaluation_challenges.json'
-    )
-    
-    with open(dataset_path, 'r') as f:
-        data = json.load(f)
-    
-    task_ids = list(data.keys())[:num_tasks]
-    return [(tid, data[tid]) for tid in task_ids]
+    store = get_store(dataset_path or default_dataset_path())
+    task_ids = store.task_ids[:num_tasks]
+    return [(tid, store.get_task(tid)) for tid in task_ids]
 
 
 if __name__ == "__main__":
@@ -0,0 +1,336 @@
+"""
+Opt-in instrumentation for TRM inference
+Per-step stage timings, FLOPs estimates, allocator statistics and allocation counts, exported as Prometheus text and Chrome traces
+"""
+import contextlib
+import os
+import threading
+import time
+import weakref
+from collections import defaultdict
+from typing import Dict, List, Tuple, Any, Optional
+
+import torch
+from torch import nn
+from torch.utils._python_dispatch import TorchDispatchMode
+from torch.utils._pytree import tree_flatten
+
+# Upper bounds (seconds) of the step latency histogram
+STEP_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+_NULL_SPAN = contextlib.nullcontext()
+
+
+def instrumentation_from_env() -> bool:
+    """Read TRM_INSTRUMENT (default: false)"""
+    return os.environ.get("TRM_INSTRUMENT", "false").lower() in ("1", "true", "yes")
+
+
+def allocator_stats(device: str) -> Dict[str, int]:
+    """
+    Current memory use of the device's allocator
+
+    CUDA and MPS report their caching allocators; on CPU, where PyTorch keeps
+    no allocator statistics, the process's resident and peak resident memory
+    are reported instead.
+    """
+    if device.startswith('cuda') and torch.cuda.is_available():
+        stats = torch.cuda.memory_stats(device)
+        return {
+            'allocated_bytes': stats.get('allocated_bytes.all.current', 0),
+            'peak_allocated_bytes': stats.get('allocated_bytes.all.peak', 0),
+            'reserved_bytes': stats.get('reserved_bytes.all.current', 0),
+        }
+    if device == 'mps':
+        return {
+            'allocated_bytes': torch.mps.current_allocated_memory(),
+            'reserved_bytes': torch.mps.driver_allocated_memory(),
+        }
+    stats = {}
+    try:
+        with open('/proc/self/statm') as f:
+            stats['resident_bytes'] = int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        pass
+    try:
+        import resource
+        stats['peak_resident_bytes'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    except ImportError:
+        pass
+    return stats
+
+
+class AllocationCounter(TorchDispatchMode):
+    """
+    Dispatch mode counting tensors created by the operators run inside it
+
+    An operator output counts as an allocation when its storage is not one
+    of the operator's inputs (in-place and `out=` calls, and views, do not
+    count). Only operators dispatched from Python-visible eager execution are
+    seen; compiled backends hide their internal buffers.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.tensors = 0
+        self.bytes = 0
+        self.by_op: Dict[str, int] = defaultdict(int)
+
+    def __torch_dispatch__(self, func, types, args=(), kwargs=None):
+        out = func(*args, **(kwargs or {}))
+        inputs = {t.untyped_storage().data_ptr()
+                  for t in tree_flatten((args, kwargs))[0] if isinstance(t, torch.Tensor)}
+        for t in tree_flatten(out)[0]:
+            if isinstance(t, torch.Tensor) and t.untyped_storage().data_ptr() not in inputs:
+                self.tensors += 1
+                self.bytes += t.untyped_storage().nbytes()
+                self.by_op[str(func.overloadpacket.__name__)] += 1
+        return out
+
+    def top_ops(self, n: int = 10) -> List[Tuple[str, int]]:
+        return sorted(self.by_op.items(), key=lambda item: -item[1])[:n]
+
+
+def format_metric(name: str, kind: str, help_text: str,
+                  samples: List[Tuple[Dict[str, str], float]], suffix: str = '') -> List[str]:
+    """Lines of one metric family in the Prometheus text exposition format"""
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+    for labels, value in samples:
+        label_text = ','.join(f'{k}="{v}"' for k, v in labels.items())
+        lines.append(f"{name}{suffix}{{{label_text}}} {value}" if label_text else f"{name}{suffix} {value}")
+    return lines
+
+
+class Profiler:
+    """
+    Stage timings of the recursion loop, aggregated process-wide and/or traced per request
+
+    Aggregation runs only when `enabled`; a `trace()` block turns on event
+    collection for its own thread regardless. While neither is active,
+    `span` returns a shared no-op context and the model hooks return
+    immediately, so the cost is a couple of attribute lookups per step.
+
+    Stages nest: 'step' covers the 'L_cycle', 'H_cycle' and 'heads' calls made
+    inside it. Cycle timings come from module hooks and are only seen with
+    the eager backend; compiled steps report whole 'step' times.
+    """
+
+    def __init__(self, enabled: bool = False):
+        self.enabled = enabled
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._attached = weakref.WeakSet()
+        self._epoch = time.perf_counter()
+
+        self.stage_seconds: Dict[str, float] = defaultdict(float)
+        self.stage_calls: Dict[str, int] = defaultdict(int)
+        self.step_histogram = [0] * len(STEP_BUCKETS)
+        self.steps = 0
+        self.step_seconds = 0.0
+        self.step_rows = 0
+        self.step_flops = 0
+        self.memory: Dict[str, int] = {}
+
+    @property
+    def active(self) -> bool:
+        """Whether anything is being recorded on the calling thread"""
+        if self.suspended:
+            return False
+        return self.enabled or getattr(self._local, 'events', None) is not None
+
+    @property
+    def suspended(self) -> bool:
+        """Whether the calling thread is inside a `suspend()` block"""
+        return getattr(self._local, 'suspended', False)
+
+    @contextlib.contextmanager
+    def suspend(self):
+        """Record nothing that the calling thread runs inside the block (e.g. benchmark solves)"""
+        previous = self.suspended
+        self._local.suspended = True
+        try:
+            yield
+        finally:
+            self._local.suspended = previous
+
+    def span(self, name: str, **args):
+        """Context manager timing a stage (a shared no-op when inactive)"""
+        if not self.active:
+            return _NULL_SPAN
+        return self._span(name, args)
+
+    @contextlib.contextmanager
+    def _span(self, name: str, args: Dict[str, Any]):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, start, time.perf_counter(), args)
+
+    def record(self, name: str, start: float, end: float, args: Optional[Dict[str, Any]] = None):
+        """Add a finished stage to the aggregates and to the thread's trace, if any"""
+        if self.enabled:
+            with self._lock:
+                self.stage_seconds[name] += end - start
+                self.stage_calls[name] += 1
+        events = getattr(self._local, 'events', None)
+        if events is not None:
+            events.append({
+                'name': name,
+                'ph': 'X',
+                'ts': 1e6 * (start - self._epoch),
+                'dur': 1e6 * (end - start),
+                'pid': os.getpid(),
+                'tid': threading.get_ident(),
+                'args': args or {},
+            })
+
+    def record_step(self, start: float, end: float, rows: int, flops: int, device: str):
+        """Record one recursion step over `rows` active rows, with its FLOPs estimate and memory use"""
+        memory = allocator_stats(device)
+        if self.enabled:
+            seconds = end - start
+            with self._lock:
+                self.steps += 1
+                self.step_seconds += seconds
+                self.step_rows += rows
+                self.step_flops += flops
+                self.memory = memory
+                for i, bound in enumerate(STEP_BUCKETS):
+                    if seconds <= bound:
+                        self.step_histogram[i] += 1
+                        break
+        self.record('step', start, end, {'rows': rows, 'flops': flops, **memory})
+
+    @contextlib.contextmanager
+    def trace(self):
+        """
+        Collect Chrome trace events for everything this thread runs inside the block
+
+        Yields the event list; wrap it as {'traceEvents': events} to load it
+        in chrome://tracing or Perfetto.
+        """
+        events: List[Dict[str, Any]] = []
+        previous = getattr(self._local, 'events', None)
+        self._local.events = events
+        try:
+            yield events
+        finally:
+            self._local.events = previous
+
+    def attach(self, model: nn.Module):
+        """Register timing hooks on an ACT model's reasoning modules and heads (once per model)"""
+        if model in self._attached:
+            return
+        self._attached.add(model)
+        inner = model.inner
+        # Models without an H_level reuse L_level for the z_H update: every (L_cycles + 1)th call
+        period = inner.config.L_cycles + 1
+
+        def reset_calls(module, args):
+            self._local.level_calls = 0
+        inner.register_forward_pre_hook(reset_calls)
+
+        def cycle_stage(module_name: str) -> str:
+            if module_name != 'L_level':
+                return 'H_cycle'
+            calls = getattr(self._local, 'level_calls', 0)
+            self._local.level_calls = calls + 1
+            return 'H_cycle' if calls % period == period - 1 and not hasattr(inner, 'H_level') else 'L_cycle'
+
+        for module_name in ('L_level', 'H_level', 'lm_head', 'q_head'):
+            module = getattr(inner, module_name, None)
+            if module is None:
+                continue
+            stage = 'heads' if module_name.endswith('_head') else None
+            module.register_forward_pre_hook(self._start_hook)
+            module.register_forward_hook(
+                lambda m, args, output, module_name=module_name, stage=stage:
+                    self._end_hook(stage or cycle_stage(module_name))
+            )
+
+    def _start_hook(self, module, args):
+        if self.active:
+            self._local.__dict__.setdefault('starts', []).append(time.perf_counter())
+
+    def _end_hook(self, stage: str):
+        starts = getattr(self._local, 'starts', None)
+        if self.active and starts:
+            self.record(stage, starts.pop(), time.perf_counter())
+
+    def reset(self):
+        """Drop all aggregates"""
+        with self._lock:
+            self.stage_seconds.clear()
+            self.stage_calls.clear()
+            self.step_histogram = [0] * len(STEP_BUCKETS)
+            self.steps = 0
+            self.step_seconds = 0.0
+            self.step_rows = 0
+            self.step_flops = 0
+            self.memory = {}
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Copy of the aggregates, e.g. to send to another process"""
+        with self._lock:
+            return {
+                'stage_seconds': dict(self.stage_seconds),
+                'stage_calls': dict(self.stage_calls),
+                'step_histogram': list(self.step_histogram),
+                'steps': self.steps,
+                'step_seconds': self.step_seconds,
+                'step_rows': self.step_rows,
+                'step_flops': self.step_flops,
+                'memory': dict(self.memory),
+            }
+
+    def prometheus(self, replicas: Optional[Dict[int, Dict[str, Any]]] = None) -> List[str]:
+        """
+        Aggregates in the Prometheus text exposition format, one line per list item
+
+        Args:
+            replicas: `snapshot()` of each replica process by index; their
+                counters are added to this process's, and their allocator
+                statistics are reported with a 'replica' label
+        """
+        totals = self.snapshot()
+        stage_seconds, stage_calls = defaultdict(float, totals['stage_seconds']), defaultdict(int, totals['stage_calls'])
+        memory = [({'kind': k}, v) for k, v in sorted(totals['memory'].items())]
+        for index, other in sorted((replicas or {}).items()):
+            for stage, seconds in other['stage_seconds'].items():
+                stage_seconds[stage] += seconds
+            for stage, calls in other['stage_calls'].items():
+                stage_calls[stage] += calls
+            totals['step_histogram'] = [a + b for a, b in zip(totals['step_histogram'], other['step_histogram'])]
+            for key in ('steps', 'step_seconds', 'step_rows', 'step_flops'):
+                totals[key] += other[key]
+            memory += [({'kind': k, 'replica': str(index)}, v) for k, v in sorted(other['memory'].items())]
+
+        lines = format_metric('trm_instrumentation_enabled', 'gauge',
+                              "Whether per-step instrumentation is aggregating (TRM_INSTRUMENT)",
+                              [({}, int(self.enabled))])
+        lines += format_metric('trm_stage_seconds_total', 'counter',
+                               "Wall time per inference stage (stages nest inside 'step')",
+                               [({'stage': s}, v) for s, v in sorted(stage_seconds.items())])
+        lines += format_metric('trm_stage_calls_total', 'counter', "Calls per inference stage",
+                               [({'stage': s}, v) for s, v in sorted(stage_calls.items())])
+
+        cumulative, buckets = 0, []
+        for bound, count in zip(STEP_BUCKETS, totals['step_histogram']):
+            cumulative += count
+            buckets.append(({'le': str(bound)}, cumulative))
+        buckets.append(({'le': '+Inf'}, totals['steps']))
+        lines += format_metric('trm_step_seconds', 'histogram', "Wall time of one recursion step", buckets, '_bucket')
+        lines.append(f"trm_step_seconds_sum {totals['step_seconds']}")
+        lines.append(f"trm_step_seconds_count {totals['steps']}")
+
+        lines += format_metric('trm_step_rows_total', 'counter', "Active rows summed over recursion steps",
+                               [({}, totals['step_rows'])])
+        lines += format_metric('trm_step_flops_total', 'counter', "Estimated forward FLOPs of recursion steps",
+                               [({}, totals['step_flops'])])
+        lines += format_metric('trm_memory_bytes', 'gauge', "Allocator statistics at the last recorded step", memory)
+        return lines
+
+
+# Process-wide profiler used by TRMInference and the API
+profiler = Profiler(instrumentation_from_env())
@@ -0,0 +1,166 @@
+"""
+Numeric precision modes for TRM inference
+fp32 (reference), bf16 autocast, and dynamic int8 quantization of the reasoning blocks' linear layers
+"""
+import contextlib
+import os
+import time
+from typing import Dict, List, Any
+
+import torch
+from torch import nn
+
+PRECISIONS = ('fp32', 'bf16', 'int8')
+
+# Submodules of the inner model whose linear layers are quantized in int8 mode
+QUANTIZED_BLOCKS = ('L_level', 'H_level')
+
+
+def precision_from_env() -> str:
+    """Read TRM_PRECISION (default: fp32)"""
+    precision = os.environ.get("TRM_PRECISION", "fp32").lower()
+    if precision not in PRECISIONS:
+        raise ValueError(f"Unknown TRM_PRECISION: {precision} (expected one of {', '.join(PRECISIONS)})")
+    return precision
+
+
+class DynamicInt8Linear(nn.Module):
+    """
+    Linear layer with per-channel int8 weights and dynamically quantized activations
+
+    Runs on the fbgemm/x86 quantized kernels (VNNI/AMX where available).
+    The weight is kept only in packed form; `state_dict` unpacks it, so
+    models using this layer can still share weights through state dicts.
+    """
+
+    def __init__(self, weight: torch.Tensor, bias: torch.Tensor = None):
+        super().__init__()
+        self.in_features, self.out_features = weight.shape[1], weight.shape[0]
+        self._pack(self.quantize_weight(weight), bias)
+
+    @staticmethod
+    def quantize_weight(weight: torch.Tensor) -> torch.Tensor:
+        """Symmetric per-output-channel qint8 quantization"""
+        weight = weight.detach().float()
+        scales = (weight.abs().amax(dim=1) / 127.0).clamp(min=1e-8).double()
+        zero_points = torch.zeros(weight.shape[0], dtype=torch.long)
+        return torch.quantize_per_channel(weight, scales, zero_points, 0, torch.qint8)
+
+    def _pack(self, qweight: torch.Tensor, bias: torch.Tensor = None):
+        bias = bias.detach().float() if bias is not None else None
+        self._packed = torch.ops.quantized.linear_prepack(qweight, bias)
+
+    @classmethod
+    def from_linear(cls, linear: nn.Module) -> "DynamicInt8Linear":
+        return cls(linear.weight, linear.bias)
+
+    def forward(self, input: torch.Tensor) -> torch.Tensor:
+        output = torch.ops.quantized.linear_dynamic(input.float(), self._packed)
+        return output.to(input.dtype)
+
+    def _save_to_state_dict(self, destination, prefix, keep_vars):
+        qweight, bias = torch.ops.quantized.linear_unpack(self._packed)
+        destination[prefix + 'weight'] = qweight
+        if bias is not None:
+            destination[prefix + 'bias'] = bias
+
+    def _load_from_state_dict(self, state_dict, prefix, local_metadata, strict,
+                              missing_keys, unexpected_keys, error_msgs):
+        if prefix + 'weight' not in state_dict:
+            missing_keys.append(prefix + 'weight')
+            return
+        weight = state_dict[prefix + 'weight']
+        if not weight.is_quantized:
+            weight = self.quantize_weight(weight)
+        self._pack(weight, state_dict.get(prefix + 'bias'))
+
+    def extra_repr(self) -> str:
+        return f"in_features={self.in_features}, out_features={self.out_features}, dtype=qint8"
+
+
+def quantize_blocks(model: nn.Module) -> int:
+    """
+    Replace the linear layers of the ACT model's reasoning blocks with DynamicInt8Linear, in place
+
+    Embeddings, the LM head and the Q head stay in fp32.
+
+    Returns:
+        Number of layers replaced
+    """
+    from models.layers import CastedLinear
+    replaced = 0
+    for block_name in QUANTIZED_BLOCKS:
+        block = getattr(model.inner, block_name, None)
+        if block is None:
+            continue
+        for name, module in list(block.named_modules()):
+            if isinstance(module, (nn.Linear, CastedLinear)):
+                parent_name, _, attr = name.rpartition('.')
+                setattr(block.get_submodule(parent_name), attr, DynamicInt8Linear.from_linear(module))
+                replaced += 1
+    return replaced
+
+
+def autocast(precision: str, device: str = 'cpu'):
+    """Context manager for running model steps at the given precision on `device` ('cpu', 'mps', ...)"""
+    if precision == 'bf16':
+        return torch.autocast(device_type=torch.device(device).type, dtype=torch.bfloat16)
+    return contextlib.nullcontext()
+
+
+def weight_bytes(model: nn.Module) -> int:
+    """Bytes held by the model's parameters, buffers and packed int8 weights"""
+    total = sum(t.numel() * t.element_size() for t in model.parameters())
+    total += sum(t.numel() * t.element_size() for t in model.buffers())
+    for module in model.modules():
+        if isinstance(module, DynamicInt8Linear):
+            qweight, bias = torch.ops.quantized.linear_unpack(module._packed)
+            total += qweight.numel() + (bias.numel() * 4 if bias is not None else 0)
+    return total
+
+
+def compare_precisions(reference, models: Dict[str, Any], tasks: List[Dict[str, Any]],
+                       max_steps: int = 16, repeats: int = 1) -> List[Dict[str, Any]]:
+    """
+    Accuracy parity, latency and memory of precision modes against fp32
+
+    Args:
+        reference: fp32 TRMInference
+        models: TRMInference per precision, built from the same weights
+        tasks: ARC-AGI task dicts (e.g. the evaluation challenges)
+        max_steps: Recursion steps per task
+        repeats: Timed runs per mode (best is reported)
+
+    Returns:
+        One dict per mode with 'exact_match' (share of test inputs whose whole
+        predicted grid equals fp32's), 'cell_match' (share of equal cells),
+        'seconds', 'speedup' over fp32 and 'weight_mb'
+    """
+    def run(model):
+        best, results = float('inf'), None
+        for _ in range(repeats):
+            start = time.perf_counter()
+            results = model.solve_batch(tasks, max_steps=max_steps)
+            best = min(best, time.perf_counter() - start)
+        return [p['prediction'] for r in results for p in r['predictions']], best
+
+    reference_preds, reference_s = run(reference)
+    report = []
+    for precision, model in models.items():
+        preds, seconds = run(model) if model is not reference else (reference_preds, reference_s)
+        cells = equal = exact = 0
+        for a, b in zip(reference_preds, preds):
+            flat_a = [v for row in a for v in row]
+            flat_b = [v for row in b for v in row]
+            cells += len(flat_a)
+            equal += sum(x == y for x, y in zip(flat_a, flat_b))
+            exact += a == b
+        report.append({
+            'precision': precision,
+            'exact_match': exact / max(1, len(reference_preds)),
+            'cell_match': equal / max(1, cells),
+            'seconds': seconds,
+            'speedup': reference_s / seconds,
+            'weight_mb': weight_bytes(model.model) / 2 ** 20,
+        })
+    return report
@@ -0,0 +1,353 @@
+"""
+Multi-process model replicas for TRM inference
+Starts N worker processes pinned to disjoint core sets, all mapping one shared-memory copy of the weights
+"""
+import itertools
+import os
+import pickle
+import queue
+import threading
+import time
+from dataclasses import dataclass, asdict
+from typing import Dict, List, Set, Any, Optional, Iterator
+
+import torch
+import torch.multiprocessing as mp
+
+from fast_start import model_tensors
+from instrumentation import profiler
+
+
+@dataclass
+class ReplicaConfig:
+    """Replica serving settings"""
+    replicas: int = 0                         # Worker processes (0 serves from the API process)
+    cores_per_replica: Optional[int] = None   # Cores pinned to each worker (default: split evenly)
+
+    @classmethod
+    def from_env(cls) -> "ReplicaConfig":
+        """Read TRM_REPLICAS and TRM_REPLICA_CORES"""
+        cores = os.environ.get("TRM_REPLICA_CORES")
+        return cls(
+            replicas=int(os.environ.get("TRM_REPLICAS", cls.replicas)),
+            cores_per_replica=int(cores) if cores else None,
+        )
+
+
+class ReplicaError(RuntimeError):
+    """Raised when a replica process dies or cannot run a job"""
+
+
+# Messages after which a replica is done with a job
+_FINAL_MESSAGES = ('result', 'end', 'error')
+
+
+def core_sets(replicas: int, cores_per_replica: Optional[int] = None) -> List[List[int]]:
+    """
+    Split the cores this process may use into one contiguous set per replica
+
+    With more replicas than cores, sets wrap around and cores are shared.
+    """
+    cores = sorted(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else list(range(os.cpu_count() or 1))
+    per = cores_per_replica or max(1, len(cores) // replicas)
+    return [[cores[(i * per + j) % len(cores)] for j in range(per)] for i in range(replicas)]
+
+
+def _picklable(error: BaseException) -> BaseException:
+    try:
+        pickle.dumps(error)
+        return error
+    except Exception:
+        return ReplicaError(f"{type(error).__name__}: {error}")
+
+
+def _replica_main(index: int, cores: List[int], device: str, checkpoint_path: Optional[str],
+                  backend: str, precision: str, weights: Optional[Dict[str, torch.Tensor]], jobs, results):
+    """
+    Worker process: pin to `cores`, wrap the shared weights, and serve jobs until a None arrives
+
+    With instrumentation enabled, a snapshot of the worker's profiler follows
+    each job (ahead of its last message), so the parent can export step
+    metrics for all replicas.
+    """
+    if hasattr(os, 'sched_setaffinity'):
+        os.sched_setaffinity(0, cores)
+    torch.set_num_threads(len(cores))
+
+    from inference import TRMInference
+    model = TRMInference(checkpoint_path=checkpoint_path, device=device, weights=weights,
+                         backend=backend, precision=precision)
+    results.put((None, 'ready', index))
+
+    while True:
+        job = jobs.get()
+        if job is None:
+            return
+        job_id, method, args, kwargs = job
+        try:
+            result = getattr(model, method)(*args, **kwargs)
+            if isinstance(result, Iterator):
+                for item in result:
+                    results.put((job_id, 'item', item))
+                message = (job_id, 'end', None)
+            else:
+                message = (job_id, 'result', result)
+        except Exception as e:
+            message = (job_id, 'error', _picklable(e))
+        if profiler.enabled:
+            results.put((None, 'profile', (index, profiler.snapshot())))
+        results.put(message)
+
+
+class ReplicaPool:
+    """
+    Front-end dispatcher over a set of model replica processes
+
+    The parent's parameters are moved into shared memory once and handed to
+    every worker, which adopts them without copying, so resident memory grows
+    only by each process's activations and interpreter. Jobs go to the
+    replica with the fewest outstanding jobs, among those that have finished
+    starting. A replica process that dies has its jobs failed with
+    ReplicaError and is started again on the next dispatch.
+    """
+
+    def __init__(self, model, config: Optional[ReplicaConfig] = None):
+        """
+        Args:
+            model: Loaded TRMInference whose weights the replicas share
+            config: Replica settings (defaults to environment settings)
+        """
+        self.config = config or ReplicaConfig.from_env()
+        if self.config.replicas < 1:
+            raise ValueError("ReplicaPool needs at least one replica")
+        self.model = model
+        self.cores = core_sets(self.config.replicas, self.config.cores_per_replica)
+
+        if model.precision == 'int8':
+            # Packed int8 weights cannot be shared; each replica quantizes its own copy
+            if not model.checkpoint_loaded:
+                raise ValueError("int8 replicas need a checkpoint to load their weights from")
+            weights = None
+        else:
+            model.model.share_memory()
+            weights = model_tensors(model.model)
+
+        self._context = mp.get_context('spawn')
+        self._weights = weights
+        self._jobs: List[Any] = [None] * self.config.replicas
+        # One results queue per process: a replica killed mid-put can leave its queue locked or torn
+        self._results: List[Any] = [None] * self.config.replicas
+        self._processes: List[Any] = [None] * self.config.replicas
+
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+        self._closed = False
+        # Replicas still building their model; jobs go to ready ones while there are any
+        self._starting: Set[int] = set(range(self.config.replicas))
+        self.restarts = [0] * self.config.replicas
+        self._waiting: Dict[int, queue.Queue] = {}
+        self._owner: Dict[int, int] = {}
+        self._abandoned: Set[int] = set()
+        self.outstanding = [0] * self.config.replicas
+        self.completed = [0] * self.config.replicas
+        self._ready = threading.Event()
+        self._num_ready = 0
+        # Latest profiler snapshot of each replica (sent after each job when instrumented)
+        self.profiles: Dict[int, Dict[str, Any]] = {}
+        for i in range(self.config.replicas):
+            self._spawn(i)
+
+    def _spawn(self, index: int):
+        """Start replica `index` with fresh job and results queues, and a thread reading its results"""
+        model = self.model
+        self._jobs[index] = self._context.Queue()
+        self._results[index] = self._context.Queue()
+        self._processes[index] = self._context.Process(
+            target=_replica_main,
+            args=(index, self.cores[index], model.device, model.checkpoint_path, model.backend, model.precision,
+                  self._weights, self._jobs[index], self._results[index]),
+            name=f"trm-replica-{index}",
+            daemon=True
+        )
+        self._processes[index].start()
+        threading.Thread(target=self._read_results, args=(index, self._results[index]),
+                         name=f"trm-replica-results-{index}", daemon=True).start()
+
+    def _revive_locked(self):
+        """Fail the jobs of replicas that died and start new processes in their place"""
+        if self._closed:
+            return
+        for index, process in enumerate(self._processes):
+            if process.is_alive():
+                continue
+            error = ReplicaError(f"{process.name} exited with code {process.exitcode}")
+            for job_id, owner in list(self._owner.items()):
+                if owner != index:
+                    continue
+                if job_id in self._abandoned:
+                    self._abandoned.discard(job_id)
+                    self._finish_locked(job_id)
+                else:
+                    self._waiting[job_id].put(('error', error))
+            self._spawn(index)
+            self._starting.add(index)
+            self.restarts[index] += 1
+
+    def wait_ready(self, timeout: Optional[float] = None) -> bool:
+        """Block until every replica has built its model (raises ReplicaError if one exits first)"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not self._ready.wait(0.5):
+            for process in self._processes:
+                if not process.is_alive():
+                    raise ReplicaError(f"{process.name} exited with code {process.exitcode} during startup")
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+        return True
+
+    def _read_results(self, index: int, results):
+        """Route one process's messages to their jobs, until the pool closes or the process is replaced"""
+        while not self._closed and self._results[index] is results:
+            try:
+                message = results.get(timeout=1.0)
+            except queue.Empty:
+                continue
+            job_id, kind, payload = message
+            if kind == 'ready':
+                with self._lock:
+                    self._starting.discard(index)
+                self._num_ready += 1
+                if self._num_ready >= self.config.replicas:
+                    self._ready.set()
+                continue
+            if kind == 'profile':
+                index, snapshot = payload
+                self.profiles[index] = snapshot
+                continue
+            with self._lock:
+                if job_id in self._abandoned:
+                    # Nobody reads this job any more; it stops counting once the replica is done with it
+                    if kind in _FINAL_MESSAGES:
+                        self._abandoned.discard(job_id)
+                        self._finish_locked(job_id)
+                    continue
+                waiting = self._waiting.get(job_id)
+                if waiting is not None:
+                    waiting.put((kind, payload))
+
+    def _submit(self, method: str, args: tuple, kwargs: Dict[str, Any]) -> int:
+        with self._lock:
+            self._revive_locked()
+            ready = [i for i in range(self.config.replicas) if i not in self._starting]
+            replica = min(ready or range(self.config.replicas), key=self.outstanding.__getitem__)
+            job_id = next(self._ids)
+            self._waiting[job_id] = queue.Queue()
+            self._owner[job_id] = replica
+            self.outstanding[replica] += 1
+        self._jobs[replica].put((job_id, method, args, kwargs))
+        return job_id
+
+    def _finish(self, job_id: int):
+        with self._lock:
+            self._finish_locked(job_id)
+
+    def _finish_locked(self, job_id: int):
+        replica = self._owner.pop(job_id)
+        self._waiting.pop(job_id, None)
+        self.outstanding[replica] -= 1
+        self.completed[replica] += 1
+
+    def _abandon(self, job_id: int):
+        """Drop a job whose consumer stopped early, keeping it counted until its replica is done"""
+        with self._lock:
+            waiting = self._waiting.pop(job_id)
+            while not waiting.empty():
+                if waiting.get_nowait()[0] in _FINAL_MESSAGES:
+                    self._finish_locked(job_id)
+                    return
+            self._abandoned.add(job_id)
+
+    def _next_message(self, job_id: int):
+        waiting = self._waiting[job_id]
+        while True:
+            try:
+                return waiting.get(timeout=1.0)
+            except queue.Empty:
+                # A dead replica gets its jobs failed (this one included) and is restarted
+                with self._lock:
+                    self._revive_locked()
+
+    def call(self, method: str, *args, **kwargs) -> Any:
+        """Run `TRMInference.<method>(*args, **kwargs)` on the least-loaded replica and wait"""
+        job_id = self._submit(method, args, kwargs)
+        try:
+            kind, payload = self._next_message(job_id)
+            if kind == 'error':
+                raise payload
+            return payload
+        finally:
+            self._finish(job_id)
+
+    def iterate(self, method: str, *args, **kwargs) -> Iterator[Any]:
+        """
+        Like `call` for methods returning iterators; items are yielded as the replica produces them
+
+        A consumer stopping early (e.g. a client disconnecting) does not stop
+        the replica, so the job keeps counting towards its load until the
+        replica reports the end.
+        """
+        job_id = self._submit(method, args, kwargs)
+        done = False
+        try:
+            while True:
+                kind, payload = self._next_message(job_id)
+                if kind in _FINAL_MESSAGES:
+                    done = True
+                if kind == 'end':
+                    return
+                if kind == 'error':
+                    raise payload
+                yield payload
+        finally:
+            if done:
+                self._finish(job_id)
+            else:
+                self._abandon(job_id)
+
+    def solve_batch(self, tasks: List[Dict[str, Any]], **options) -> List[Dict[str, Any]]:
+        """Same as `TRMInference.solve_batch`, run on a replica"""
+        return self.call('solve_batch', tasks, **options)
+
+    def solve_stream(self, task: Dict[str, Any], **options) -> Iterator[Dict[str, Any]]:
+        """Same as `TRMInference.solve_stream`, run on a replica"""
+        return self.iterate('solve_stream', task, **options)
+
+    def close(self, timeout: float = 5.0):
+        """Stop the worker processes"""
+        with self._lock:
+            self._closed = True
+        for jobs in self._jobs:
+            jobs.put(None)
+        for process in self._processes:
+            process.join(timeout)
+            if process.is_alive():
+                process.terminate()
+
+    def stats(self) -> Dict[str, Any]:
+        """Configuration, placement and per-replica load"""
+        return {
+            'config': asdict(self.config),
+            'ready': self._ready.is_set(),
+            'replicas': [
+                {
+                    'pid': process.pid,
+                    'alive': process.is_alive(),
+                    'cores': cores,
+                    'outstanding': outstanding,
+                    'completed': completed,
+                    'restarts': restarts,
+                    'starting': index in self._starting,
+                }
+                for index, (process, cores, outstanding, completed, restarts)
+                in enumerate(zip(self._processes, self.cores, self.outstanding, self.completed, self.restarts))
+            ],
+        }
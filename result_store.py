@@ -0,0 +1,510 @@
+#!/usr/bin/env python3
+"""
+Append-only store of solve results
+Packs predictions, attempts and step-by-step iteration traces into a binary log indexed by task id, checkpoint and time
+"""
+import argparse
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+from typing import Dict, List, Any, Optional, Iterator
+
+import numpy as np
+
+from codec import dumps, pack_cells, unpack_cells
+
+_LOG_MAGIC = b'TRMR'
+_LOG_VERSION = 1
+_LOG_HEADER = len(_LOG_MAGIC) + 1
+
+# One row per appended solve; `task` and `checkpoint` index the string table
+INDEX_DTYPE = np.dtype([
+    ('offset', '<u8'),       # Start of the record in results.log
+    ('length', '<u4'),       # Record size in bytes
+    ('timestamp', '<f8'),    # Unix time of the solve
+    ('task', '<u4'),
+    ('checkpoint', '<u4'),
+    ('tests', '<u2'),        # Predictions in the record
+    ('max_steps', '<u2'),    # Requested steps (0 when not given)
+    ('iterations', '<u1'),   # Whether the record holds iteration traces
+])
+
+# Per-prediction flags
+_HAS_ATTEMPTS = 1
+_HAS_ITERATIONS = 2
+_TRACE_ENDS_AT_FINAL = 4       # The last iteration is the final grid (not stored again)
+_EXPLICIT_STEPS = 8            # Iteration step numbers are listed (otherwise consecutive from the first)
+
+# Keys stored in binary form; anything else on a prediction goes to the record's JSON header
+_GRID_KEYS = ('prediction', 'steps', 'attempts', 'iterations')
+
+
+def _pack_grid(parts: List[bytes], grid: np.ndarray):
+    parts.append(struct.pack('<BB', *grid.shape))
+    parts.append(pack_cells(grid))
+
+
+def _pack_trace(grids: np.ndarray) -> bytes:
+    """
+    Deltas from each iteration back to the one before it, as columns over all steps
+
+    `grids` is [steps, cells]. The last grid is the anchor (stored
+    elsewhere); step j's delta holds the cells where iteration j differs
+    from j + 1 and their values at j. Layout: changed-cell count per delta
+    (u16), position bitmaps of the deltas where a bitmap is smaller than a
+    u16 index per changed cell, u16 positions of the other deltas, then all
+    old values 4-bit packed.
+    """
+    changed = grids[:-1] != grids[1:]
+    counts = changed.sum(axis=1)
+    bitmap = 2 * counts > (grids.shape[1] + 7) // 8
+    return b''.join([
+        counts.astype('<u2').tobytes(),
+        np.packbits(changed[bitmap], axis=1).tobytes(),
+        (np.flatnonzero(changed[~bitmap]) % grids.shape[1]).astype('<u2').tobytes(),
+        pack_cells(grids[:-1][changed]),
+    ])
+
+
+def _unpack_trace(data, offset: int, anchor: np.ndarray, count: int) -> List[np.ndarray]:
+    size = anchor.size
+    bitmap_size = (size + 7) // 8
+    counts = np.frombuffer(data, dtype='<u2', count=count - 1, offset=offset).astype(np.int64)
+    offset += 2 * (count - 1)
+    bitmap = 2 * counts > bitmap_size
+    changed = np.zeros((count - 1, size), dtype=bool)
+    num_bitmaps = int(bitmap.sum())
+    if num_bitmaps:
+        bits = np.frombuffer(data, dtype=np.uint8, count=num_bitmaps * bitmap_size, offset=offset)
+        changed[bitmap] = np.unpackbits(bits.reshape(num_bitmaps, bitmap_size), axis=1)[:, :size]
+        offset += num_bitmaps * bitmap_size
+    num_positions = int(counts[~bitmap].sum())
+    positions = np.frombuffer(data, dtype='<u2', count=num_positions, offset=offset)
+    offset += 2 * num_positions
+    changed[np.repeat(np.flatnonzero(~bitmap), counts[~bitmap]), positions] = True
+    values = unpack_cells(data, int(counts.sum()), offset)
+
+    grids = np.empty((count, size), dtype=np.uint8)
+    grids[-1] = anchor.ravel()
+    ends = np.cumsum(counts)
+    for j in range(count - 2, -1, -1):
+        grids[j] = grids[j + 1]
+        grids[j, changed[j]] = values[ends[j] - counts[j]:ends[j]]
+    return list(grids.reshape(count, *anchor.shape))
+
+
+def pack_record(results: Dict[str, Any], header: Dict[str, Any]) -> bytes:
+    """
+    Binary encoding of one solve result (as returned by `solve`/`solve_batch`)
+
+    Layout (little-endian): header length u32 and JSON header (options, the
+    'tta'/'ensemble' reports and non-grid prediction fields), prediction
+    count u16, then per prediction: flags u8, steps u16, the final grid,
+    attempt count u8 plus grids, and the iteration trace (byte length u32,
+    iteration count u16, first step u16 or every step, the last iteration's
+    cells unless it is the final grid, then `_pack_trace`). A grid is height
+    u8, width u8 and its cells packed two per byte. Grids may be nested
+    lists or numpy arrays.
+    """
+    predictions = results['predictions']
+    header = dict(header)
+    for name in ('tta', 'ensemble'):
+        if results.get(name) is not None:
+            header[name] = results[name]
+    extras = [{k: v for k, v in prediction.items() if k not in _GRID_KEYS} for prediction in predictions]
+    if any(extras):
+        header['extras'] = extras
+    header_bytes = dumps(header)
+
+    parts = [struct.pack('<I', len(header_bytes)), header_bytes, struct.pack('<H', len(predictions))]
+    for prediction in predictions:
+        final = np.asarray(prediction['prediction'], dtype=np.uint8)
+        attempts = prediction.get('attempts') or []
+        iterations = prediction.get('iterations') or []
+
+        flags = 0
+        if attempts:
+            flags |= _HAS_ATTEMPTS
+        if iterations:
+            flags |= _HAS_ITERATIONS
+            steps = [it['step'] for it in iterations]
+            grids = np.stack([np.asarray(it['prediction'], dtype=np.uint8) for it in iterations])
+            if grids.shape[1:] != final.shape:
+                raise ValueError("Iteration grids must have the final prediction's shape")
+            grids = grids.reshape(len(grids), -1)
+            if np.array_equal(grids[-1], final.ravel()):
+                flags |= _TRACE_ENDS_AT_FINAL
+            if steps != list(range(steps[0], steps[0] + len(steps))):
+                flags |= _EXPLICIT_STEPS
+        parts.append(struct.pack('<BH', flags, prediction['steps']))
+        _pack_grid(parts, final)
+        if attempts:
+            parts.append(struct.pack('<B', len(attempts)))
+            for attempt in attempts:
+                _pack_grid(parts, np.asarray(attempt, dtype=np.uint8))
+        if iterations:
+            trace = [struct.pack('<H', len(steps))]
+            if flags & _EXPLICIT_STEPS:
+                trace.append(struct.pack(f'<{len(steps)}H', *steps))
+            else:
+                trace.append(struct.pack('<H', steps[0]))
+            if not flags & _TRACE_ENDS_AT_FINAL:
+                trace.append(pack_cells(grids[-1]))
+            trace.append(_pack_trace(grids))
+            trace = b''.join(trace)
+            parts.append(struct.pack('<I', len(trace)))
+            parts.append(trace)
+    return b''.join(parts)
+
+
+def unpack_record(data, offset: int = 0, iterations: bool = True, as_lists: bool = False) -> Dict[str, Any]:
+    """
+    Decode a `pack_record` record starting at `offset` of `data`
+
+    Args:
+        iterations: Decode iteration traces (skipping them reads only the final grids and attempts)
+        as_lists: Nested lists instead of uint8 [height, width] arrays
+
+    Returns:
+        Dict with 'predictions' in `solve` format, plus the header fields
+    """
+    header_size, = struct.unpack_from('<I', data, offset)
+    offset += 4
+    header = json.loads(data[offset:offset + header_size])
+    offset += header_size
+    count, = struct.unpack_from('<H', data, offset)
+    offset += 2
+
+    def grid():
+        nonlocal offset
+        height, width = struct.unpack_from('<BB', data, offset)
+        offset += 2
+        cells = unpack_cells(data, height * width, offset).reshape(height, width)
+        offset += (height * width + 1) // 2
+        return cells
+
+    convert = (lambda g: g.tolist()) if as_lists else (lambda g: g)
+    extras = header.pop('extras', None) or [{}] * count
+    predictions = []
+    for extra in extras:
+        flags, steps = struct.unpack_from('<BH', data, offset)
+        offset += 3
+        final = grid()
+        prediction = {'prediction': convert(final), 'steps': steps}
+        if flags & _HAS_ATTEMPTS:
+            num_attempts, = struct.unpack_from('<B', data, offset)
+            offset += 1
+            prediction['attempts'] = [convert(grid()) for _ in range(num_attempts)]
+        if flags & _HAS_ITERATIONS:
+            trace_size, = struct.unpack_from('<I', data, offset)
+            offset += 4
+            end = offset + trace_size
+            if iterations:
+                num_iterations, = struct.unpack_from('<H', data, offset)
+                offset += 2
+                if flags & _EXPLICIT_STEPS:
+                    step_numbers = struct.unpack_from(f'<{num_iterations}H', data, offset)
+                    offset += 2 * num_iterations
+                else:
+                    first, = struct.unpack_from('<H', data, offset)
+                    step_numbers = range(first, first + num_iterations)
+                    offset += 2
+                anchor = final
+                if not flags & _TRACE_ENDS_AT_FINAL:
+                    anchor = unpack_cells(data, final.size, offset).reshape(final.shape)
+                    offset += (final.size + 1) // 2
+                grids = _unpack_trace(data, offset, anchor, num_iterations)
+                prediction['iterations'] = [{'step': step, 'prediction': convert(g)}
+                                            for step, g in zip(step_numbers, grids)]
+            offset = end
+        prediction.update(extra)
+        predictions.append(prediction)
+    header['predictions'] = predictions
+    return header
+
+
+class ResultStore:
+    """
+    Writer for a result store directory
+
+    Layout:
+        results.log   b'TRMR', version u8, then `pack_record` records back to back
+        index.bin     one `INDEX_DTYPE` row per record
+        strings.txt   task ids and checkpoint fingerprints, one JSON string per line
+
+    Each append writes the record, then any new strings, then its index
+    row, so a crash at any point leaves at most a tail that the next open
+    truncates. One process writes a store at a time; any number may read it
+    (see `ResultReader`).
+    """
+
+    def __init__(self, store_dir: str):
+        """
+        Args:
+            store_dir: Directory of the store (created if missing)
+        """
+        self.store_dir = store_dir
+        os.makedirs(store_dir, exist_ok=True)
+        # Inference threads share the store
+        self._lock = threading.Lock()
+        self._recover()
+        self._strings = {value: i for i, value in enumerate(_read_strings(store_dir))}
+        self._log = open(os.path.join(store_dir, 'results.log'), 'ab')
+        self._index = open(os.path.join(store_dir, 'index.bin'), 'ab')
+        self._strings_file = open(os.path.join(store_dir, 'strings.txt'), 'a')
+        self._offset = self._log.tell()
+        self.records = os.path.getsize(os.path.join(store_dir, 'index.bin')) // INDEX_DTYPE.itemsize
+
+        self.appended = 0
+        self.bytes_written = 0
+        self.seconds = 0.0
+
+    @classmethod
+    def from_env(cls) -> Optional["ResultStore"]:
+        """Read TRM_RESULT_STORE_DIR (None when unset)"""
+        store_dir = os.environ.get("TRM_RESULT_STORE_DIR")
+        return cls(store_dir) if store_dir else None
+
+    def _recover(self):
+        """Create the log, or drop a partly written tail left by a crash"""
+        log_path = os.path.join(self.store_dir, 'results.log')
+        index_path = os.path.join(self.store_dir, 'index.bin')
+        strings_path = os.path.join(self.store_dir, 'strings.txt')
+        if os.path.exists(strings_path):
+            with open(strings_path, 'r+b') as f:
+                f.truncate(f.read().rfind(b'\n') + 1)
+        if not os.path.exists(log_path) or os.path.getsize(log_path) < _LOG_HEADER:
+            with open(log_path, 'wb') as f:
+                f.write(_LOG_MAGIC + struct.pack('<B', _LOG_VERSION))
+            with open(index_path, 'wb'):
+                pass
+            return
+        _check_header(log_path)
+        index = _read_index(self.store_dir, os.path.getsize(log_path))
+        with open(index_path, 'r+b') as f:
+            f.truncate(len(index) * INDEX_DTYPE.itemsize)
+        end = int(index['offset'][-1] + index['length'][-1]) if len(index) else _LOG_HEADER
+        with open(log_path, 'r+b') as f:
+            f.truncate(end)
+
+    def _string_id(self, value: str) -> int:
+        string_id = self._strings.get(value)
+        if string_id is None:
+            string_id = self._strings[value] = len(self._strings)
+            self._strings_file.write(json.dumps(value) + '\n')
+            self._strings_file.flush()
+        return string_id
+
+    def append(self, task_id: str, checkpoint: str, results: Dict[str, Any],
+               options: Optional[Dict[str, Any]] = None, timestamp: Optional[float] = None) -> int:
+        """
+        Record one solve
+
+        Args:
+            task_id: Task the result is for
+            checkpoint: Fingerprint of the model that produced it
+            results: `solve` result dict ('predictions', optionally 'tta'/'ensemble')
+            options: JSON-serializable solve options to keep with the record
+            timestamp: Unix time of the solve (default: now)
+
+        Returns:
+            Row of the record in the index
+        """
+        start = time.perf_counter()
+        options = options or {}
+        timestamp = time.time() if timestamp is None else timestamp
+        record = pack_record(results, {'task_id': task_id, 'checkpoint': checkpoint,
+                                       'timestamp': timestamp, 'options': options})
+        row = np.zeros(1, dtype=INDEX_DTYPE)
+        row['length'] = len(record)
+        row['timestamp'] = timestamp
+        row['tests'] = len(results['predictions'])
+        row['max_steps'] = options.get('max_steps') or 0
+        row['iterations'] = any(p.get('iterations') for p in results['predictions'])
+        with self._lock:
+            row['offset'] = self._offset
+            self._log.write(record)
+            self._log.flush()
+            row['task'] = self._string_id(task_id)
+            row['checkpoint'] = self._string_id(checkpoint)
+            self._index.write(row.tobytes())
+            self._index.flush()
+            self._offset += len(record)
+            self.records += 1
+            self.appended += 1
+            self.bytes_written += len(record) + INDEX_DTYPE.itemsize
+            self.seconds += time.perf_counter() - start
+            return self.records - 1
+
+    def close(self):
+        with self._lock:
+            for f in (self._log, self._index, self._strings_file):
+                f.close()
+
+    def stats(self) -> Dict[str, Any]:
+        """Size of the store and append counters for this process"""
+        return {
+            'store_dir': self.store_dir,
+            'records': self.records,
+            'bytes': self._offset + self.records * INDEX_DTYPE.itemsize,
+            'appended': self.appended,
+            'bytes_written': self.bytes_written,
+            'mean_append_ms': 1000 * self.seconds / self.appended if self.appended else 0.0,
+        }
+
+
+def _check_header(log_path: str):
+    with open(log_path, 'rb') as f:
+        header = f.read(_LOG_HEADER)
+    if header[:len(_LOG_MAGIC)] != _LOG_MAGIC:
+        raise ValueError(f"{log_path} is not a TRM result log")
+    if header[len(_LOG_MAGIC)] != _LOG_VERSION:
+        raise ValueError(f"Unsupported TRM result log version {header[len(_LOG_MAGIC)]}")
+
+
+def _read_strings(store_dir: str) -> List[str]:
+    """String table entries, ignoring a partly written last line"""
+    try:
+        with open(os.path.join(store_dir, 'strings.txt'), 'r') as f:
+            text = f.read()
+    except OSError:
+        return []
+    return [json.loads(line) for line in text.split('\n')[:-1]]
+
+
+def _read_index(store_dir: str, log_size: int) -> np.ndarray:
+    """Whole index rows whose records are completely in the log"""
+    with open(os.path.join(store_dir, 'index.bin'), 'rb') as f:
+        data = f.read()
+    index = np.frombuffer(data, dtype=INDEX_DTYPE, count=len(data) // INDEX_DTYPE.itemsize)
+    # Records are appended in order, so the complete ones are a prefix
+    return index[:np.count_nonzero(index['offset'] + index['length'] <= log_size)]
+
+
+class ResultReader:
+    """
+    Read-only view of a result store, safe to use while a `ResultStore` appends to it
+
+    `index` is the whole index as a structured array (columns of
+    `INDEX_DTYPE`), so filters over task, checkpoint and time are single
+    numpy comparisons; records are decoded on demand from the memory-mapped
+    log. Call `refresh` to see records appended after opening.
+    """
+
+    def __init__(self, store_dir: str):
+        self.store_dir = store_dir
+        self._mmap = None
+        self.refresh()
+
+    def refresh(self):
+        """Pick up records appended since the reader was opened"""
+        log_path = os.path.join(self.store_dir, 'results.log')
+        _check_header(log_path)
+        if self._mmap is not None:
+            self._mmap.close()
+        with open(log_path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.index = _read_index(self.store_dir, len(self._mmap))
+        self.strings = _read_strings(self.store_dir)
+        self._ids = {value: i for i, value in enumerate(self.strings)}
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    @property
+    def task_ids(self) -> List[str]:
+        """Distinct task ids in the store"""
+        return [self.strings[i] for i in np.unique(self.index['task'])]
+
+    @property
+    def checkpoints(self) -> List[str]:
+        """Distinct checkpoint fingerprints in the store"""
+        return [self.strings[i] for i in np.unique(self.index['checkpoint'])]
+
+    def select(self, task_id: Optional[str] = None, checkpoint: Optional[str] = None,
+               since: Optional[float] = None, until: Optional[float] = None) -> np.ndarray:
+        """
+        Rows matching every given filter, in append order
+
+        Args:
+            task_id: Only records for this task
+            checkpoint: Only records from this checkpoint fingerprint
+            since: Only records at or after this Unix time
+            until: Only records before this Unix time
+        """
+        mask = np.ones(len(self.index), dtype=bool)
+        for column, value in (('task', task_id), ('checkpoint', checkpoint)):
+            if value is not None:
+                if value not in self._ids:
+                    return np.zeros(0, dtype=np.int64)
+                mask &= self.index[column] == self._ids[value]
+        if since is not None:
+            mask &= self.index['timestamp'] >= since
+        if until is not None:
+            mask &= self.index['timestamp'] < until
+        return np.flatnonzero(mask)
+
+    def read(self, row: int, iterations: bool = True, as_lists: bool = False) -> Dict[str, Any]:
+        """
+        Decode the record at index row `row`
+
+        Returns:
+            Dict with 'task_id', 'checkpoint', 'timestamp', 'options' and the
+            solve result's 'predictions' (plus 'tta'/'ensemble' when recorded)
+        """
+        return unpack_record(self._mmap, int(self.index['offset'][row]), iterations=iterations, as_lists=as_lists)
+
+    def iter(self, rows: Optional[np.ndarray] = None, iterations: bool = True,
+             as_lists: bool = False) -> Iterator[Dict[str, Any]]:
+        """Decode the records at `rows` (default: all)"""
+        for row in (range(len(self.index)) if rows is None else rows):
+            yield self.read(row, iterations=iterations, as_lists=as_lists)
+
+    def close(self):
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+
+
+def _parse_time(value: str) -> float:
+    """Unix seconds, or an ISO 8601 date/time in local time"""
+    try:
+        return float(value)
+    except ValueError:
+        from datetime import datetime
+        return datetime.fromisoformat(value).timestamp()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Summarize or export a TRM result store")
+    parser.add_argument('store_dir', help="Result store directory (as in TRM_RESULT_STORE_DIR)")
+    parser.add_argument('--task', default=None, help="Only this task id")
+    parser.add_argument('--checkpoint', default=None, help="Only this checkpoint fingerprint")
+    parser.add_argument('--since', type=_parse_time, default=None, help="Unix time or ISO date/time")
+    parser.add_argument('--until', type=_parse_time, default=None, help="Unix time or ISO date/time")
+    parser.add_argument('--export', default=None, help="Write the selected records to this JSON file")
+    parser.add_argument('--no-iterations', action='store_true', help="Leave iteration traces out of the export")
+    args = parser.parse_args()
+
+    reader = ResultReader(args.store_dir)
+    rows = reader.select(task_id=args.task, checkpoint=args.checkpoint, since=args.since, until=args.until)
+    selected = reader.index[rows]
+    print(f"{len(rows)} of {len(reader)} record(s), {int(selected['tests'].sum())} prediction(s), "
+          f"{len(np.unique(selected['task']))} task(s), {len(np.unique(selected['checkpoint']))} checkpoint(s)")
+    if len(rows):
+        first, last = selected['timestamp'].min(), selected['timestamp'].max()
+        print(f"From {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(first))} "
+              f"to {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(last))}, "
+              f"{int(selected['length'].sum()) / 1024:.1f} KiB of records")
+    if args.export:
+        records = list(reader.iter(rows, iterations=not args.no_iterations))
+        with open(args.export, 'wb') as f:
+            f.write(dumps(records))
+        print(f"✓ Wrote {args.export}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+Single-flight coalescing of identical in-flight solves
+Duplicate /api/solve requests attach to the running solve instead of starting their own recursion
+"""
+import asyncio
+from dataclasses import dataclass
+from typing import Dict, List, Any, Optional, Awaitable, Callable
+
+
+@dataclass
+class _Flight:
+    """A running solve that duplicates can wait on"""
+    key: str
+    group: Optional[str]
+    max_steps: int
+    task: asyncio.Future
+
+
+class SingleFlight:
+    """
+    In-flight solves by request key, plus groups of solves that differ only in `max_steps`
+
+    A request whose key matches a running solve awaits that solve's result.
+    With `prefix_reuse`, a request matching a running solve's group (same
+    task and options except `max_steps`) waits for it to finish and then runs
+    its own solve, which the carry store serves from the finished one: a
+    shorter request reads the prediction at its step count from the stored
+    per-step history, a longer one resumes from the stored carry and only
+    pays for the extra steps.
+    """
+
+    def __init__(self, prefix_reuse: bool = False):
+        """
+        Args:
+            prefix_reuse: Coalesce requests differing only in `max_steps` (needs
+                the serving model's carry store)
+        """
+        self.prefix_reuse = prefix_reuse
+        self._flights: Dict[str, _Flight] = {}
+        self._groups: Dict[str, List[_Flight]] = {}
+
+        self.leaders = 0
+        self.exact_hits = 0
+        self.prefix_hits = 0
+
+    async def run(self, key: str, fn: Callable[[], Awaitable[Any]], group: Optional[str] = None,
+                  max_steps: int = 0) -> Any:
+        """
+        Result of `fn()`, shared with concurrent calls for the same `key`
+
+        Args:
+            key: Canonical hash of the task and all solve options
+            fn: Coroutine function running the solve
+            group: Hash of the task and options except `max_steps` (None: no prefix reuse)
+            max_steps: Steps this request asks for
+        """
+        flight = self._flights.get(key)
+        if flight is not None:
+            self.exact_hits += 1
+            return await asyncio.shield(flight.task)
+
+        leader = None
+        if self.prefix_reuse and group is not None and self._groups.get(group):
+            # Waiting on the longest running solve gives the longest reusable prefix
+            leader = max(self._groups[group], key=lambda f: f.max_steps)
+            self.prefix_hits += 1
+        else:
+            self.leaders += 1
+
+        async def solve():
+            if leader is not None:
+                await asyncio.wait([leader.task])
+            return await fn()
+
+        flight = _Flight(key, group, max_steps, asyncio.ensure_future(solve()))
+        self._flights[key] = flight
+        if group is not None:
+            self._groups.setdefault(group, []).append(flight)
+        flight.task.add_done_callback(lambda _: self._finish(flight))
+        return await asyncio.shield(flight.task)
+
+    def _finish(self, flight: _Flight):
+        if self._flights.get(flight.key) is flight:
+            del self._flights[flight.key]
+        if flight.group is not None:
+            members = self._groups.get(flight.group, [])
+            if flight in members:
+                members.remove(flight)
+            if not members:
+                self._groups.pop(flight.group, None)
+        # Retrieve the exception so an unawaited failure is not reported as never retrieved
+        if not flight.task.cancelled():
+            flight.task.exception()
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._flights)
+
+    def stats(self) -> Dict[str, Any]:
+        """Configuration and coalescing counters"""
+        requests = self.leaders + self.exact_hits + self.prefix_hits
+        return {
+            'prefix_reuse': self.prefix_reuse,
+            'in_flight': self.in_flight,
+            'leaders': self.leaders,
+            'exact_hits': self.exact_hits,
+            'prefix_hits': self.prefix_hits,
+            'dup_rate': (self.exact_hits + self.prefix_hits) / requests if requests else 0.0,
+        }
@@ -38,6 +38,42 @@ echo ""
 # Set environment variables (optional)
 # export TRM_CHECKPOINT_PATH=/path/to/checkpoint.pt
 # export USE_MPS=true  # Set to true to use MPS on M-series Macs
+# export TRM_PRECISION=fp32    # fp32, bf16 (autocast) or int8 (dynamic quantization, CPU only)
+# export TRM_BACKEND=eager     # Recursion step backend: eager, compile, script or onnx
+# export TRM_BACKEND_CHECK_TASKS=4  # Evaluation tasks checked against eager at startup (0 skips)
+# export TRM_INSTRUMENT=true        # Aggregate per-step timings, FLOPs and memory for /metrics
+# export TRM_FAST_START=true   # Reuse a cached snapshot of the checkpoint to skip init on restart
+# export TRM_MODEL_CACHE_DIR=.cache/models  # Where snapshots go (default: next to the checkpoint)
+# export TRM_MAX_BATCH=16      # Max test grids per batched model call
+# export TRM_BATCH_WAIT_MS=5   # How long a request waits for others to batch with
+# export TRM_QUEUE_DEPTH=64    # Pending requests before /api/solve returns 503
+# export TRM_INFERENCE_WORKERS=1  # Threads running model calls concurrently
+# export TRM_TORCH_THREADS=4       # Intra-op threads per inference worker (default: cores / workers)
+# export TRM_MAX_PENDING=8         # Jobs admitted before /api/solve returns 503 + Retry-After
+# export TRM_AUTOTUNE=startup      # Tune workers/threads/batch size for this host: off, startup (reuse saved) or always
+# export TRM_AUTOTUNE_BATCH_SIZES=1,4,16  # Batch sizes tried (explicit TRM_INFERENCE_WORKERS/TORCH_THREADS/MAX_BATCH win)
+# export TRM_AUTOTUNE_STEPS=4      # Recursion steps per benchmark solve
+# export TRM_AUTOTUNE_ROUNDS=2     # Timed solves per worker and candidate
+# export TRM_AUTOTUNE_DIR=.cache/autotune  # Tuned settings, one JSON file per host
+# export TRM_REPLICAS=0            # Model worker processes sharing one copy of the weights (0 = in-process)
+# export TRM_REPLICA_CORES=2       # Cores pinned to each replica (default: split evenly)
+# export TRM_ENSEMBLE_CHECKPOINTS=/path/to/seed2.pt,/path/to/seed3.pt  # Extra checkpoints voting with TRM_CHECKPOINT_PATH
+# export TRM_ENSEMBLE_WEIGHTS=1,1,1   # Vote weight per checkpoint, TRM_CHECKPOINT_PATH first (default: equal)
+# export TRM_ENSEMBLE_VOTE=majority   # majority or confidence (weighted by halt confidence)
+# export TRM_ENSEMBLE_MODE=threads    # threads (one per checkpoint) or stacked (vmap over stacked weights)
+# export TRM_TTA_CHUNK=64      # Max augmented views per model call
+# export TRM_CACHE_SIZE=256    # Cached solve results kept in memory (0 disables)
+# export TRM_PREDICTION_CACHE_DIR=.cache/predictions  # Persist cached results across restarts
+# export TRM_RESULT_STORE_DIR=.cache/results  # Append every fresh /api/solve result to a packed binary log (read with result_store.py)
+# export TRM_CARRY_STORE_SIZE=64  # Latent carries kept so requests for more steps resume (0 disables)
+# export TRM_CARRY_STORE_DIR=.cache/carries  # Spill evicted carries to disk (fp16)
+# export TRM_TASK_CONDITIONING=true    # Fit a puzzle embedding to each task's training pairs (once per task)
+# export TRM_TASK_FIT_STEPS=32          # Optimizer steps per fit (0 uses the table's mean embedding)
+# export TRM_TASK_FIT_LR=0.01
+# export TRM_TASK_FIT_ACT_STEPS=2       # ACT steps unrolled per optimizer step
+# export TRM_TASK_EMBEDDING_SLOTS=64     # Puzzle-table rows reserved for tasks in flight
+# export TRM_TASK_EMBEDDING_CACHE_SIZE=1024  # Fitted embeddings kept in memory
+# export TRM_TASK_EMBEDDING_DIR=.cache/task-embeddings  # Persist fitted embeddings across restarts
 
 # Start the server
 echo "🌐 Starting server at http://localhost:8000"
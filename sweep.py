@@ -0,0 +1,530 @@
+#!/usr/bin/env python3
+"""
+Sharded offline solving of ARC-AGI challenge sets
+A coordinator leases (task, test input, seed, view, max_steps) work units to worker processes over TCP and merges their predictions
+"""
+import argparse
+import ipaddress
+import os
+import secrets
+import socket
+import subprocess
+import sys
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field, asdict
+from multiprocessing.connection import Listener, Client, Connection
+from typing import Dict, List, Tuple, Any, Optional
+
+import torch
+
+from evaluate import Progress, write_json, score_submission, default_solutions_path
+from tta import TTAConfig, make_views, invert_views, vote
+
+DEFAULT_PORT = 5917
+
+
+def is_loopback(host: str) -> bool:
+    """Whether every address `host` resolves to is a loopback address"""
+    try:
+        infos = socket.getaddrinfo(host, None)
+    except socket.gaierror:
+        return False
+    return bool(infos) and all(ipaddress.ip_address(info[4][0].split('%')[0]).is_loopback for info in infos)
+
+
+@dataclass(frozen=True)
+class SweepConfig:
+    """The grid of settings every test input is solved under"""
+    num_views: int = 8                   # Augmented views per test input and seed (view 0 is the original)
+    seeds: Tuple[int, ...] = (0,)        # Color-permutation seeds
+    max_steps: Tuple[int, ...] = (16,)   # Recursion step counts
+    permute_colors: bool = True
+    bucketed: bool = False
+    vote: str = 'majority'               # 'majority' or 'confidence', over all views and seeds
+
+    def views(self, seed: int) -> TTAConfig:
+        return TTAConfig(num_views=self.num_views, permute_colors=self.permute_colors, seed=seed)
+
+
+@dataclass
+class WorkUnit:
+    """One view of one test input, solved for one step count"""
+    task_id: str
+    test_index: int
+    seed: int
+    view: int
+    max_steps: int
+    grid: List[List[int]]   # The original test input, so workers need no copy of the challenge file
+
+    @property
+    def key(self) -> str:
+        return f"{self.task_id}:{self.test_index}:{self.seed}:{self.view}:{self.max_steps}"
+
+
+def make_units(tasks: Dict[str, Dict[str, Any]], config: SweepConfig) -> List[WorkUnit]:
+    """Every (task, test input, seed, view, max_steps) combination"""
+    return [WorkUnit(task_id, test_index, seed, view, max_steps, test['input'])
+            for task_id, task in tasks.items()
+            for test_index, test in enumerate(task['test'])
+            for max_steps in config.max_steps
+            for seed in config.seeds
+            for view in range(config.num_views)]
+
+
+@dataclass
+class _Lease:
+    unit: WorkUnit
+    worker: str
+    deadline: float
+
+
+@dataclass
+class CoordinatorStats:
+    leased: int = 0
+    completed: int = 0
+    duplicates: int = 0      # Results for units another worker already finished
+    requeued: int = 0        # Leases returned after a worker died or a lease expired
+    rejected_workers: int = 0
+    workers: Dict[str, int] = field(default_factory=dict)  # Units completed per worker
+
+
+class Coordinator:
+    """
+    Hands out work units in leases and records results as they arrive
+
+    Workers connect over `multiprocessing.connection` (TCP, authenticated
+    with `authkey`) and repeatedly send their finished results together
+    with a request for more units. A lease is returned to the queue when its
+    worker disconnects or it is not finished within `lease_seconds`; a unit
+    that fails `max_attempts` leases is given up. The first result for a
+    unit wins, so a slow worker whose lease expired only costs duplicate work.
+    Results are appended to `progress` as they arrive, so an interrupted
+    sweep resumes where it stopped.
+    """
+
+    def __init__(self, units: List[WorkUnit], progress: Progress, config: SweepConfig,
+                 fingerprint: Optional[str], lease_size: int = 16, lease_seconds: float = 600.0,
+                 max_attempts: int = 3):
+        """
+        Args:
+            units: All work units of the sweep (finished ones in `progress` are skipped)
+            progress: Record of finished units, keyed by `WorkUnit.key`
+            config: Sweep settings, sent to every worker
+            fingerprint: Checkpoint fingerprint workers must report (None accepts any)
+            lease_size: Most units handed out per request
+            lease_seconds: Time a worker has to return a lease before it is requeued
+            max_attempts: Leases per unit before it is given up
+        """
+        self.progress = progress
+        self.config = config
+        self.fingerprint = fingerprint
+        self.lease_size = lease_size
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+
+        self.total = len(units)
+        self._pending = deque(unit for unit in units if unit.key not in progress.done)
+        self._leases: Dict[str, _Lease] = {}
+        self._attempts: Dict[str, int] = {}
+        self.failed: List[str] = []
+        self._lock = threading.Lock()
+        self._finished = threading.Event()
+        self.stats = CoordinatorStats()
+        self._check_finished()
+
+    def _check_finished(self):
+        if not self._pending and not self._leases:
+            self._finished.set()
+
+    def serve(self, address: Tuple[str, int], authkey: bytes):
+        """Accept workers on `address` in a background thread"""
+        if not authkey:
+            raise ValueError("The coordinator needs a non-empty authkey")
+        self._listener = Listener(address, authkey=authkey)
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    @property
+    def address(self) -> Tuple[str, int]:
+        return self._listener.address
+
+    def _accept(self):
+        while not self._finished.is_set():
+            try:
+                conn = self._listener.accept()
+            except Exception:
+                # Failed handshakes (wrong authkey) and the listener closing at the end
+                continue
+            threading.Thread(target=self._handle, args=(conn,), daemon=True).start()
+
+    def _handle(self, conn: Connection):
+        worker = None
+        try:
+            kind, worker, fingerprint = conn.recv()
+            if self.fingerprint is not None and fingerprint != self.fingerprint:
+                self.stats.rejected_workers += 1
+                conn.send(('reject', f"worker has checkpoint {fingerprint}, sweep needs {self.fingerprint}"))
+                return
+            conn.send(('config', asdict(self.config)))
+            while True:
+                kind, results, wanted = conn.recv()
+                for key, result in results:
+                    self._complete(worker, key, result)
+                units = self._lease(worker, min(wanted, self.lease_size))
+                if units:
+                    conn.send(('units', [asdict(unit) for unit in units]))
+                elif self._finished.is_set():
+                    conn.send(('done', None))
+                    return
+                else:
+                    # Everything is leased; wait for stragglers (or their expiry)
+                    conn.send(('wait', 1.0))
+        except (EOFError, OSError):
+            pass
+        finally:
+            if worker is not None:
+                self._release(worker)
+            conn.close()
+
+    def _lease(self, worker: str, count: int) -> List[WorkUnit]:
+        """Up to `count` pending units sharing one step count (so the worker can batch them)"""
+        with self._lock:
+            self._expire()
+            if not self._pending:
+                return []
+            max_steps = self._pending[0].max_steps
+            units, skipped = [], []
+            while self._pending and len(units) < count:
+                unit = self._pending.popleft()
+                (units if unit.max_steps == max_steps else skipped).append(unit)
+            self._pending.extendleft(reversed(skipped))
+            deadline = time.monotonic() + self.lease_seconds
+            for unit in units:
+                self._leases[unit.key] = _Lease(unit, worker, deadline)
+                self._attempts[unit.key] = self._attempts.get(unit.key, 0) + 1
+            self.stats.leased += len(units)
+            return units
+
+    def _complete(self, worker: str, key: str, result: Dict[str, Any]):
+        with self._lock:
+            if key in self.progress.done:
+                self.stats.duplicates += 1
+                return
+            lease = self._leases.pop(key, None)
+            if lease is None and key not in self._attempts:
+                return
+            if lease is None:
+                # Its lease expired and it was requeued; this result still counts
+                self._pending = deque(unit for unit in self._pending if unit.key != key)
+            self.progress.add(key, result)
+            self.stats.completed += 1
+            self.stats.workers[worker] = self.stats.workers.get(worker, 0) + 1
+            self._check_finished()
+
+    def _requeue(self, lease: _Lease):
+        key = lease.unit.key
+        del self._leases[key]
+        if self._attempts[key] >= self.max_attempts:
+            self.failed.append(key)
+        else:
+            self._pending.appendleft(lease.unit)
+            self.stats.requeued += 1
+
+    def _expire(self):
+        now = time.monotonic()
+        for lease in [lease for lease in self._leases.values() if lease.deadline < now]:
+            self._requeue(lease)
+        self._check_finished()
+
+    def _release(self, worker: str):
+        """Requeue every lease of a worker that disconnected"""
+        with self._lock:
+            for lease in [lease for lease in self._leases.values() if lease.worker == worker]:
+                self._requeue(lease)
+            self._check_finished()
+
+    def wait(self, poll: float = 1.0, report=None):
+        """Block until every unit is finished or given up, expiring leases meanwhile"""
+        while not self._finished.wait(poll):
+            with self._lock:
+                self._expire()
+            if report is not None:
+                report(self)
+
+    def close(self):
+        self._finished.set()
+        self._listener.close()
+
+    @property
+    def remaining(self) -> int:
+        return len(self._pending) + len(self._leases)
+
+
+class Worker:
+    """
+    Solves leased work units with a local TRMInference until the coordinator has none left
+
+    Units of one lease share a step count and run as one batched recursion;
+    each view's prediction is mapped back to the original grid frame and
+    colors before it is returned.
+    """
+
+    def __init__(self, model, name: Optional[str] = None, lease_size: int = 16):
+        self.model = model
+        self.name = name or f"{os.uname().nodename}-{os.getpid()}"
+        self.lease_size = lease_size
+        self.config: Optional[SweepConfig] = None
+        self._views: Dict[Tuple[str, int, int], Dict[str, Any]] = {}
+        self.units = 0
+
+    def run(self, address: Tuple[str, int], authkey: bytes) -> int:
+        """Work until the coordinator says done; returns the number of units solved"""
+        with Client(address, authkey=authkey) as conn:
+            conn.send(('hello', self.name, self.model.fingerprint))
+            kind, payload = conn.recv()
+            if kind == 'reject':
+                raise RuntimeError(f"Coordinator rejected this worker: {payload}")
+            self.config = SweepConfig(**{k: tuple(v) if isinstance(v, list) else v for k, v in payload.items()})
+
+            results: List[Tuple[str, Dict[str, Any]]] = []
+            while True:
+                conn.send(('lease', results, self.lease_size))
+                kind, payload = conn.recv()
+                if kind == 'done':
+                    return self.units
+                if kind == 'wait':
+                    results = []
+                    time.sleep(payload)
+                    continue
+                units = [WorkUnit(**unit) for unit in payload]
+                results = self.solve(units)
+                self.units += len(units)
+
+    def _unit_views(self, unit: WorkUnit) -> Dict[str, Any]:
+        key = (unit.task_id, unit.test_index, unit.seed)
+        if key not in self._views:
+            if len(self._views) >= 256:
+                self._views.clear()
+            height, width = len(unit.grid), len(unit.grid[0])
+            self._views[key] = make_views(self.model.preprocess_grid(unit.grid), height, width,
+                                          self.config.views(unit.seed))
+        return self._views[key]
+
+    def solve(self, units: List[WorkUnit]) -> List[Tuple[str, Dict[str, Any]]]:
+        """Run units sharing one step count as a batch; returns (unit key, result) pairs"""
+        from inference import RowBlock
+        blocks, views = [], []
+        for unit in units:
+            view = self._unit_views(unit)
+            blocks.append(RowBlock(
+                inputs=view['inputs'][unit.view:unit.view + 1],
+                puzzle_ids=torch.tensor([unit.test_index], dtype=torch.int32),
+                shapes=[view['shapes'][unit.view]]
+            ))
+            views.append({'inverse': view['inverse'][unit.view:unit.view + 1],
+                          'unpermute': view['unpermute'][unit.view:unit.view + 1]})
+
+        runs = self.model.run_blocks(blocks, units[0].max_steps, bucketed=self.config.bucketed)
+        results = []
+        for unit, view, run in zip(units, views, runs):
+            pred = invert_views(run['preds'], view)[0]
+            results.append((unit.key, {
+                'prediction': pred.tolist(),
+                'q_halt': float(run['q_halt_logits'][0]),
+                'steps': int(run['steps'][0]),
+                'worker': self.name,
+            }))
+        return results
+
+
+def merge(tasks: Dict[str, Dict[str, Any]], done: Dict[str, Dict[str, Any]],
+          config: SweepConfig) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    Vote each test input's finished views into one prediction per step count
+
+    Returns:
+        {task_id: [per test input: {str(max_steps): {'prediction', 'attempts',
+        'agreement', 'views'}}]}; step counts with no finished views are left out
+    """
+    merged = {}
+    for task_id, task in tasks.items():
+        entries = []
+        for test_index, test in enumerate(task['test']):
+            height, width = len(test['input']), len(test['input'][0])
+            entry = {}
+            for max_steps in config.max_steps:
+                results = [done[key] for key in (f"{task_id}:{test_index}:{seed}:{view}:{max_steps}"
+                                                 for seed in config.seeds for view in range(config.num_views))
+                           if key in done]
+                if not results:
+                    continue
+                preds = torch.tensor([result['prediction'] for result in results])
+                if config.vote == 'confidence':
+                    weights = torch.sigmoid(torch.tensor([result['q_halt'] for result in results]))
+                else:
+                    weights = torch.ones(len(results))
+                candidates, scores = vote(preds, weights)
+                entry[str(max_steps)] = {
+                    'prediction': candidates[0].view(height, width).tolist(),
+                    'attempts': [candidate.view(height, width).tolist() for candidate in candidates[:2]],
+                    'agreement': float(scores[0] / scores.sum()),
+                    'views': len(results),
+                }
+            entries.append(entry)
+        merged[task_id] = entries
+    return merged
+
+
+def spawn_workers(count: int, port: int, authkey: str, checkpoint: Optional[str],
+                  lease_size: int) -> List[subprocess.Popen]:
+    """Start `count` worker processes on this machine, splitting its cores between them"""
+    cores = len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else (os.cpu_count() or 1)
+    command = [sys.executable, os.path.abspath(__file__), 'work', '--host', '127.0.0.1', '--port', str(port),
+               '--threads', str(max(1, cores // count)), '--lease-size', str(lease_size)]
+    if checkpoint:
+        command += ['--checkpoint', checkpoint]
+    env = dict(os.environ, TRM_SWEEP_AUTHKEY=authkey)
+    return [subprocess.Popen(command + ['--name', f"local-{i}"], env=env) for i in range(count)]
+
+
+def coordinate(args):
+    from dataset_store import get_store
+    from inference import default_dataset_path, checkpoint_fingerprint, BUCKETING_WARNING
+
+    if args.authkey is None:
+        if not is_loopback(args.host):
+            raise SystemExit(f"Listening on {args.host} needs a shared secret: set TRM_SWEEP_AUTHKEY or pass --authkey")
+        # Only this machine can connect; --local-workers get the key through their environment
+        args.authkey = secrets.token_hex(16)
+
+    challenges_path = args.challenges or default_dataset_path()
+    store = get_store(challenges_path)
+    task_ids = store.task_ids[:args.limit] if args.limit else store.task_ids
+    tasks = {task_id: store.get_task(task_id) for task_id in task_ids}
+
+    config = SweepConfig(num_views=args.views, seeds=tuple(args.seeds), max_steps=tuple(args.max_steps),
+                         permute_colors=not args.no_color_permutations, bucketed=args.bucketed, vote=args.vote)
+    fingerprint = checkpoint_fingerprint(args.checkpoint) if args.checkpoint and os.path.exists(args.checkpoint) else None
+    if fingerprint is None:
+        print("⚠️  No checkpoint given: workers are not checked for matching weights", file=sys.stderr)
+    if args.bucketed:
+        print(f"⚠️  {BUCKETING_WARNING}", file=sys.stderr)
+    settings = {'challenges': os.path.abspath(challenges_path), 'fingerprint': fingerprint,
+                'limit': args.limit, **asdict(config)}
+    settings = {k: list(v) if isinstance(v, tuple) else v for k, v in settings.items()}
+    progress = Progress(args.output + '.progress.jsonl', settings, resume=not args.restart)
+
+    units = make_units(tasks, config)
+    coordinator = Coordinator(units, progress, config, fingerprint, lease_size=args.lease_size,
+                              lease_seconds=args.lease_seconds, max_attempts=args.max_attempts)
+    coordinator.serve((args.host, args.port), args.authkey.encode())
+    print(f"Coordinator on {args.host}:{coordinator.address[1]}: {len(units)} units "
+          f"({len(units) - coordinator.remaining} already done)")
+
+    workers = []
+    if args.local_workers:
+        workers = spawn_workers(args.local_workers, coordinator.address[1], args.authkey, args.checkpoint,
+                                args.lease_size)
+
+    start = time.perf_counter()
+    last = [0.0]
+
+    def report(c):
+        if time.perf_counter() - last[0] >= 10:
+            last[0] = time.perf_counter()
+            print(f"  {c.total - c.remaining}/{c.total} units, {c.stats.requeued} requeued", flush=True)
+
+    try:
+        coordinator.wait(report=report)
+    finally:
+        # Let connected workers pick up their 'done' before the listener goes away
+        for worker in workers:
+            try:
+                worker.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                worker.kill()
+        coordinator.close()
+        progress.close()
+
+    elapsed = time.perf_counter() - start
+    merged = merge(tasks, progress.done, config)
+    write_json(args.output, merged)
+    print(f"\n✓ Wrote {args.output} ({len(merged)} tasks) in {elapsed:.1f}s; stats: {asdict(coordinator.stats)}")
+    if coordinator.failed:
+        print(f"✗ {len(coordinator.failed)} unit(s) failed {args.max_attempts} leases", file=sys.stderr)
+
+    solutions_path = args.solutions or default_solutions_path(challenges_path)
+    if solutions_path and os.path.exists(solutions_path):
+        import json
+        with open(solutions_path, 'r') as f:
+            solutions = json.load(f)
+        for max_steps in config.max_steps:
+            submission = {task_id: [{'attempt_1': e[str(max_steps)]['attempts'][0],
+                                     'attempt_2': e[str(max_steps)]['attempts'][-1]}
+                                    for e in entries]
+                          for task_id, entries in merged.items()
+                          if all(str(max_steps) in e for e in entries)}
+            score = score_submission(submission, solutions)
+            print(f"max_steps={max_steps}: score {score['score']:.4f} over {score['tasks']} tasks")
+
+
+def work(args):
+    if args.authkey is None:
+        raise SystemExit("Set TRM_SWEEP_AUTHKEY or pass --authkey to the coordinator's shared secret")
+    torch.set_num_threads(args.threads or torch.get_num_threads())
+    from inference import TRMInference
+    model = TRMInference(checkpoint_path=args.checkpoint)
+    worker = Worker(model, name=args.name, lease_size=args.lease_size)
+    solved = worker.run((args.host, args.port), args.authkey.encode())
+    print(f"✓ Worker {worker.name} solved {solved} units")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sharded offline TRM sweeps over an ARC-AGI challenge set")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    authkey = os.environ.get("TRM_SWEEP_AUTHKEY") or None
+
+    coord = subparsers.add_parser('coordinate', help="Lease work units to workers and merge their results")
+    coord.add_argument('--challenges', default=None, help="Challenges JSON (default: evaluation set)")
+    coord.add_argument('--solutions', default=None, help="Solutions JSON for scoring (default: next to the challenges)")
+    coord.add_argument('--output', default='sweep_predictions.json')
+    coord.add_argument('--checkpoint', default=os.environ.get("TRM_CHECKPOINT_PATH"),
+                       help="Checkpoint workers must have loaded (also passed to --local-workers)")
+    coord.add_argument('--views', type=int, default=8, help="Augmented views per test input and seed")
+    coord.add_argument('--seeds', type=lambda s: [int(x) for x in s.split(',')], default=[0])
+    coord.add_argument('--max-steps', type=lambda s: [int(x) for x in s.split(',')], default=[16])
+    coord.add_argument('--no-color-permutations', action='store_true')
+    coord.add_argument('--bucketed', action='store_true',
+                       help="Run grids at their size bucket's sequence length (changes answers for grids up to 20x20)")
+    coord.add_argument('--vote', default='majority', choices=['majority', 'confidence'])
+    coord.add_argument('--limit', type=int, default=None, help="Only the first N tasks")
+    coord.add_argument('--host', default='127.0.0.1',
+                       help="Interface to listen on (other than loopback, only with an explicit --authkey)")
+    coord.add_argument('--port', type=int, default=DEFAULT_PORT, help="Port to listen on (0 picks a free one)")
+    coord.add_argument('--lease-size', type=int, default=16, help="Most units per lease")
+    coord.add_argument('--lease-seconds', type=float, default=600.0, help="Time before an unreturned lease is requeued")
+    coord.add_argument('--max-attempts', type=int, default=3)
+    coord.add_argument('--local-workers', type=int, default=0, help="Worker processes to start on this machine")
+    coord.add_argument('--restart', action='store_true', help="Ignore saved progress")
+    coord.add_argument('--authkey', default=authkey,
+                       help="Shared secret (default: TRM_SWEEP_AUTHKEY; a random one when listening on loopback)")
+
+    worker = subparsers.add_parser('work', help="Solve units leased by a coordinator")
+    worker.add_argument('--host', default='127.0.0.1', help="Coordinator host")
+    worker.add_argument('--port', type=int, default=DEFAULT_PORT)
+    worker.add_argument('--checkpoint', default=os.environ.get("TRM_CHECKPOINT_PATH"))
+    worker.add_argument('--threads', type=int, default=None, help="Intra-op threads (default: torch's)")
+    worker.add_argument('--lease-size', type=int, default=16)
+    worker.add_argument('--name', default=None)
+    worker.add_argument('--authkey', default=authkey, help="Shared secret (default: TRM_SWEEP_AUTHKEY, required)")
+
+    args = parser.parse_args()
+    if args.command == 'coordinate':
+        coordinate(args)
+    else:
+        work(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,338 @@
+"""
+Task conditioning for TRM inference
+Fits a puzzle embedding to each task's training pairs once, caches it by task hash, and serves it through reserved rows of the puzzle-embedding table
+"""
+import contextlib
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, asdict
+from typing import Dict, List, Any, Optional
+
+import torch
+import torch.nn.functional as F
+from torch import nn
+
+
+@dataclass
+class ConditioningConfig:
+    """Task conditioning settings"""
+    enabled: bool = False
+    fit_steps: int = 32             # Optimizer steps per task (0 uses the table's mean embedding)
+    learning_rate: float = 0.01
+    act_steps: int = 2              # ACT steps unrolled per optimizer step (deep supervision)
+    slots: int = 64                 # Table rows reserved for task embeddings (tasks in flight at once)
+    cache_size: int = 1024          # Fitted embeddings kept in memory
+    cache_dir: Optional[str] = None # Persist fitted embeddings across restarts
+
+    @classmethod
+    def from_env(cls) -> "ConditioningConfig":
+        """Read TRM_TASK_CONDITIONING and the TRM_TASK_FIT_* / TRM_TASK_EMBEDDING_* settings"""
+        return cls(
+            enabled=os.environ.get("TRM_TASK_CONDITIONING", "false").lower() in ("1", "true", "yes"),
+            fit_steps=int(os.environ.get("TRM_TASK_FIT_STEPS", cls.fit_steps)),
+            learning_rate=float(os.environ.get("TRM_TASK_FIT_LR", cls.learning_rate)),
+            act_steps=int(os.environ.get("TRM_TASK_FIT_ACT_STEPS", cls.act_steps)),
+            slots=int(os.environ.get("TRM_TASK_EMBEDDING_SLOTS", cls.slots)),
+            cache_size=int(os.environ.get("TRM_TASK_EMBEDDING_CACHE_SIZE", cls.cache_size)),
+            cache_dir=os.environ.get("TRM_TASK_EMBEDDING_DIR") or None,
+        )
+
+    @property
+    def tag(self) -> str:
+        """Short hash of the settings that change fitted embeddings"""
+        fit = {'fit_steps': self.fit_steps, 'learning_rate': self.learning_rate, 'act_steps': self.act_steps}
+        return hashlib.sha256(json.dumps(fit, sort_keys=True).encode()).hexdigest()[:8]
+
+
+def train_pairs_key(task: Dict[str, Any]) -> str:
+    """Hash of a task's training pairs (test inputs do not affect its embedding)"""
+    pairs = [[ex['input'], ex['output']] for ex in task.get('train', [])]
+    return hashlib.sha256(json.dumps(pairs, separators=(',', ':')).encode()).hexdigest()
+
+
+class FittedPuzzleEmbedding(nn.Module):
+    """Stand-in for the sparse puzzle-embedding table returning one trainable vector for every row"""
+
+    def __init__(self, embedding_dim: int, cast_to: torch.dtype):
+        super().__init__()
+        self.cast_to = cast_to
+        self.embedding = torch.zeros(embedding_dim)
+
+    def forward(self, inputs: torch.Tensor) -> torch.Tensor:
+        return self.embedding.to(self.cast_to).expand(*inputs.shape, -1).contiguous()
+
+
+class EmbeddingCache:
+    """
+    LRU cache of fitted embeddings with an optional on-disk tier
+
+    Lookups of a key being fitted wait for that fit instead of starting
+    their own, so each task is fitted once however many requests ask.
+    """
+
+    def __init__(self, max_entries: int = 1024, disk_dir: Optional[str] = None):
+        self.max_entries = max_entries
+        self.disk_dir = disk_dir
+        self._entries: "OrderedDict[str, torch.Tensor]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._fitting: Dict[str, threading.Lock] = {}
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.fits = 0
+        self.fit_seconds = 0.0
+
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, f"{key}.pt")
+
+    def _lookup(self, key: str) -> Optional[torch.Tensor]:
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+        if self.disk_dir and os.path.exists(self._path(key)):
+            try:
+                embedding = torch.load(self._path(key), map_location='cpu')
+            except Exception:
+                return None
+            with self._lock:
+                self.disk_hits += 1
+                self._remember(key, embedding)
+            return embedding
+        return None
+
+    def get_or_fit(self, key: str, fit) -> torch.Tensor:
+        """The embedding for `key`, calling `fit()` to make it on a miss"""
+        embedding = self._lookup(key)
+        if embedding is not None:
+            return embedding
+
+        with self._lock:
+            fit_lock = self._fitting.setdefault(key, threading.Lock())
+        with fit_lock:
+            # Another thread may have finished fitting while this one waited
+            embedding = self._lookup(key)
+            if embedding is not None:
+                return embedding
+            start = time.perf_counter()
+            embedding = fit().detach().cpu()
+            with self._lock:
+                self.fits += 1
+                self.fit_seconds += time.perf_counter() - start
+                self._remember(key, embedding)
+                self._fitting.pop(key, None)
+            if self.disk_dir:
+                tmp_path = f"{self._path(key)}.{os.getpid()}.tmp"
+                torch.save(embedding, tmp_path)
+                os.replace(tmp_path, self._path(key))
+        return embedding
+
+    def _remember(self, key: str, embedding: torch.Tensor):
+        self._entries[key] = embedding
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        """Drop the memory tier (the disk tier is left alone)"""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'entries': len(self._entries),
+            'max_entries': self.max_entries,
+            'disk_dir': self.disk_dir,
+            'hits': self.hits,
+            'disk_hits': self.disk_hits,
+            'fits': self.fits,
+            'fit_seconds': self.fit_seconds,
+        }
+
+
+class TaskConditioner:
+    """
+    Per-task puzzle embeddings for a TRMInference
+
+    The top `slots` rows of the puzzle-embedding table are reserved. While a
+    batch runs, each of its conditioned tasks holds one slot, written with the
+    task's fitted embedding, and its rows use that slot as their puzzle id.
+    Slots are reassigned least recently used first; slots held by running
+    batches are never reassigned (tasks beyond the free slots run
+    unconditioned, with their test index as puzzle id).
+
+    The table is copied on construction, so writing slots never touches
+    weights shared with other processes.
+    """
+
+    def __init__(self, inference, config: ConditioningConfig):
+        """
+        Args:
+            inference: TRMInference whose puzzle-embedding table receives the slots
+            config: Conditioning settings
+        """
+        inner = inference.model.inner
+        if not hasattr(inner, 'puzzle_emb'):
+            raise ValueError("Task conditioning needs a model with puzzle embeddings (puzzle_emb_ndim > 0)")
+        if inference.backend == 'onnx':
+            raise ValueError("Task conditioning is not supported with the 'onnx' backend (its weights are baked in)")
+        if inference.precision == 'int8' and config.fit_steps > 0:
+            raise ValueError("Fitting task embeddings needs differentiable blocks; use fit_steps=0 with int8")
+        num_rows = inner.puzzle_emb.weights.shape[0]
+        if not 0 < config.slots < num_rows:
+            raise ValueError(f"Task embedding slots must be between 1 and {num_rows - 1}")
+
+        self.inference = inference
+        self.config = config
+        self.cache = EmbeddingCache(config.cache_size, config.cache_dir)
+        self.namespace = f"{inference.fingerprint}-{config.tag}"
+        inner.puzzle_emb.weights = inner.puzzle_emb.weights.clone()
+        self.table = inner.puzzle_emb.weights
+        self.initial_embedding = self.table.float().mean(dim=0)
+        self.first_slot = num_rows - config.slots
+
+        self._lock = threading.Lock()
+        self._slots: "OrderedDict[int, str]" = OrderedDict()   # slot -> task key, least recently used first
+        self._pins: Dict[int, int] = {}
+        self._fit_models: Dict[int, nn.Module] = {}
+        self._fit_lock = threading.Lock()
+        self.unconditioned = 0
+
+    def key(self, task: Dict[str, Any], seq_len: int) -> str:
+        """Cache key of a task's embedding (weights, fit settings, sequence length and training pairs)"""
+        return f"{self.namespace}-{seq_len}-{train_pairs_key(task)}"
+
+    def seq_len_for(self, task: Dict[str, Any], bucketed: bool = False) -> int:
+        """
+        Sequence length a task is solved at, and its embedding fitted at
+
+        The full length, or with `bucketed` the bucket of the task's largest
+        grid (test inputs in a smaller bucket still share that embedding).
+        """
+        inference = self.inference
+        if not bucketed:
+            return inference.seq_len
+        grids = [ex[side] for ex in task['train'] for side in ('input', 'output')]
+        grids += [test['input'] for test in task['test']]
+        return inference.bucket_for(1, max(len(grid) * len(grid[0]) for grid in grids))
+
+    def puzzle_key(self, puzzle_id: int) -> str:
+        """Identity of what a puzzle id means right now (the task key for held slots)"""
+        with self._lock:
+            return self._slots.get(puzzle_id, str(puzzle_id))
+
+    @contextlib.contextmanager
+    def assign(self, tasks: List[Dict[str, Any]], bucketed: bool = False):
+        """
+        Context manager yielding each task's puzzle-id slot (None when unconditioned), held until exit
+
+        Fits embeddings of tasks not seen before, at the sequence length the
+        solve runs at (see `seq_len_for`); tasks without training pairs stay
+        unconditioned.
+        """
+        seq_lens = [self.seq_len_for(task, bucketed) if task.get('train') else None for task in tasks]
+        keys = [self.key(task, seq_len) if seq_len else None for task, seq_len in zip(tasks, seq_lens)]
+        embeddings = {key: self.cache.get_or_fit(key, lambda task=task, seq_len=seq_len: self.fit(task, seq_len))
+                      for key, task, seq_len in zip(keys, tasks, seq_lens) if key is not None}
+        slots: Dict[str, Optional[int]] = {}
+        with self._lock:
+            for key, embedding in embeddings.items():
+                slots[key] = self._take_slot(key, embedding)
+        try:
+            yield [slots.get(key) if key is not None else None for key in keys]
+        finally:
+            with self._lock:
+                for slot in slots.values():
+                    if slot is not None:
+                        self._pins[slot] -= 1
+
+    def _take_slot(self, key: str, embedding: torch.Tensor) -> Optional[int]:
+        for slot, owner in self._slots.items():
+            if owner == key:
+                self._slots.move_to_end(slot)
+                self._pins[slot] = self._pins.get(slot, 0) + 1
+                return slot
+        if len(self._slots) < self.config.slots:
+            slot = self.first_slot + len(self._slots)
+        else:
+            slot = next((s for s in self._slots if not self._pins.get(s)), None)
+            if slot is None:
+                self.unconditioned += 1
+                return None
+            del self._slots[slot]
+        self.table[slot] = embedding.to(self.table.device, self.table.dtype)
+        self._slots[slot] = key
+        self._pins[slot] = 1
+        return slot
+
+    def _fit_model(self, seq_len: int) -> nn.Module:
+        """Weight-sharing model at `seq_len` whose puzzle embedding is a single trainable vector"""
+        if seq_len not in self._fit_models:
+            model = self.inference.build_shared_model(seq_len)
+            model.requires_grad_(False)
+            inner = model.inner
+            inner.puzzle_emb = FittedPuzzleEmbedding(inner.config.puzzle_emb_ndim, inner.forward_dtype)
+            self._fit_models[seq_len] = model
+        return self._fit_models[seq_len]
+
+    def fit(self, task: Dict[str, Any], seq_len: Optional[int] = None) -> torch.Tensor:
+        """
+        Fit a puzzle embedding to a task's training pairs, with the model weights frozen
+
+        Minimizes the cross-entropy of the predicted output cells over
+        `act_steps` unrolled ACT steps. Gradients only reach the embedding
+        through the model's last H cycle, as in training. The pairs are
+        padded to `seq_len` (default: the full length), which should be the
+        length the task is solved at, since attention sees the padding.
+        """
+        embedding = self.initial_embedding.clone()
+        if self.config.fit_steps <= 0:
+            return embedding
+
+        inference = self.inference
+        pairs = task['train']
+        seq_len = seq_len or inference.seq_len
+        device = inference.device
+        batch = {
+            'inputs': inference.pad_inputs([ex['input'] for ex in pairs], seq_len).to(device),
+            'puzzle_identifiers': torch.zeros(len(pairs), 1, dtype=torch.int32, device=device)
+        }
+        labels = inference.pad_inputs([ex['output'] for ex in pairs], seq_len).long().to(device)
+        output_areas = torch.tensor([len(ex['output']) * len(ex['output'][0]) for ex in pairs], device=device)
+        mask = torch.arange(seq_len, device=device) < output_areas[:, None]
+
+        with self._fit_lock, torch.enable_grad():
+            model = self._fit_model(seq_len)
+            embedding = embedding.to(device).requires_grad_(True)
+            model.inner.puzzle_emb.embedding = embedding
+            optimizer = torch.optim.Adam([embedding], lr=self.config.learning_rate)
+            for _ in range(self.config.fit_steps):
+                carry = model.initial_carry(batch)
+                loss = 0.0
+                for _ in range(self.config.act_steps):
+                    carry, outputs = model(carry, batch)
+                    cell_loss = F.cross_entropy(outputs['logits'].float().transpose(1, 2), labels, reduction='none')
+                    loss = loss + (cell_loss * mask).sum() / mask.sum()
+                embedding.grad, = torch.autograd.grad(loss, [embedding])
+                optimizer.step()
+            model.inner.puzzle_emb.embedding = torch.zeros_like(embedding)
+        return embedding.detach()
+
+    def stats(self) -> Dict[str, Any]:
+        """Configuration, slot use and embedding cache counters"""
+        with self._lock:
+            return {
+                'config': asdict(self.config),
+                'slots_used': len(self._slots),
+                'slots_pinned': sum(1 for count in self._pins.values() if count),
+                'unconditioned': self.unconditioned,
+                'cache': self.cache.stats(),
+            }
@@ -0,0 +1,49 @@
+"""
+Shared fixtures for the test suite
+A small randomly initialized model and a few ARC-AGI evaluation tasks
+"""
+import json
+import os
+import sys
+
+import pytest
+import torch
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Tests run with the defaults, whatever the shell exports
+for name in [name for name in os.environ if name.startswith('TRM_') or name == 'USE_MPS']:
+    del os.environ[name]
+
+
+@pytest.fixture(scope='session')
+def model():
+    """Randomly initialized model (seeded, so every run sees the same weights)"""
+    try:
+        from inference import TRMInference
+    except ImportError as e:
+        pytest.skip(f"TinyRecursiveModels is not available ({e})")
+    torch.manual_seed(0)
+    return TRMInference(checkpoint_path=None, fast_start=False)
+
+
+@pytest.fixture(scope='session')
+def challenges_path():
+    """The ARC-AGI evaluation challenges JSON"""
+    from inference import default_dataset_path
+    path = default_dataset_path()
+    if not os.path.exists(path):
+        pytest.skip(f"{path} not found")
+    return path
+
+
+@pytest.fixture(scope='session')
+def eval_tasks(challenges_path):
+    """The first few evaluation tasks by id, as plain dicts without test outputs"""
+    with open(challenges_path, 'r') as f:
+        data = json.load(f)
+    return {
+        task_id: {'train': task['train'], 'test': [{'input': test['input']} for test in task['test']]}
+        for task_id, task in sorted(data.items())[:4]
+    }
@@ -0,0 +1,146 @@
+"""Tests for the HTTP API (served by a randomly initialized model)"""
+import asyncio
+import threading
+
+import pytest
+
+TASK = {'train': [{'input': [[1, 0], [0, 1]], 'output': [[0, 1], [1, 0]]}], 'test': [{'input': [[1, 1], [0, 0]]}]}
+
+
+@pytest.fixture(scope='module')
+def client(model):
+    from fastapi.testclient import TestClient
+    import app
+    with TestClient(app.app) as client:
+        yield client
+
+
+@pytest.fixture
+def app_module(client):
+    import app
+    return app
+
+
+def test_solve(client):
+    response = client.post('/api/solve', json={'task': TASK, 'max_steps': 2})
+    assert response.status_code == 200
+    prediction = response.json()['predictions'][0]
+    assert len(prediction['prediction']) == 2 and prediction['steps'] == 2
+
+
+def test_binary_tta_response_keeps_the_attempts(client):
+    from codec import BINARY_MEDIA_TYPE, unpack_predictions
+    request = {'task': TASK, 'max_steps': 2, 'tta_views': 2}
+    expected = client.post('/api/solve', json=request).json()['predictions']
+    response = client.post('/api/solve', json=request, headers={'Accept': BINARY_MEDIA_TYPE})
+    assert response.headers['content-type'] == BINARY_MEDIA_TYPE
+    assert unpack_predictions(response.content) == expected
+
+
+def test_tta_with_show_iterations_is_rejected(client):
+    response = client.post('/api/solve', json={'task': TASK, 'max_steps': 2, 'tta_views': 2, 'show_iterations': True})
+    assert response.status_code == 400
+
+
+def test_stream_releases_its_slot(client, app_module):
+    response = client.post('/api/solve/stream', json={'task': TASK, 'max_steps': 2})
+    assert response.status_code == 200
+    assert response.text.count('event: step') == 2 and 'event: done' in response.text
+    assert app_module.executor.pending == 0
+
+
+def test_stream_rejects_tta(client, app_module):
+    response = client.post('/api/solve/stream', json={'task': TASK, 'max_steps': 2, 'tta_views': 2})
+    assert response.status_code == 400
+    assert app_module.executor.pending == 0
+
+
+def test_stream_rejects_an_ensemble(client, app_module, monkeypatch):
+    monkeypatch.setattr(app_module, 'ensemble', object())
+    response = client.post('/api/solve/stream', json={'task': TASK, 'max_steps': 2})
+    assert response.status_code == 400
+    assert app_module.executor.pending == 0
+
+
+def test_stream_setup_failure_releases_its_slot(client, app_module, monkeypatch):
+    def fail(*args, **kwargs):
+        raise RuntimeError("setup failed")
+
+    monkeypatch.setattr(app_module.model, 'solve_stream', fail)
+    with pytest.raises(RuntimeError, match="setup failed"):
+        client.post('/api/solve/stream', json={'task': TASK, 'max_steps': 2})
+    assert app_module.executor.pending == 0
+
+
+def test_stream_disconnect_before_the_body_releases_its_slot(client, app_module):
+    from starlette.requests import ClientDisconnect
+
+    request = app_module.SolveRequest(task=TASK, max_steps=2)
+
+    async def run():
+        response = await app_module.solve_puzzle_stream(request)
+        assert app_module.executor.pending == 1
+
+        async def send(message):
+            raise OSError("client went away")
+
+        async def receive():
+            return {'type': 'http.disconnect'}
+
+        with pytest.raises(ClientDisconnect):
+            await response({'type': 'http', 'asgi': {'spec_version': '2.4'}}, receive, send)
+
+    asyncio.run(run())
+    assert app_module.executor.pending == 0
+
+
+def test_coalesced_duplicates_store_one_result(app_module, monkeypatch):
+    from starlette.requests import Request
+
+    appended, puts = [], []
+    monkeypatch.setattr(app_module, 'result_store', type('Store', (), {
+        'append': lambda self, *args: appended.append((threading.current_thread(), args))
+    })())
+    monkeypatch.setattr(app_module.cache, 'put', lambda key, results: puts.append(key))
+
+    async def submit(task, **options):
+        await asyncio.sleep(0.05)
+        return {'predictions': [{'prediction': [[0, 0], [0, 0]], 'steps': 1}]}
+    monkeypatch.setattr(app_module.batcher, 'submit', submit)
+
+    request = app_module.SolveRequest(task=TASK, max_steps=5)
+    http_request = Request({'type': 'http', 'headers': []})
+
+    async def run():
+        return await asyncio.gather(*[app_module.solve_puzzle(request, http_request) for _ in range(3)])
+
+    responses = asyncio.run(run())
+    assert all(response.status_code == 200 for response in responses)
+    assert len(appended) == 1 and len(puts) == 1
+    # Appending writes files, so it happens off the event loop
+    assert appended[0][0] is not threading.current_thread()
+
+
+def test_cache_lookups_run_off_the_event_loop(client, app_module, monkeypatch):
+    from starlette.requests import Request
+
+    threads = []
+    get = app_module.cache.get
+    put = app_module.cache.put
+    monkeypatch.setattr(app_module.cache, 'get', lambda key: threads.append(threading.current_thread()) or get(key))
+    monkeypatch.setattr(app_module.cache, 'put', lambda key, value: threads.append(threading.current_thread()) or put(key, value))
+
+    async def submit(task, **options):
+        return {'predictions': [{'prediction': [[0, 0], [0, 0]], 'steps': 1}]}
+    monkeypatch.setattr(app_module.batcher, 'submit', submit)
+
+    request = app_module.SolveRequest(task=TASK, max_steps=3)
+
+    async def run():
+        response = await app_module.solve_puzzle(request, Request({'type': 'http', 'headers': []}))
+        return response, threading.current_thread()
+
+    app_module.cache.clear()
+    response, loop_thread = asyncio.run(run())
+    assert response.status_code == 200
+    assert len(threads) == 2 and loop_thread not in threads
@@ -0,0 +1,52 @@
+"""Tests for thread and batch-size autotuning"""
+import random
+
+import pytest
+
+from autotune import AutotuneConfig, Autotuner, without_carry_store
+from carry_store import CarryStore
+from instrumentation import profiler
+
+
+@pytest.fixture
+def instrumented_model(model, monkeypatch):
+    """The shared model with a carry store and aggregating instrumentation"""
+    monkeypatch.setattr(model, 'carry_store', CarryStore(max_entries=64))
+    monkeypatch.setattr(profiler, 'enabled', True)
+    return model
+
+
+def test_benchmark_leaves_carry_store_and_metrics_alone(instrumented_model, tmp_path):
+    model = instrumented_model
+    store = model.carry_store
+    steps = profiler.snapshot()['steps']
+    tuner = Autotuner(AutotuneConfig(batch_sizes=[2], max_steps=2, rounds=1, grid_side=3, cache_dir=str(tmp_path)))
+
+    assert tuner.measure(model, workers=2, threads=1, batch_size=2, rng=random.Random(0)) > 0
+
+    assert model.carry_store is store
+    assert store.stats()['entries'] == 0
+    assert profiler.snapshot()['steps'] == steps
+
+    # Serving afterwards still uses both
+    model.solve_batch([{'train': [], 'test': [{'input': [[1, 2], [3, 4]]}]}], max_steps=2)
+    assert store.stats()['entries'] == 1
+    assert profiler.snapshot()['steps'] > steps
+
+
+def test_copy_without_carry_store_shares_the_model(instrumented_model):
+    model = instrumented_model
+    clone = without_carry_store(model)
+    assert clone.carry_store is None and model.carry_store is not None
+    assert clone.model is model.model
+
+
+def test_suspend_is_per_thread():
+    import threading
+    seen = []
+    with profiler.suspend():
+        assert profiler.suspended
+        thread = threading.Thread(target=lambda: seen.append(profiler.suspended))
+        thread.start()
+        thread.join()
+    assert seen == [False] and not profiler.suspended
@@ -0,0 +1,59 @@
+"""Tests for the micro-batching scheduler"""
+import asyncio
+import threading
+
+from batching import MicroBatcher, BatcherConfig
+
+
+class SlowModel:
+    """Stand-in model whose batches block until released"""
+
+    def __init__(self):
+        self.release = threading.Event()
+        self.calls = []
+
+    def solve_batch(self, tasks, **options):
+        self.calls.append(len(tasks))
+        self.release.wait(5)
+        return [{'predictions': [], 'rows': len(task['test'])} for task in tasks]
+
+
+def task(rows: int):
+    return {'train': [], 'test': [{'input': [[0]]}] * rows}
+
+
+def test_requests_share_a_batch():
+    async def run():
+        model = SlowModel()
+        model.release.set()
+        batcher = MicroBatcher(model, BatcherConfig(max_batch=4, max_wait_ms=50))
+        batcher.start()
+        results = await asyncio.gather(*(batcher.submit(task(1), max_steps=4) for _ in range(3)))
+        await batcher.stop()
+        return model, results
+
+    model, results = asyncio.run(run())
+    assert model.calls == [3]
+    assert [r['rows'] for r in results] == [1, 1, 1]
+
+
+def test_stop_fails_every_waiting_request():
+    async def run():
+        model = SlowModel()
+        batcher = MicroBatcher(model, BatcherConfig(max_batch=2, max_wait_ms=20))
+        batcher.start()
+        running = asyncio.ensure_future(batcher.submit(task(1)))
+        await asyncio.sleep(0.1)
+        # The only slot is busy: the next batch is collected, then waits for it
+        collected = asyncio.ensure_future(batcher.submit(task(1)))
+        held = asyncio.ensure_future(batcher.submit(task(2)))      # Does not fit next to `collected`
+        await asyncio.sleep(0.1)
+        queued = asyncio.ensure_future(batcher.submit(task(1)))
+        await asyncio.sleep(0)
+        assert batcher._held is not None and len(batcher._collecting) == 1
+        await batcher.stop()
+        model.release.set()
+        return await asyncio.wait_for(asyncio.gather(running, collected, held, queued, return_exceptions=True), 1)
+
+    outcomes = asyncio.run(run())
+    assert [str(outcome) for outcome in outcomes] == ["Batcher stopped"] * 4
@@ -0,0 +1,49 @@
+"""Tests for the benchmark suite's result rows, baseline comparison and memory peaks"""
+import sys
+
+import numpy as np
+import pytest
+
+from benchmark import compare_to_baseline, peak_rss_mb, reset_peak_rss, summarize
+
+
+def case(scenario='grid', params=None, latency_s=0.1, grids=10, wall_s=1.0):
+    return summarize(scenario, params or {'grid': '30x30'}, [latency_s] * 4, grids, wall_s, 16, 100.0)
+
+
+def test_summarize_reports_percentiles_and_throughput():
+    result = summarize('batch', {'batch_size': 4}, [0.01 * i for i in range(1, 101)], 40, 2.0, 8, 123.0)
+    assert result['calls'] == 100 and result['errors'] == 0
+    assert result['latency_ms']['p50'] == pytest.approx(505.0)
+    assert result['latency_ms']['p99'] == pytest.approx(990.1)
+    assert result['grids_per_second'] == 20.0
+    assert result['step_ms'] == pytest.approx(505.0 / 8)
+    assert result['peak_rss_mb'] == 123.0
+
+
+@pytest.mark.parametrize('current, regressed', [
+    (case(latency_s=0.109), []),
+    (case(latency_s=0.111), ['latency_ms.p50']),
+    (case(grids=8.9), ['grids_per_second']),
+    (case(latency_s=0.2, grids=5), ['latency_ms.p50', 'grids_per_second']),
+    (case(latency_s=0.05, grids=20), []),
+])
+def test_only_changes_for_the_worse_beyond_the_threshold_regress(current, regressed):
+    regressions = compare_to_baseline([current], [case()], threshold=0.1)
+    assert [r['metric'] for r in regressions] == regressed
+    assert all(r['case'] == 'grid:{"grid": "30x30"}' for r in regressions)
+
+
+def test_cases_missing_from_the_baseline_are_skipped():
+    assert compare_to_baseline([case(params={'grid': '5x5'}, latency_s=9.0)], [case()], threshold=0.1) == []
+
+
+@pytest.mark.skipif(not sys.platform.startswith('linux'), reason="VmHWM is Linux only")
+def test_peak_rss_restarts_after_a_reset():
+    block = np.ones(64 * 2 ** 20 // 8)
+    block[::512] = 2.0   # Touch every page
+    peak = peak_rss_mb()
+    del block
+    if not reset_peak_rss():
+        pytest.skip("clear_refs is not writable here")
+    assert peak_rss_mb() < peak - 32
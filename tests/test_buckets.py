@@ -0,0 +1,57 @@
+"""Tests for size-bucketed execution at 100/225/400/900 tokens"""
+import pytest
+import torch
+
+from inference import SEQ_BUCKETS
+
+# Grids filling each bucket exactly, and one cell row or column past it
+SHAPES = [(1, 1), (10, 10), (10, 11), (15, 15), (15, 16), (20, 20), (20, 21), (30, 30)]
+
+
+def grid(height, width, seed):
+    generator = torch.Generator().manual_seed(seed)
+    return torch.randint(0, 10, (height, width), generator=generator).tolist()
+
+
+GRIDS = [grid(h, w, i) for i, (h, w) in enumerate(SHAPES)]
+
+
+def reference(model, grid, seq_len, max_steps):
+    """Plain ACT loop of a model built at `seq_len`, for one grid"""
+    net = model.build_shared_model(seq_len)
+    batch = {'inputs': model.pad_input(grid, seq_len)[None],
+             'puzzle_identifiers': torch.zeros(1, 1, dtype=torch.int32)}
+    with torch.no_grad():
+        carry = net.initial_carry(batch)
+        for _ in range(max_steps):
+            carry, outputs = net(carry, batch)
+    height, width = len(grid), len(grid[0])
+    return outputs['logits'][0].argmax(dim=-1)[:height * width].view(height, width).tolist()
+
+
+def test_grids_go_to_the_smallest_bucket_that_holds_them(model):
+    assert SEQ_BUCKETS == (100, 225, 400, 900)
+    assert [model.bucket_for(h, w) for h, w in SHAPES] == [100, 100, 225, 225, 400, 400, 900, 900]
+
+
+def test_bucketed_rows_match_a_model_built_at_their_bucket(model):
+    tasks = [{'train': [], 'test': [{'input': g}]} for g in GRIDS]
+    results = model.solve_batch(tasks, max_steps=3, bucketed=True)
+    for g, (h, w), result in zip(GRIDS, SHAPES, results):
+        assert result['predictions'][0]['prediction'] == reference(model, g, model.bucket_for(h, w), 3), (h, w)
+
+
+@pytest.mark.parametrize('shape', [shape for shape in SHAPES if shape[0] * shape[1] > 400])
+def test_bucketed_and_unbucketed_agree_in_the_full_length_bucket(model, shape):
+    # Padding tokens take part in attention, so only grids running at 900 tokens either way agree exactly
+    task = {'train': [], 'test': [{'input': GRIDS[SHAPES.index(shape)]}]}
+    assert model.solve(task, max_steps=3, bucketed=True) == model.solve(task, max_steps=3)
+
+
+def test_bucketed_batches_do_not_depend_on_their_mix_of_sizes(model):
+    together = model.solve({'train': [], 'test': [{'input': g} for g in GRIDS]}, max_steps=3, bucketed=True)
+    for index, g in enumerate(GRIDS):
+        # Each test input keeps its puzzle id (its index) when solved on its own
+        alone = model.solve_batch([{'train': [], 'test': [{'input': [[0]]}] * index + [{'input': g}]}],
+                                  max_steps=3, bucketed=True)[0]
+        assert together['predictions'][index] == alone['predictions'][index]
@@ -0,0 +1,57 @@
+"""Tests for the prediction cache"""
+import numpy as np
+
+from cache import PredictionCache, task_key
+
+TASK = {'train': [{'input': [[1, 2]], 'output': [[2, 1]]}], 'test': [{'input': [[3, 4]]}]}
+RESULT = {'predictions': [{'prediction': np.array([[4, 3]], dtype=np.uint8), 'steps': 4}]}
+
+
+def test_hit_after_put():
+    cache = PredictionCache(max_entries=4)
+    cache.bind('abc')
+    key = cache.key(TASK, max_steps=4)
+    assert cache.get(key) is None
+    cache.put(key, RESULT)
+    assert cache.get(key)['predictions'][0]['prediction'].tolist() == [[4, 3]]
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_miss_after_the_fingerprint_changes():
+    cache = PredictionCache(max_entries=4)
+    cache.bind('abc')
+    cache.put(cache.key(TASK, max_steps=4), RESULT)
+    cache.bind('abc-bf16')
+    assert cache.stats()['entries'] == 0
+    assert cache.get(cache.key(TASK, max_steps=4)) is None
+
+
+def test_key_depends_on_grids_options_and_fingerprint_only():
+    key = task_key(TASK, 'abc', max_steps=4)
+    assert task_key({**TASK, 'id': 'ignored'}, 'abc', max_steps=4) == key
+    assert task_key(TASK, 'abc', max_steps=8) != key
+    assert task_key(TASK, 'def', max_steps=4) != key
+
+
+def test_callers_cannot_modify_cached_entries():
+    cache = PredictionCache(max_entries=4)
+    cache.bind('abc')
+    key = cache.key(TASK, max_steps=4)
+    result = {'predictions': [{'prediction': [[4, 3]], 'steps': 4}]}
+    cache.put(key, result)
+    result['predictions'][0]['prediction'][0][0] = 9
+    hit = cache.get(key)
+    hit['predictions'][0]['steps'] = 0
+    hit['cached'] = True
+    assert cache.get(key) == {'predictions': [{'prediction': [[4, 3]], 'steps': 4}]}
+
+
+def test_disk_tier_survives_a_new_instance(tmp_path):
+    cache = PredictionCache(max_entries=4, disk_dir=str(tmp_path))
+    cache.bind('abc')
+    cache.put(cache.key(TASK, max_steps=4), RESULT)
+
+    restarted = PredictionCache(max_entries=4, disk_dir=str(tmp_path))
+    restarted.bind('abc')
+    assert restarted.get(restarted.key(TASK, max_steps=4)) == {'predictions': [{'prediction': [[4, 3]], 'steps': 4}]}
+    assert restarted.disk_hits == 1
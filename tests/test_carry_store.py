@@ -0,0 +1,54 @@
+"""Tests for resuming recursion from stored carries"""
+import pytest
+
+from carry_store import CarryStore
+
+
+@pytest.fixture
+def with_store(model, monkeypatch):
+    """The shared model with an empty in-memory carry store"""
+    store = CarryStore(max_entries=64)
+    monkeypatch.setattr(model, 'carry_store', store)
+    return store
+
+
+def fresh(model, monkeypatch, tasks, max_steps):
+    with monkeypatch.context() as patch:
+        patch.setattr(model, 'carry_store', None)
+        return model.solve_batch(tasks, max_steps=max_steps)
+
+
+def test_extending_a_run_matches_a_fresh_run(model, eval_tasks, with_store, monkeypatch):
+    tasks = list(eval_tasks.values())
+    expected = fresh(model, monkeypatch, tasks, 8)
+
+    model.solve_batch(tasks, max_steps=4)
+    assert with_store.stats()['entries'] == sum(len(task['test']) for task in tasks)
+    assert model.solve_batch(tasks, max_steps=8) == expected
+    assert with_store.hits == sum(len(task['test']) for task in tasks)
+
+
+def test_fewer_steps_answer_from_the_history(model, eval_tasks, with_store, monkeypatch):
+    tasks = list(eval_tasks.values())
+    expected = fresh(model, monkeypatch, tasks, 3)
+    model.solve_batch(tasks, max_steps=8)
+    assert model.solve_batch(tasks, max_steps=3) == expected
+
+
+def test_bucketed_runs_resume_too(model, eval_tasks, with_store, monkeypatch):
+    tasks = list(eval_tasks.values())[:2]
+    with monkeypatch.context() as patch:
+        patch.setattr(model, 'carry_store', None)
+        expected = model.solve_batch(tasks, max_steps=6, bucketed=True)
+    model.solve_batch(tasks, max_steps=2, bucketed=True)
+    assert model.solve_batch(tasks, max_steps=6, bucketed=True) == expected
+    assert with_store.hits > 0
+
+
+def test_show_iterations_runs_from_the_start(model, eval_tasks, with_store, monkeypatch):
+    task = next(iter(eval_tasks.values()))
+    with monkeypatch.context() as patch:
+        patch.setattr(model, 'carry_store', None)
+        expected = model.solve(task, max_steps=6, show_iterations=True)
+    model.solve(task, max_steps=3)
+    assert model.solve(task, max_steps=6, show_iterations=True) == expected
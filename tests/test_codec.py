@@ -0,0 +1,99 @@
+"""Tests for grid encoding and the binary prediction payload"""
+import json
+
+import numpy as np
+import pytest
+
+from codec import (decode_grids, dumps, encode_grids, grid_delta, pack_cells, pack_predictions, unpack_cells,
+                   unpack_predictions)
+
+
+def random_grid(rng, height, width):
+    return rng.integers(0, 10, size=(height, width)).tolist()
+
+
+@pytest.fixture
+def predictions():
+    rng = np.random.default_rng(0)
+    return [
+        {'prediction': random_grid(rng, 3, 4), 'steps': 7},
+        {'prediction': random_grid(rng, 30, 30), 'steps': 16,
+         'iterations': [{'step': s, 'prediction': random_grid(rng, 30, 30)} for s in range(1, 17)]},
+        {'prediction': [[5]], 'steps': 1},
+        {'prediction': [[1, 2]], 'attempts': [[[1, 2]], [[2, 2]]], 'agreement': 2 / 3, 'steps': 4},
+    ]
+
+
+def test_pack_predictions_round_trip(predictions):
+    assert unpack_predictions(pack_predictions(predictions)) == predictions
+
+
+def test_pack_predictions_accepts_arrays(predictions):
+    arrays = [
+        dict(p, prediction=np.array(p['prediction'], dtype=np.uint8),
+             **({'attempts': [np.array(a, dtype=np.uint8) for a in p['attempts']]} if 'attempts' in p else {}),
+             **({'iterations': [dict(i, prediction=np.array(i['prediction'], dtype=np.uint8))
+                                for i in p['iterations']]} if 'iterations' in p else {}))
+        for p in predictions
+    ]
+    assert pack_predictions(arrays) == pack_predictions(predictions)
+
+
+def test_unpack_rejects_other_payloads(predictions):
+    with pytest.raises(ValueError):
+        unpack_predictions(b'{"predictions": []}')
+    data = bytearray(pack_predictions(predictions))
+    data[4] = 99
+    with pytest.raises(ValueError):
+        unpack_predictions(bytes(data))
+
+
+def test_encode_decode_grids_round_trip():
+    rng = np.random.default_rng(1)
+    grids = [random_grid(rng, h, w) for h, w in [(1, 1), (2, 5), (30, 30), (7, 3)]]
+    batch = encode_grids(grids, 900)
+    assert batch.shape == (4, 900) and batch.dtype == np.int32
+    shapes = [(len(g), len(g[0])) for g in grids]
+    assert decode_grids(batch, shapes) == grids
+    assert [a.tolist() for a in decode_grids(batch, shapes, as_arrays=True)] == grids
+
+
+def test_dumps_matches_json_for_arrays(predictions):
+    value = {'predictions': [dict(p, prediction=np.array(p['prediction'], dtype=np.uint8)) for p in predictions]}
+    assert json.loads(dumps(value)) == {'predictions': predictions}
+
+
+def test_array_grids_match_list_grids(model):
+    task = {'train': [], 'test': [{'input': [[1, 2, 3], [4, 5, 6]]}, {'input': [[0] * 9] * 9}]}
+    lists = model.solve_batch([task], max_steps=2, show_iterations=True)[0]['predictions']
+    arrays = model.solve_batch([task], max_steps=2, show_iterations=True, array_grids=True)[0]['predictions']
+    assert pack_predictions(arrays) == pack_predictions(lists)
+    assert unpack_predictions(pack_predictions(arrays)) == lists
+
+
+@pytest.mark.parametrize('count', [0, 1, 2, 9, 900])
+def test_pack_cells_round_trip(count):
+    cells = np.random.default_rng(count).integers(0, 16, size=count).astype(np.uint8)
+    data = pack_cells(cells)
+    assert len(data) == (count + 1) // 2
+    assert np.array_equal(unpack_cells(b'xx' + data, count, offset=2), cells)
+
+
+def test_pack_cells_rejects_wide_values():
+    with pytest.raises(ValueError):
+        pack_cells(np.array([3, 16]))
+
+
+def test_grid_delta_rebuilds_the_next_grid():
+    rng = np.random.default_rng(0)
+    previous = np.array(random_grid(rng, 5, 7))
+    current = previous.copy()
+    current[[0, 2, 4], [6, 3, 0]] = (previous[[0, 2, 4], [6, 3, 0]] + 1) % 10
+    changes = grid_delta(previous, current)
+    assert len(changes) == 3
+    # As the web client applies them to its copy of the grid
+    grid = previous.tolist()
+    for row, col, value in changes:
+        grid[row][col] = value
+    assert grid == current.tolist()
+    assert grid_delta(current, current) == []
@@ -0,0 +1,28 @@
+"""Tests for the compiled recursion-step backends"""
+import importlib.util
+
+import pytest
+
+from compiled import check_parity
+from fast_start import model_tensors
+
+TASKS = [
+    {'train': [], 'test': [{'input': [[1, 2, 3], [4, 5, 6]]}, {'input': [[0, 9], [9, 0], [3, 3]]}]},
+    {'train': [], 'test': [{'input': [[5] * 6] * 6}]},
+]
+
+
+@pytest.mark.parametrize('backend', [
+    'script',
+    'compile',
+    pytest.param('onnx', marks=pytest.mark.skipif(importlib.util.find_spec('onnxruntime') is None,
+                                                  reason="onnxruntime is not installed")),
+])
+def test_backend_matches_eager(model, backend):
+    from inference import TRMInference
+    compiled = TRMInference(weights=model_tensors(model.model), backend=backend)
+    report = check_parity(compiled, TASKS, max_steps=3)
+    assert report['ok'], report
+    assert report['predictions_match'] == 1.0
+    assert compiled.backend == backend
+    assert compiled.solve_batch(TASKS, max_steps=3) == model.solve_batch(TASKS, max_steps=3)
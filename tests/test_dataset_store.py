@@ -0,0 +1,95 @@
+"""Tests for the memory-mapped ARC dataset store"""
+import json
+import os
+
+import numpy as np
+
+import dataset_store
+from dataset_store import ARCDatasetStore
+
+
+def write_source(path, tasks):
+    with open(path, 'w') as f:
+        json.dump(tasks, f)
+
+
+SMALL = {
+    'a1': {'train': [{'input': [[1, 2], [3, 4]], 'output': [[4]]}], 'test': [{'input': [[5, 6, 7]]}]},
+    'b2': {'train': [], 'test': [{'input': [[0]], 'output': [[9]]}, {'input': [[1]], 'output': [[8]]}]},
+}
+
+
+def test_store_matches_the_json_for_every_task(challenges_path, tmp_path):
+    with open(challenges_path, 'r') as f:
+        source = json.load(f)
+    store = ARCDatasetStore(challenges_path, store_dir=str(tmp_path / 'store'))
+    assert store.task_ids == list(source)
+    for task_id, task in source.items():
+        assert store.get_task(task_id) == task
+
+
+def test_arrays_are_uint8_views(tmp_path):
+    write_source(tmp_path / 'tasks.json', SMALL)
+    store = ARCDatasetStore(str(tmp_path / 'tasks.json'))
+    arrays = store.get_arrays('a1')
+    assert arrays['train'][0]['input'].dtype == np.uint8
+    assert arrays['test'][0]['input'].tolist() == [[5, 6, 7]]
+    assert store.get_task('b2') == SMALL['b2']
+
+
+def test_rebuild_swaps_builds_without_a_gap(tmp_path):
+    source = tmp_path / 'tasks.json'
+    write_source(source, SMALL)
+    store = ARCDatasetStore(str(source))
+    first = store._current()
+    old_view = store.get_arrays('a1')['test'][0]['input']
+
+    changed = {**SMALL, 'c3': {'train': [], 'test': [{'input': [[3]]}]}}
+    write_source(source, changed)
+    os.utime(source, ns=(0, os.stat(source).st_mtime_ns + 1))
+    assert store.source_changed()
+    store.refresh()
+    assert store.get_task('c3') == changed['c3']
+    # The previous build stays for readers that opened it; it is still readable
+    assert os.path.isdir(first) and store._current() != first
+    assert old_view.tolist() == [[5, 6, 7]]
+
+    write_source(source, SMALL)
+    os.utime(source, ns=(0, os.stat(source).st_mtime_ns + 2))
+    store.refresh()
+    builds = [entry for entry in os.listdir(store.store_dir) if entry.startswith('build-')]
+    assert len(builds) == 2 and not os.path.exists(first)
+
+
+def test_touched_but_unchanged_source_is_not_rebuilt(tmp_path):
+    source = tmp_path / 'tasks.json'
+    write_source(source, SMALL)
+    store = ARCDatasetStore(str(source))
+    build = store._current()
+    os.utime(source, ns=(0, os.stat(source).st_mtime_ns + 1))
+    store.refresh()
+    assert store._current() == build and not store.source_changed()
+
+
+def test_version_1_layout_is_replaced(tmp_path):
+    source = tmp_path / 'tasks.json'
+    write_source(source, SMALL)
+    old = tmp_path / 'tasks.json.store'
+    old.mkdir()
+    (old / 'index.json').write_text(json.dumps({'source': {'version': 1}, 'task_ids': []}))
+    (old / 'grids.bin').write_bytes(b'')
+    store = ARCDatasetStore(str(source))
+    assert store.get_task('a1') == SMALL['a1']
+    assert not (old / 'index.json').exists() and not (old / 'grids.bin').exists()
+
+
+def test_read_only_dataset_directory_uses_the_user_cache(tmp_path, monkeypatch):
+    source = tmp_path / 'data' / 'tasks.json'
+    source.parent.mkdir()
+    write_source(source, SMALL)
+    monkeypatch.setenv('XDG_CACHE_HOME', str(tmp_path / 'cache'))
+    monkeypatch.setattr(dataset_store, '_writable', lambda path: False)
+    store = ARCDatasetStore(str(source))
+    assert store.store_dir.startswith(str(tmp_path / 'cache' / 'trm' / 'datasets'))
+    assert not (tmp_path / 'data' / 'tasks.json.store').exists()
+    assert store.get_task('b2') == SMALL['b2']
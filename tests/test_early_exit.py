@@ -0,0 +1,65 @@
+"""Tests for the early-exit policy and dropping finished rows from the batch"""
+import pytest
+import torch
+
+from inference import EarlyExitPolicy
+
+
+def grid(height, width, seed):
+    generator = torch.Generator().manual_seed(seed)
+    return torch.randint(0, 10, (height, width), generator=generator).tolist()
+
+
+# Sizes whose predictions settle at different steps under the test model
+TASKS = [{'train': [], 'test': [{'input': grid(h, w, i)}]}
+         for i, (h, w) in enumerate([(1, 1), (10, 10), (10, 11), (15, 15), (15, 16), (20, 20), (20, 21), (30, 30)])]
+
+
+@pytest.fixture(scope='module')
+def full_runs(model):
+    """Every step's prediction of each task without a policy (with the carry store off, which would skip steps)"""
+    with pytest.MonkeyPatch.context() as patch:
+        patch.setattr(model, 'carry_store', None)
+        yield [[it['prediction'] for it in result['predictions'][0]['iterations']]
+               for result in model.solve_batch(TASKS, max_steps=8, show_iterations=True)]
+
+
+def stable_stop(iterations, stable_steps):
+    """Step at which a row's prediction has been unchanged for `stable_steps` steps"""
+    stable = 0
+    for step in range(1, len(iterations)):
+        stable = stable + 1 if iterations[step] == iterations[step - 1] else 0
+        if stable >= stable_steps:
+            return step + 1
+    return len(iterations)
+
+
+def test_stable_predictions_stop_rows_early(model, full_runs):
+    results = model.solve_batch(TASKS, max_steps=8, early_exit=EarlyExitPolicy(stable_steps=2))
+    steps = [result['predictions'][0]['steps'] for result in results]
+    assert steps == [stable_stop(iterations, 2) for iterations in full_runs]
+    # Some rows stop early while others keep running
+    assert min(steps) < 8 and max(steps) == 8
+
+
+def test_halt_confidence_stops_rows_early(model, full_runs):
+    results = model.solve_batch(TASKS, max_steps=8, early_exit=EarlyExitPolicy(halt_threshold=1e-6))
+    assert [result['predictions'][0]['steps'] for result in results] == [1] * len(TASKS)
+    assert [result['predictions'][0]['prediction'] for result in results] == [runs[0] for runs in full_runs]
+
+
+def test_dropped_rows_keep_their_final_predictions(model, full_runs):
+    results = model.solve_batch(TASKS, max_steps=8, show_iterations=True,
+                                early_exit=EarlyExitPolicy(stable_steps=2))
+    for result, iterations in zip(results, full_runs):
+        prediction = result['predictions'][0]
+        steps = prediction['steps']
+        assert prediction['prediction'] == iterations[steps - 1]
+        # Rows still running are unaffected by the rows dropped around them
+        assert [it['prediction'] for it in prediction['iterations']] == iterations[:steps]
+
+
+def test_no_policy_runs_every_step(model, full_runs):
+    results = model.solve_batch(TASKS, max_steps=8, early_exit=EarlyExitPolicy())
+    assert all(result['predictions'][0]['steps'] == 8 for result in results)
+    assert [result['predictions'][0]['prediction'] for result in results] == [runs[-1] for runs in full_runs]
@@ -0,0 +1,106 @@
+"""Tests for checkpoint ensembles"""
+import pytest
+import torch
+
+from ensemble import EnsembleConfig, TRMEnsemble
+from inference import EarlyExitPolicy
+
+
+@pytest.fixture(scope='module')
+def checkpoints(model, tmp_path_factory):
+    """Two checkpoints with the shared model's weights perturbed, snapshots going to a temp dir"""
+    directory = tmp_path_factory.mktemp('ensemble')
+    generator = torch.Generator().manual_seed(1)
+    paths = []
+    for i in range(2):
+        state = {name: tensor + 0.1 * torch.randn(tensor.shape, generator=generator) if tensor.is_floating_point()
+                 else tensor
+                 for name, tensor in model.model.state_dict().items()}
+        paths.append(str(directory / f"member{i}.pt"))
+        torch.save({'model_state_dict': state}, paths[-1])
+    with pytest.MonkeyPatch.context() as patch:
+        patch.setenv('TRM_MODEL_CACHE_DIR', str(directory / 'snapshots'))
+        yield paths
+
+
+@pytest.fixture(scope='module')
+def ensembles(model, checkpoints):
+    """The same members run one thread each and stacked, for each vote method"""
+    built = {(mode, vote): TRMEnsemble(model, EnsembleConfig(checkpoints=checkpoints, mode=mode, vote=vote,
+                                                             weights=[1.0, 0.8, 0.6]))
+             for mode in ('threads', 'stacked') for vote in ('majority', 'confidence')}
+    yield built
+    for ensemble in built.values():
+        ensemble.close()
+
+
+def without_report(results):
+    return [{k: v for k, v in result.items() if k != 'ensemble'} for result in results]
+
+
+@pytest.fixture(params=[1, 3], ids=['inline', 'member-threads'])
+def intra_op_threads(request):
+    """Intra-op threads of the calling thread; with one per member, members run on their own threads"""
+    previous = torch.get_num_threads()
+    torch.set_num_threads(request.param)
+    yield request.param
+    torch.set_num_threads(previous)
+
+
+@pytest.mark.parametrize('bucketed', [False, True])
+def test_stacked_votes_match_threaded_votes(eval_tasks, ensembles, intra_op_threads, bucketed):
+    tasks = list(eval_tasks.values())
+    threaded = ensembles['threads', 'majority']
+    stacked = ensembles['stacked', 'majority']
+    runs = stacked.stacked_runs
+    assert without_report(stacked.solve_batch(tasks, max_steps=4, bucketed=bucketed)) == \
+        without_report(threaded.solve_batch(tasks, max_steps=4, bucketed=bucketed))
+    assert stacked.stacked_runs == runs + 1
+
+
+def test_stacked_confidence_votes_match_threaded(eval_tasks, ensembles):
+    tasks = list(eval_tasks.values())
+    threaded = ensembles['threads', 'confidence'].solve_batch(tasks, max_steps=4)
+    stacked = ensembles['stacked', 'confidence'].solve_batch(tasks, max_steps=4)
+    for a, b in zip(threaded, stacked):
+        for pa, pb in zip(a['predictions'], b['predictions']):
+            assert pa['attempts'] == pb['attempts'] and pa['steps'] == pb['steps']
+            assert pa['agreement'] == pytest.approx(pb['agreement'], abs=1e-4)
+
+
+def test_members_vote_by_weight(model, eval_tasks, ensembles):
+    tasks = list(eval_tasks.values())
+    ensemble = ensembles['threads', 'majority']
+    members = [member.solve_batch(tasks, max_steps=4) for member in ensemble.members]
+    for t, result in enumerate(ensemble.solve_batch(tasks, max_steps=4)):
+        for i, prediction in enumerate(result['predictions']):
+            votes = {}
+            for member, weight in zip(members, [1.0, 0.8, 0.6]):
+                grid = member[t]['predictions'][i]['prediction']
+                votes[str(grid)] = votes.get(str(grid), 0.0) + weight
+            assert votes[str(prediction['prediction'])] == max(votes.values())
+            assert prediction['agreement'] == pytest.approx(max(votes.values()) / 2.4)
+
+
+def test_unstackable_requests_fall_back_to_threads(eval_tasks, ensembles):
+    task = next(iter(eval_tasks.values()))
+    stacked = ensembles['stacked', 'majority']
+    runs = stacked.threaded_runs
+    stacked.solve_batch([task], max_steps=3, show_iterations=True)
+    stacked.solve_batch([task], max_steps=3, early_exit=EarlyExitPolicy(halt_threshold=0.5))
+    assert stacked.threaded_runs == runs + 2
+
+
+def test_stacking_members_with_profiler_hooks(model, checkpoints, eval_tasks, ensembles, monkeypatch):
+    from instrumentation import profiler
+    monkeypatch.setattr(profiler, 'enabled', True)
+    ensemble = TRMEnsemble(model, EnsembleConfig(checkpoints=checkpoints, mode='stacked', weights=[1.0, 0.8, 0.6]))
+    try:
+        for member in ensemble.members:
+            profiler.attach(member.model)
+        tasks = list(eval_tasks.values())[:1]
+        assert without_report(ensemble.solve_batch(tasks, max_steps=2)) == \
+            without_report(ensembles['threads', 'majority'].solve_batch(tasks, max_steps=2))
+        assert ensemble.stacked_runs == 1
+    finally:
+        ensemble.close()
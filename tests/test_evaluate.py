@@ -0,0 +1,114 @@
+"""Tests for evaluation progress files"""
+import argparse
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from evaluate import Progress, run_settings
+
+SETTINGS = {'max_steps': 16, 'batch_size': 4}
+
+
+def records(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f]
+
+
+def entry(task_id):
+    return [{'attempt_1': [[int(task_id[-1])]], 'attempt_2': [[0]]}]
+
+
+def test_resume_keeps_finished_tasks(tmp_path):
+    path = str(tmp_path / 'progress.jsonl')
+    progress = Progress(path, SETTINGS, resume=True)
+    progress.add('task-1', entry('task-1'))
+    progress.close()
+
+    progress = Progress(path, SETTINGS, resume=True)
+    assert progress.done == {'task-1': entry('task-1')}
+    progress.add('task-2', entry('task-2'))
+    progress.close()
+    assert [r.get('task_id') for r in records(path)] == [None, 'task-1', 'task-2']
+
+
+@pytest.mark.parametrize('torn', ['{"task_id":"task-2","en', '{"task_id":"task-2","entry":[]}'])
+def test_resume_cuts_off_a_torn_last_line(tmp_path, torn):
+    path = str(tmp_path / 'progress.jsonl')
+    progress = Progress(path, SETTINGS, resume=False)
+    progress.add('task-1', entry('task-1'))
+    progress.close()
+    with open(path, 'a') as f:
+        f.write(torn)
+
+    progress = Progress(path, SETTINGS, resume=True)
+    assert list(progress.done) == ['task-1']
+    progress.add('task-3', entry('task-3'))
+    progress.close()
+
+    # Every line parses again, and the torn record is gone
+    assert [r.get('task_id') for r in records(path)] == [None, 'task-1', 'task-3']
+    assert list(Progress(path, SETTINGS, resume=True).done) == ['task-1', 'task-3']
+
+
+@pytest.mark.parametrize('content', ['', '{"settings":{"max_st', '{"settings":{"max_steps":16,"batch_size":4}}'])
+def test_empty_or_torn_header_starts_over(tmp_path, content):
+    path = tmp_path / 'progress.jsonl'
+    path.write_text(content)
+
+    progress = Progress(str(path), SETTINGS, resume=True)
+    assert progress.done == {}
+    progress.close()
+    assert records(path) == [{'settings': SETTINGS}]
+
+
+def test_different_settings_are_refused(tmp_path):
+    path = str(tmp_path / 'progress.jsonl')
+    Progress(path, SETTINGS, resume=True).close()
+    with pytest.raises(SystemExit):
+        Progress(path, dict(SETTINGS, max_steps=8), resume=True)
+
+
+def test_restart_discards_previous_records(tmp_path):
+    path = str(tmp_path / 'progress.jsonl')
+    progress = Progress(path, SETTINGS, resume=True)
+    progress.add('task-1', entry('task-1'))
+    progress.close()
+    Progress(path, dict(SETTINGS, max_steps=8), resume=False).close()
+    assert records(path) == [{'settings': dict(SETTINGS, max_steps=8)}]
+
+
+def ensemble_args(**overrides):
+    args = dict(max_steps=16, bucketed=False, halt_threshold=None, stable_steps=None, tta_views=None,
+                ensemble='a.pt,b.pt', ensemble_vote='majority', ensemble_mode='threads')
+    return argparse.Namespace(**{**args, **overrides})
+
+
+def stub_model(conditioning_tag=None):
+    conditioner = SimpleNamespace(config=SimpleNamespace(tag=conditioning_tag)) if conditioning_tag else None
+    return SimpleNamespace(fingerprint='f' * 16, precision='fp32', task_conditioner=conditioner)
+
+
+@pytest.mark.parametrize('change', [{'ensemble_vote': 'confidence'}, {'ensemble_mode': 'stacked'},
+                                    {'ensemble': 'a.pt'}, {'ensemble': None}])
+def test_a_different_ensemble_is_refused(tmp_path, change):
+    model = stub_model()
+    path = str(tmp_path / 'progress.jsonl')
+    Progress(path, run_settings(ensemble_args(), 'challenges.json', model), resume=True).close()
+    with pytest.raises(SystemExit):
+        Progress(path, run_settings(ensemble_args(**change), 'challenges.json', model), resume=True)
+
+
+def test_ensemble_options_are_ignored_without_an_ensemble():
+    model = stub_model()
+    assert run_settings(ensemble_args(ensemble=None), 'challenges.json', model) == \
+        run_settings(ensemble_args(ensemble=None, ensemble_vote='confidence', ensemble_mode='stacked'),
+                     'challenges.json', model)
+
+
+@pytest.mark.parametrize('before, after', [(None, 'abcd1234'), ('abcd1234', None), ('abcd1234', '0123abcd')])
+def test_different_task_conditioning_is_refused(tmp_path, before, after):
+    path = str(tmp_path / 'progress.jsonl')
+    Progress(path, run_settings(ensemble_args(), 'challenges.json', stub_model(before)), resume=True).close()
+    with pytest.raises(SystemExit):
+        Progress(path, run_settings(ensemble_args(), 'challenges.json', stub_model(after)), resume=True)
@@ -0,0 +1,59 @@
+"""Tests for the dedicated inference executor"""
+import asyncio
+import threading
+
+import pytest
+import torch
+
+from executor import InferenceExecutor, ExecutorConfig, ExecutorSaturated
+
+TASK = {'train': [], 'test': [{'input': [[1, 2, 3], [4, 5, 6]]}, {'input': [[7] * 4] * 4}]}
+
+
+@pytest.mark.parametrize('precision', ['fp32', 'bf16'])
+def test_streamed_steps_keep_inference_numerics_on_every_thread(model, monkeypatch, precision):
+    monkeypatch.setattr(model, 'precision', precision)
+    monkeypatch.setattr(model, 'carry_store', None)
+    seen = []
+
+    def step_for(net):
+        def step(carry, batch):
+            seen.append((threading.current_thread().name, torch.is_grad_enabled(), torch.is_autocast_enabled('cpu')))
+            return net(carry, batch)
+        return step
+    monkeypatch.setattr(model, 'step_for', step_for)
+
+    executor = InferenceExecutor(ExecutorConfig(workers=4))
+
+    async def run():
+        return [event async for event in executor.stream(model.solve_stream(TASK, max_steps=6))]
+
+    try:
+        events = asyncio.run(run())
+    finally:
+        executor.shutdown()
+    assert events[-1] == {'event': 'done', 'steps': [6, 6]}
+    assert len(seen) == 6
+    # Whichever pool thread resumed the generator, every step ran without autograd
+    assert not any(grad for _, grad, _ in seen)
+    assert all(autocast == (precision == 'bf16') for _, _, autocast in seen)
+    assert all(name.startswith('trm-inference') for name, _, _ in seen)
+
+
+def test_run_is_rejected_when_the_queue_is_full():
+    executor = InferenceExecutor(ExecutorConfig(workers=1, max_pending=1))
+    release = threading.Event()
+
+    async def run():
+        first = asyncio.ensure_future(executor.run(release.wait, 5))
+        await asyncio.sleep(0.01)
+        with pytest.raises(ExecutorSaturated):
+            await executor.run(lambda: None)
+        release.set()
+        await first
+
+    try:
+        asyncio.run(run())
+    finally:
+        executor.shutdown()
+    assert executor.rejected == 1 and executor.pending == 0
@@ -0,0 +1,77 @@
+"""Tests for checkpoint loading without random initialization, and model snapshots"""
+import os
+
+import pytest
+import torch
+
+from fast_start import build_model, model_tensors, snapshot_path
+
+TASKS = [{'train': [], 'test': [{'input': [[1, 2, 3], [4, 5, 6]]}, {'input': [[7] * 5] * 4}]}]
+
+
+@pytest.fixture
+def checkpoint(model, tmp_path, monkeypatch):
+    """The random model saved as a training checkpoint, with snapshots going to a temp dir"""
+    monkeypatch.setenv('TRM_MODEL_CACHE_DIR', str(tmp_path / 'snapshots'))
+    path = str(tmp_path / 'model.pt')
+    torch.save({'model_state_dict': model.model.state_dict()}, path)
+    return path
+
+
+def assert_same_weights(a, b):
+    a, b = model_tensors(a), model_tensors(b)
+    assert a.keys() == b.keys()
+    for name in a:
+        assert torch.equal(a[name], b[name]), name
+
+
+def test_cold_start_matches_the_checkpoint(model, checkpoint):
+    from inference import TRMInference
+    cold = TRMInference(checkpoint_path=checkpoint, fast_start=False)
+    assert_same_weights(cold.model, model.model)
+    assert cold.solve_batch(TASKS, max_steps=2) == model.solve_batch(TASKS, max_steps=2)
+
+
+def test_snapshot_start_matches_the_cold_start(model, checkpoint):
+    from inference import TRMInference
+    cold = TRMInference(checkpoint_path=checkpoint)
+    assert os.path.exists(snapshot_path(checkpoint))
+    warm = TRMInference(checkpoint_path=checkpoint)
+    assert warm.fingerprint == cold.fingerprint
+    assert_same_weights(warm.model, cold.model)
+    assert warm.solve_batch(TASKS, max_steps=2) == cold.solve_batch(TASKS, max_steps=2)
+
+
+
+def test_same_named_checkpoints_get_separate_snapshots(tmp_path, monkeypatch):
+    monkeypatch.setenv('TRM_MODEL_CACHE_DIR', str(tmp_path / 'snapshots'))
+    first, second = snapshot_path(str(tmp_path / 'a' / 'model.pt')), snapshot_path(str(tmp_path / 'b' / 'model.pt'))
+    assert first != second
+    assert os.path.dirname(first) == os.path.dirname(second) == str(tmp_path / 'snapshots')
+    assert snapshot_path(os.path.relpath(str(tmp_path / 'a' / 'model.pt'))) == first
+
+def test_cold_start_skips_random_initialization(model, checkpoint, monkeypatch):
+    import inference
+    model_cls = inference.TinyRecursiveReasoningModel_ACTV1
+    built = []
+
+    def spy(_, model_config, tensors):
+        built.append(sorted(tensors))
+        return build_model(model_cls, model_config, tensors)
+
+    monkeypatch.setattr(inference, 'build_model', spy)
+    monkeypatch.setattr(inference, 'TinyRecursiveReasoningModel_ACTV1', None)   # Plain construction would fail
+    inference.TRMInference(checkpoint_path=checkpoint, fast_start=False)
+    assert built == [sorted(model.model.state_dict())]
+
+
+def test_build_model_rejects_incomplete_or_mismatched_tensors(model):
+    cls = type(model.model)
+    state = model.model.state_dict()
+    name = next(iter(state))
+    with pytest.raises(ValueError, match="No tensors"):
+        build_model(cls, model.model_config, {k: v for k, v in state.items() if k != name})
+    with pytest.raises(ValueError, match="shape"):
+        build_model(cls, model.model_config, {**state, name: torch.zeros(1)})
+    with pytest.raises(ValueError, match="Unexpected"):
+        build_model(cls, model.model_config, {**state, 'extra.weight': torch.zeros(1)})
@@ -0,0 +1,24 @@
+"""Tests for batched solving against the per-input reference loop"""
+import pytest
+
+
+@pytest.mark.parametrize('max_steps', [1, 4])
+def test_batched_matches_sequential(model, eval_tasks, max_steps):
+    tasks = list(eval_tasks.values())
+    batched = model.solve_batch(tasks, max_steps=max_steps)
+    for task, result in zip(tasks, batched):
+        assert result == model.solve(task, max_steps=max_steps, batched=False)
+
+
+def test_batched_iterations_match_sequential(model, eval_tasks):
+    task = next(iter(eval_tasks.values()))
+    batched = model.solve(task, max_steps=3, show_iterations=True)
+    sequential = model.solve(task, max_steps=3, show_iterations=True, batched=False)
+    assert batched == sequential
+
+
+def test_batch_composition_does_not_change_results(model, eval_tasks):
+    tasks = list(eval_tasks.values())
+    together = model.solve_batch(tasks, max_steps=2)
+    alone = [model.solve_batch([task], max_steps=2)[0] for task in tasks]
+    assert together == alone
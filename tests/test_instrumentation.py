@@ -0,0 +1,57 @@
+"""Tests for the profiler's metrics export, in-process and across replicas"""
+import pytest
+import torch
+
+from instrumentation import AllocationCounter, Profiler
+
+
+def metric(lines, name):
+    return [line for line in lines if line.startswith(name + ' ') or line.startswith(name + '{')]
+
+
+def test_replica_snapshots_are_added_to_the_parent():
+    parent, replica = Profiler(enabled=True), Profiler(enabled=True)
+    parent.record('solve', 0.0, 1.0)
+    for _ in range(3):
+        replica.record_step(0.0, 0.002, rows=4, flops=100, device='cpu')
+
+    lines = parent.prometheus({0: replica.snapshot(), 1: replica.snapshot()})
+    assert metric(lines, 'trm_step_seconds_count') == ['trm_step_seconds_count 6']
+    assert metric(lines, 'trm_step_rows_total') == ['trm_step_rows_total 24']
+    assert metric(lines, 'trm_step_flops_total') == ['trm_step_flops_total 600']
+    assert 'trm_stage_calls_total{stage="solve"} 1' in lines
+    assert 'trm_stage_calls_total{stage="step"} 6' in lines
+    assert 'trm_step_seconds_bucket{le="0.0025"} 6' in lines
+    assert any('replica="1"' in line for line in metric(lines, 'trm_memory_bytes'))
+
+
+def test_snapshot_is_detached():
+    profiler = Profiler(enabled=True)
+    snapshot = profiler.snapshot()
+    profiler.record_step(0.0, 0.01, rows=1, flops=1, device='cpu')
+    assert snapshot['steps'] == 0 and profiler.snapshot()['steps'] == 1
+
+
+def test_metrics_include_replica_steps(model, monkeypatch):
+    from replicas import ReplicaConfig, ReplicaPool
+    monkeypatch.setenv('TRM_INSTRUMENT', 'true')
+    pool = ReplicaPool(model, ReplicaConfig(replicas=1, cores_per_replica=1))
+    try:
+        assert pool.wait_ready(timeout=120)
+        task = {'train': [], 'test': [{'input': [[1, 2], [3, 4]]}]}
+        pool.solve_batch([task], max_steps=3)
+        lines = Profiler().prometheus(dict(pool.profiles))
+    finally:
+        pool.close()
+    assert metric(lines, 'trm_step_seconds_count') == ['trm_step_seconds_count 3']
+
+
+def test_allocation_counter_skips_in_place_ops_and_views():
+    x = torch.zeros(4, 4)
+    counter = AllocationCounter()
+    with counter:
+        x.add_(1)
+        x.view(16)
+        y = x + 1
+    assert counter.tensors == 1 and counter.by_op == {'add': 1}
+    assert counter.bytes == y.untyped_storage().nbytes()
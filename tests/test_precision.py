@@ -0,0 +1,24 @@
+"""Tests for the numeric precision modes"""
+import contextlib
+
+import pytest
+import torch
+
+from precision import autocast
+
+
+@pytest.mark.parametrize('device', ['cpu', 'mps'])
+def test_bf16_autocast_follows_model_device(device):
+    context = autocast('bf16', device)
+    assert context.device == device
+    assert context.fast_dtype == torch.bfloat16
+
+
+def test_bf16_autocast_runs_matmuls_in_bf16():
+    with autocast('bf16', 'cpu'):
+        assert (torch.ones(2, 2) @ torch.ones(2, 2)).dtype == torch.bfloat16
+
+
+@pytest.mark.parametrize('precision', ['fp32', 'int8'])
+def test_other_precisions_do_not_autocast(precision):
+    assert isinstance(autocast(precision, 'mps'), contextlib.nullcontext)
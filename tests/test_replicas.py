@@ -0,0 +1,125 @@
+"""Tests for replica processes sharing the model's weights"""
+import time
+
+import pytest
+import torch
+
+from replicas import ReplicaConfig, ReplicaError, ReplicaPool
+
+TASK = {'train': [], 'test': [{'input': [[(r * c) % 10 for c in range(30)] for r in range(30)]}]}
+
+
+@pytest.fixture(scope='module')
+def parent():
+    """A model of its own, since the pool moves its weights into shared memory"""
+    from inference import TRMInference
+    torch.manual_seed(0)
+    return TRMInference(checkpoint_path=None, fast_start=False)
+
+
+@pytest.fixture(scope='module')
+def pool(parent):
+    pool = ReplicaPool(parent, ReplicaConfig(replicas=2, cores_per_replica=1))
+    assert pool.wait_ready(timeout=120)
+    yield pool
+    pool.close()
+
+
+def wait_idle(pool, timeout=30.0):
+    deadline = time.monotonic() + timeout
+    while any(pool.outstanding) and time.monotonic() < deadline:
+        time.sleep(0.05)
+    return not any(pool.outstanding)
+
+
+def test_replicas_see_the_parent_weights_without_copies(parent, pool):
+    assert all(tensor.is_shared() for tensor in parent.model.state_dict().values())
+    assert pool.solve_batch([TASK], max_steps=2) == parent.solve_batch([TASK], max_steps=2)
+
+    # An in-place write in the parent reaches the replicas through the shared pages
+    weight = parent.model.inner.lm_head.weight
+    original = weight.detach().clone()
+    try:
+        with torch.no_grad():
+            weight.mul_(-1.0)
+        expected = parent.solve_batch([TASK], max_steps=2)
+        assert pool.solve_batch([TASK], max_steps=2) == expected
+        assert pool.solve_batch([TASK], max_steps=2) == expected
+    finally:
+        with torch.no_grad():
+            weight.copy_(original)
+
+
+def test_jobs_go_to_the_least_loaded_replica(pool):
+    assert wait_idle(pool)
+    first = pool.solve_stream(TASK, max_steps=16)
+    assert next(first)['event'] == 'start'
+    second = pool.solve_stream(TASK, max_steps=16)
+    assert next(second)['event'] == 'start'
+    assert sorted(pool._owner.values()) == [0, 1]
+    assert pool.outstanding == [1, 1]
+    for events in (first, second):
+        assert list(events)[-1]['event'] == 'done'
+    assert pool.outstanding == [0, 0]
+
+
+def test_an_abandoned_stream_counts_until_the_replica_is_done(pool):
+    assert wait_idle(pool)
+    completed = list(pool.completed)
+    events = pool.solve_stream(TASK, max_steps=16)
+    next(events)
+    (replica,) = pool._owner.values()
+    # The client goes away while the replica still has steps to compute
+    # (16 steps of a 30x30 grid on one core take far longer than getting here)
+    events.close()
+    assert pool.outstanding[replica] == 1 and pool.completed[replica] == completed[replica]
+
+    # New work avoids the busy replica
+    other = pool.solve_stream(TASK, max_steps=1)
+    next(other)
+    assert pool._owner[max(pool._owner)] != replica
+    list(other)
+
+    assert wait_idle(pool)
+    assert sum(pool.completed) == sum(completed) + 2
+    assert not pool._abandoned and not pool._waiting
+
+
+def test_a_dead_replica_is_replaced_and_requests_keep_succeeding(parent):
+    pool = ReplicaPool(parent, ReplicaConfig(replicas=2, cores_per_replica=1))
+    try:
+        assert pool.wait_ready(timeout=120)
+        expected = parent.solve_batch([TASK], max_steps=1)
+        victim = pool._processes[0]
+        victim.kill()
+        victim.join(10)
+
+        # Requests go to the surviving replica while the dead one restarts
+        for _ in range(4):
+            assert pool.solve_batch([TASK], max_steps=1) == expected
+        assert pool.restarts == [1, 0]
+        assert pool._processes[0] is not victim and pool._processes[0].is_alive()
+
+        deadline = time.monotonic() + 120
+        while pool._starting and time.monotonic() < deadline:
+            time.sleep(0.1)
+        assert not pool._starting
+        assert [pool.solve_batch([TASK], max_steps=1) for _ in range(2)] == [expected] * 2
+    finally:
+        pool.close()
+
+
+def test_jobs_of_a_dying_replica_fail_instead_of_hanging(parent):
+    pool = ReplicaPool(parent, ReplicaConfig(replicas=1, cores_per_replica=1))
+    try:
+        assert pool.wait_ready(timeout=120)
+        events = pool.solve_stream(TASK, max_steps=16)
+        next(events)
+        pool._processes[0].kill()
+        with pytest.raises(ReplicaError):
+            list(events)
+        assert pool.outstanding == [0]
+        # The replacement serves the next request once it has started
+        assert pool.solve_batch([TASK], max_steps=1) == parent.solve_batch([TASK], max_steps=1)
+    finally:
+        pool.close()
@@ -0,0 +1,121 @@
+"""Tests for the packed result store"""
+import os
+
+import numpy as np
+import pytest
+
+from result_store import INDEX_DTYPE, ResultReader, ResultStore, pack_record, unpack_record
+
+
+def trace(rng, steps, shape, changes):
+    """Iteration grids where each step changes about `changes` cells of the one before"""
+    grid = rng.integers(0, 10, size=shape)
+    grids = [grid.copy()]
+    for _ in range(steps - 1):
+        cells = rng.integers(0, grid.size, size=changes)
+        grid.ravel()[cells] = rng.integers(0, 10, size=changes)
+        grids.append(grid.copy())
+    return [g.tolist() for g in grids]
+
+
+def make_result(seed=0):
+    rng = np.random.default_rng(seed)
+    dense = trace(rng, 16, (30, 30), 400)
+    sparse = trace(rng, 5, (7, 3), 1)
+    return {
+        'predictions': [
+            # Trace ending at the final grid, consecutive steps, changes stored as bitmaps
+            {'prediction': dense[-1], 'steps': 16,
+             'iterations': [{'step': s + 1, 'prediction': g} for s, g in enumerate(dense)]},
+            # Trace ending elsewhere, explicit step numbers, changes stored as positions, attempts
+            {'prediction': rng.integers(0, 10, size=(7, 3)).tolist(), 'steps': 9,
+             'attempts': [sparse[0], sparse[1]],
+             'iterations': [{'step': s, 'prediction': g} for s, g in zip([1, 2, 4, 8, 9], sparse)]},
+            # Final grid only, odd cell count, with a field kept in the header
+            {'prediction': [[1, 2, 3]], 'steps': 1, 'confidence': 0.5},
+        ],
+        'tta': {'views': 8},
+    }
+
+
+def test_record_round_trip():
+    result = make_result()
+    header = {'task_id': 'abc', 'options': {'max_steps': 16}}
+    decoded = unpack_record(b'\0' * 3 + pack_record(result, header), offset=3, as_lists=True)
+    assert decoded == {**header, **result}
+
+
+def test_record_arrays_and_skipped_iterations():
+    result = make_result()
+    data = pack_record(result, {})
+    decoded = unpack_record(data)
+    assert decoded['predictions'][0]['prediction'].dtype == np.uint8
+    assert decoded['predictions'][0]['prediction'].tolist() == result['predictions'][0]['prediction']
+
+    final_only = unpack_record(data, iterations=False, as_lists=True)
+    expected = [{k: v for k, v in p.items() if k != 'iterations'} for p in result['predictions']]
+    assert final_only['predictions'] == expected
+
+
+def test_store_append_and_read(tmp_path):
+    store = ResultStore(str(tmp_path))
+    results = [make_result(seed) for seed in range(3)]
+    rows = [store.append('task-a', 'ckpt-1', results[0], {'max_steps': 16}, timestamp=100.0),
+            store.append('task-b', 'ckpt-1', results[1], timestamp=200.0),
+            store.append('task-a', 'ckpt-2', results[2], timestamp=300.0)]
+    assert rows == [0, 1, 2]
+
+    reader = ResultReader(str(tmp_path))
+    assert len(reader) == 3
+    assert sorted(reader.task_ids) == ['task-a', 'task-b']
+    assert reader.select(task_id='task-a').tolist() == [0, 2]
+    assert reader.select(checkpoint='ckpt-1', since=150.0).tolist() == [1]
+    assert reader.select(task_id='missing').tolist() == []
+    record = reader.read(2, as_lists=True)
+    assert (record['task_id'], record['checkpoint'], record['timestamp']) == ('task-a', 'ckpt-2', 300.0)
+    assert record['predictions'] == results[2]['predictions']
+
+    # Readers see later appends after a refresh
+    store.append('task-c', 'ckpt-2', results[0])
+    assert len(reader) == 3
+    reader.refresh()
+    assert reader.read(3, as_lists=True)['predictions'] == results[0]['predictions']
+    reader.close()
+    store.close()
+
+
+@pytest.mark.parametrize('torn', ['log', 'index', 'strings'])
+def test_reopen_drops_a_torn_tail(tmp_path, torn):
+    store = ResultStore(str(tmp_path))
+    store.append('task-a', 'ckpt', make_result(0))
+    store.close()
+    sizes = {name: os.path.getsize(tmp_path / name) for name in ('results.log', 'index.bin', 'strings.txt')}
+
+    # A crash part-way through the next append
+    if torn == 'log':
+        (tmp_path / 'results.log').open('ab').write(pack_record(make_result(1), {})[:50])
+    elif torn == 'index':
+        (tmp_path / 'results.log').open('ab').write(pack_record(make_result(1), {'task_id': 'task-b'}))
+        (tmp_path / 'index.bin').open('ab').write(b'\1' * (INDEX_DTYPE.itemsize // 2))
+    else:
+        (tmp_path / 'strings.txt').open('a').write('"task-')
+
+    assert len(ResultReader(str(tmp_path))) == 1
+    store = ResultStore(str(tmp_path))
+    assert {name: os.path.getsize(tmp_path / name) for name in sizes} == sizes
+    store.append('task-b', 'ckpt', make_result(2))
+    store.close()
+
+    reader = ResultReader(str(tmp_path))
+    assert reader.task_ids == ['task-a', 'task-b']
+    assert reader.read(1, as_lists=True)['predictions'] == make_result(2)['predictions']
+
+
+def test_solve_results_round_trip(model, tmp_path):
+    task = {'train': [], 'test': [{'input': [[1, 2, 3], [4, 5, 6]]}, {'input': [[7] * 5] * 4}]}
+    result = model.solve_batch([task], max_steps=4, show_iterations=True, array_grids=True)[0]
+    store = ResultStore(str(tmp_path))
+    store.append('task', model.fingerprint, result, {'max_steps': 4})
+    store.close()
+    expected = model.solve_batch([task], max_steps=4, show_iterations=True)[0]
+    assert ResultReader(str(tmp_path)).read(0, as_lists=True)['predictions'] == expected['predictions']
@@ -0,0 +1,129 @@
+"""Tests for coalescing identical in-flight solves"""
+import asyncio
+
+import pytest
+
+from singleflight import SingleFlight
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def test_exact_duplicates_share_one_solve():
+    flights = SingleFlight()
+    calls = []
+
+    async def solve():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return {'answer': 42}
+
+    async def main():
+        return await asyncio.gather(*[flights.run('key', solve) for _ in range(4)])
+
+    results = run(main())
+    assert calls == [1]
+    assert all(result is results[0] for result in results)
+    stats = flights.stats()
+    assert stats['leaders'] == 1 and stats['exact_hits'] == 3 and stats['prefix_hits'] == 0
+    assert stats['dup_rate'] == 0.75 and stats['in_flight'] == 0
+
+
+def test_distinct_keys_run_separately():
+    flights = SingleFlight()
+
+    async def main():
+        return await asyncio.gather(*[flights.run(key, lambda key=key: asyncio.sleep(0, key)) for key in 'abc'])
+
+    assert run(main()) == ['a', 'b', 'c']
+    assert flights.stats()['leaders'] == 3 and flights.stats()['exact_hits'] == 0
+
+
+def test_prefix_group_waits_for_the_longest_running_solve():
+    flights = SingleFlight(prefix_reuse=True)
+    order = []
+
+    def solve(name, delay):
+        async def fn():
+            order.append(f"{name} start")
+            await asyncio.sleep(delay)
+            order.append(f"{name} end")
+            return name
+        return fn
+
+    async def main():
+        short = asyncio.ensure_future(flights.run('short', solve('short', 0.02), group='g', max_steps=4))
+        long = asyncio.ensure_future(flights.run('long', solve('long', 0.05), group='g', max_steps=16))
+        await asyncio.sleep(0)
+        # Both are running; a third request waits for the 16-step solve before running its own
+        middle = await flights.run('middle', solve('middle', 0), group='g', max_steps=8)
+        return await short, await long, middle
+
+    assert run(main()) == ('short', 'long', 'middle')
+    assert order.index('middle start') > order.index('long end')
+    stats = flights.stats()
+    assert stats['leaders'] == 1 and stats['prefix_hits'] == 2 and stats['exact_hits'] == 0
+
+
+def test_groups_are_ignored_without_prefix_reuse():
+    flights = SingleFlight(prefix_reuse=False)
+
+    async def main():
+        return await asyncio.gather(flights.run('a', lambda: asyncio.sleep(0.01, 'a'), group='g', max_steps=4),
+                                    flights.run('b', lambda: asyncio.sleep(0.01, 'b'), group='g', max_steps=8))
+
+    assert run(main()) == ['a', 'b']
+    assert flights.stats()['leaders'] == 2 and flights.stats()['prefix_hits'] == 0
+
+
+def test_failures_reach_every_waiter_and_are_not_cached():
+    flights = SingleFlight(prefix_reuse=True)
+    calls = []
+
+    async def fail():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        raise RuntimeError("solve failed")
+
+    async def main():
+        results = await asyncio.gather(*[flights.run('key', fail, group='g', max_steps=4) for _ in range(3)],
+                                       return_exceptions=True)
+        # The failed flight is gone, so the next request runs again
+        retry = await flights.run('key', lambda: asyncio.sleep(0, 'ok'), group='g', max_steps=4)
+        return results, retry
+
+    results, retry = run(main())
+    assert calls == [1]
+    assert all(isinstance(result, RuntimeError) for result in results)
+    assert retry == 'ok'
+
+
+def test_finished_flights_are_removed():
+    flights = SingleFlight(prefix_reuse=True)
+
+    async def main():
+        running = asyncio.ensure_future(flights.run('a', lambda: asyncio.sleep(0.01, 'a'), group='g', max_steps=4))
+        await asyncio.sleep(0)
+        assert flights.in_flight == 1 and len(flights._groups['g']) == 1
+        await running
+        # Done callbacks run on the next loop iteration
+        await asyncio.sleep(0)
+
+    run(main())
+    assert flights._flights == {} and flights._groups == {}
+
+
+def test_a_cancelled_waiter_does_not_cancel_the_solve():
+    flights = SingleFlight()
+
+    async def main():
+        leader = asyncio.ensure_future(flights.run('key', lambda: asyncio.sleep(0.02, 'done')))
+        follower = asyncio.ensure_future(flights.run('key', lambda: asyncio.sleep(0, 'other')))
+        await asyncio.sleep(0)
+        follower.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await follower
+        return await leader
+
+    assert run(main()) == 'done'
@@ -0,0 +1,48 @@
+"""Tests for the sweep coordinator's network exposure"""
+import sys
+
+import pytest
+
+import sweep
+
+
+@pytest.mark.parametrize('host, loopback', [
+    ('127.0.0.1', True), ('localhost', True), ('::1', True),
+    ('0.0.0.0', False), ('', False), ('192.168.1.10', False),
+])
+def test_is_loopback(host, loopback):
+    assert sweep.is_loopback(host) == loopback
+
+
+def run_main(monkeypatch, *argv):
+    monkeypatch.setattr(sys, 'argv', ['sweep.py', *argv])
+    sweep.main()
+
+
+def test_coordinator_listens_on_loopback_by_default(monkeypatch):
+    seen = {}
+
+    def coordinate(args):
+        seen.update(host=args.host, authkey=args.authkey)
+    monkeypatch.setattr(sweep, 'coordinate', coordinate)
+    run_main(monkeypatch, 'coordinate')
+    assert seen == {'host': '127.0.0.1', 'authkey': None}
+
+
+def test_no_built_in_authkey(monkeypatch):
+    monkeypatch.delenv('TRM_SWEEP_AUTHKEY', raising=False)
+    with pytest.raises(SystemExit, match="TRM_SWEEP_AUTHKEY"):
+        run_main(monkeypatch, 'work')
+
+
+def test_public_interface_needs_an_explicit_authkey(monkeypatch):
+    monkeypatch.delenv('TRM_SWEEP_AUTHKEY', raising=False)
+    with pytest.raises(SystemExit, match="needs a shared secret"):
+        run_main(monkeypatch, 'coordinate', '--host', '0.0.0.0')
+
+
+def test_serve_rejects_an_empty_authkey():
+    coordinator = sweep.Coordinator([], progress=type('Done', (), {'done': {}})(), config=sweep.SweepConfig(),
+                                    fingerprint=None)
+    with pytest.raises(ValueError):
+        coordinator.serve(('127.0.0.1', 0), b'')
@@ -0,0 +1,103 @@
+"""Tests for per-task puzzle embeddings fitted to the training pairs"""
+import pytest
+import torch
+
+from task_conditioning import ConditioningConfig, TaskConditioner
+from tta import TTAConfig
+
+
+def make_task(seed, size=4):
+    generator = torch.Generator().manual_seed(seed)
+    grid = lambda: torch.randint(0, 10, (size, size), generator=generator).tolist()
+    return {'train': [{'input': grid(), 'output': grid()} for _ in range(2)],
+            'test': [{'input': grid()}, {'input': grid()}]}
+
+
+@pytest.fixture(scope='module')
+def conditioned():
+    """A model of its own (slots are written into its embedding table) with a small, fast fit"""
+    from inference import TRMInference
+    torch.manual_seed(0)
+    inference = TRMInference(checkpoint_path=None, fast_start=False)
+    inference.task_conditioner = TaskConditioner(
+        inference, ConditioningConfig(enabled=True, fit_steps=2, act_steps=1, learning_rate=0.1, slots=4)
+    )
+    return inference
+
+
+def test_fitting_changes_the_task_embedding(conditioned):
+    conditioner = conditioned.task_conditioner
+    task = make_task(0)
+    fitted = conditioner.fit(task)
+    assert not torch.equal(fitted, conditioner.initial_embedding)
+
+    with conditioner.assign([task]) as (slot,):
+        assert slot >= conditioner.first_slot
+        assert torch.allclose(conditioner.table[slot].float(), fitted)
+
+
+def test_cache_hit_reuses_the_slot_without_refitting(conditioned, monkeypatch):
+    conditioner = conditioned.task_conditioner
+    task = make_task(2)
+    with conditioner.assign([task]) as (first,):
+        embedding = conditioner.table[first].clone()
+    fits = conditioner.cache.fits
+
+    def refit(task, seq_len):
+        raise AssertionError("a cached task was fitted again")
+    monkeypatch.setattr(conditioner, 'fit', refit)
+    with conditioner.assign([task]) as (second,):
+        assert second == first
+        assert torch.equal(conditioner.table[second], embedding)
+    assert conditioner.cache.fits == fits
+    assert conditioner.cache.hits > 0
+
+
+def test_tasks_without_training_pairs_stay_unconditioned(conditioned):
+    task = make_task(3)
+    with conditioned.task_conditioner.assign([{'train': [], 'test': task['test']}, task]) as slots:
+        assert slots[0] is None and slots[1] is not None
+
+
+def test_batched_conditioned_solves_match_single_task_solves(conditioned):
+    tasks = [make_task(seed) for seed in (4, 5, 6)]
+    together = conditioned.solve_batch(tasks, max_steps=3)
+    for task, result in zip(tasks, together):
+        assert result == conditioned.solve_batch([task], max_steps=3)[0]
+        assert result == conditioned.solve(task, max_steps=3, batched=False)
+
+
+def test_tta_views_use_the_fitted_embedding(conditioned, monkeypatch):
+    task = make_task(7)
+    with conditioned.task_conditioner.assign([task]) as (slot,):
+        pass
+
+    seen = []
+    run_blocks = conditioned.run_blocks
+
+    def spy(blocks, *args, **kwargs):
+        seen.extend(int(puzzle_id) for block in blocks for puzzle_id in block.puzzle_ids)
+        return run_blocks(blocks, *args, **kwargs)
+    monkeypatch.setattr(conditioned, 'run_blocks', spy)
+
+    voted = conditioned.solve_batch([task], max_steps=3, tta=TTAConfig(num_views=1))[0]
+    assert seen and set(seen) == {slot}
+    plain = conditioned.solve_batch([task], max_steps=3)[0]
+    assert [p['prediction'] for p in voted['predictions']] == [p['prediction'] for p in plain['predictions']]
+
+
+def test_embeddings_are_fitted_at_the_solve_sequence_length(conditioned, monkeypatch):
+    conditioner = conditioned.task_conditioner
+    task = make_task(8)
+    fitted = []
+    fit = conditioner.fit
+
+    def spy(task, seq_len):
+        fitted.append(seq_len)
+        return fit(task, seq_len)
+    monkeypatch.setattr(conditioner, 'fit', spy)
+
+    conditioned.solve_batch([task], max_steps=1)
+    conditioned.solve_batch([task], max_steps=1, bucketed=True)
+    conditioned.solve_batch([task], max_steps=1, bucketed=True)
+    assert fitted == [conditioned.seq_len, conditioned.bucket_for(4, 4)]
@@ -0,0 +1,61 @@
+"""Tests for test-time augmentation"""
+import pytest
+import torch
+
+from tta import TTAConfig, make_views, invert_views, dihedral_indices, vote
+
+
+@pytest.mark.parametrize('height,width', [(1, 1), (3, 3), (2, 5), (7, 4)])
+@pytest.mark.parametrize('num_views', [1, 8, 16])
+def test_inverted_views_round_trip_to_the_original(height, width, num_views):
+    grid = torch.randint(0, 10, (height * width,), generator=torch.Generator().manual_seed(height * width))
+    views = make_views(grid, height, width, TTAConfig(num_views=num_views))
+    assert views['inputs'].shape == (num_views, height * width)
+    assert torch.equal(invert_views(views['inputs'], views), grid.long().expand(num_views, -1))
+
+
+def test_views_are_all_eight_dihedral_transforms():
+    forward, inverse = dihedral_indices(2, 3)
+    assert len({tuple(row) for row in forward.tolist()}) == 8
+    assert torch.equal(forward.gather(1, inverse), torch.arange(6).expand(8, -1))
+
+
+def test_views_keep_background_and_padding_colors():
+    grid = torch.tensor([0, 1, 2, 10])
+    views = make_views(grid, 2, 2, TTAConfig(num_views=8, seed=3))
+    for view, shape in zip(views['inputs'], views['shapes']):
+        assert (view == 0).sum() == 1 and (view == 10).sum() == 1
+        assert shape == (2, 2)
+
+
+def test_vote_ranks_candidates_by_weight():
+    preds = torch.tensor([[1, 2], [3, 4], [1, 2]])
+    candidates, scores = vote(preds, torch.tensor([1.0, 5.0, 1.0]))
+    assert candidates.tolist() == [[3, 4], [1, 2]]
+    assert scores.tolist() == [5.0, 2.0]
+
+
+def test_vote_ties_go_to_the_identity_view():
+    # [9, 9] sorts after [1, 1], so only the tie-break puts it first
+    preds = torch.tensor([[9, 9], [1, 1], [5, 5], [1, 1], [9, 9]])
+    candidates, scores = vote(preds, torch.ones(5))
+    assert candidates.tolist() == [[9, 9], [1, 1], [5, 5]]
+    assert scores.tolist() == [2.0, 2.0, 1.0]
+
+
+def test_solve_tta_votes_one_prediction_per_test_input(model, eval_tasks):
+    tasks = list(eval_tasks.values())[:2]
+    results = model.solve_batch(tasks, max_steps=2, tta=TTAConfig(num_views=4))
+    for task, result in zip(tasks, results):
+        assert len(result['predictions']) == len(task['test'])
+        for prediction, test in zip(result['predictions'], task['test']):
+            shape = (len(test['input']), len(test['input'][0]))
+            assert (len(prediction['prediction']), len(prediction['prediction'][0])) == shape
+            assert prediction['attempts'][0] == prediction['prediction']
+            assert 0 < prediction['agreement'] <= 1
+
+
+def test_tta_rejects_show_iterations(model, eval_tasks):
+    with pytest.raises(ValueError, match="show_iterations"):
+        model.solve_batch(list(eval_tasks.values())[:1], max_steps=2, show_iterations=True,
+                          tta=TTAConfig(num_views=2))
@@ -0,0 +1,213 @@
+"""
+Test-time augmentation for TRM inference
+Runs dihedral and color-permuted views of each test grid as one batch and votes on the answers
+"""
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Tuple, Any, Optional
+
+import torch
+
+from inference import RowBlock, EarlyExitPolicy
+
+NUM_DIHEDRAL = 8
+NUM_TOKENS = 11  # 0-9 colors + padding
+
+
+@dataclass(frozen=True)
+class TTAConfig:
+    """Test-time augmentation settings"""
+    num_views: int = 8            # Augmented views per test input (view 0 is the original)
+    permute_colors: bool = True   # Apply a random permutation of colors 1-9 to views 1..n
+    vote: str = "majority"        # 'majority' or 'confidence' (weighted by halt confidence)
+    chunk_size: int = 64          # Maximum rows per model call
+    seed: int = 0                 # Seed for the color permutations
+
+
+def dihedral_indices(height: int, width: int) -> Tuple[torch.Tensor, torch.Tensor]:
+    """
+    Flat gather indices for the 8 dihedral transforms of a height x width grid
+
+    Transform t transposes when bit 2 is set, then flips rows (bit 1) and
+    columns (bit 0). Row t of the forward table lists, for each cell of the
+    transformed grid in row-major order, the source cell it comes from.
+
+    Returns:
+        (forward, inverse) index tables, each [8, height * width]
+    """
+    area = height * width
+    t = torch.arange(NUM_DIHEDRAL)[:, None]
+    k = torch.arange(area)[None, :]
+    transpose, flip_rows, flip_cols = (t >> 2) & 1, (t >> 1) & 1, t & 1
+
+    # Coordinates in the transformed grid
+    out_h = torch.where(transpose.bool(), width, height)
+    out_w = torch.where(transpose.bool(), height, width)
+    i, j = k // out_w, k % out_w
+
+    # Undo the flips, then the transpose
+    i = torch.where(flip_rows.bool(), out_h - 1 - i, i)
+    j = torch.where(flip_cols.bool(), out_w - 1 - j, j)
+    r = torch.where(transpose.bool(), j, i)
+    c = torch.where(transpose.bool(), i, j)
+
+    forward = r * width + c
+    return forward, forward.argsort(dim=1)
+
+
+def transformed_shape(height: int, width: int, transforms: torch.Tensor) -> List[Tuple[int, int]]:
+    """Grid shape after each dihedral transform"""
+    return [(width, height) if t & 4 else (height, width) for t in transforms.tolist()]
+
+
+def color_permutations(num_views: int, permute: bool, seed: int) -> torch.Tensor:
+    """
+    Token permutations for each view, [num_views, 11]
+
+    Background (0) and padding (10) stay fixed; view 0 is always the identity.
+    """
+    identity = torch.arange(NUM_TOKENS).expand(num_views, NUM_TOKENS).clone()
+    if not permute or num_views < 2:
+        return identity
+    generator = torch.Generator().manual_seed(seed)
+    shuffled = torch.rand(num_views - 1, 9, generator=generator).argsort(dim=1) + 1
+    identity[1:, 1:10] = shuffled
+    return identity
+
+
+def make_views(grid: torch.Tensor, height: int, width: int, config: TTAConfig) -> Dict[str, Any]:
+    """
+    Build all augmented views of one flattened grid with a single gather
+
+    Args:
+        grid: [height * width] flattened test grid
+        height, width: Grid shape
+        config: TTA settings
+
+    Returns:
+        Dict with 'inputs' [num_views, area], per-view 'shapes', and the
+        'inverse' index table and 'unpermute' token table that map each view's
+        prediction back to the original frame
+    """
+    forward, inverse = dihedral_indices(height, width)
+    transforms = torch.arange(config.num_views) % NUM_DIHEDRAL
+    perms = color_permutations(config.num_views, config.permute_colors, config.seed)
+
+    inputs = perms.gather(1, grid.long()[forward[transforms]])
+    return {
+        'inputs': inputs.to(torch.int32),
+        'shapes': transformed_shape(height, width, transforms),
+        'inverse': inverse[transforms],
+        'unpermute': perms.argsort(dim=1),
+    }
+
+
+def invert_views(preds: torch.Tensor, views: Dict[str, Any]) -> torch.Tensor:
+    """Map [num_views, area] predictions back to the original grid frame and colors"""
+    preds = views['unpermute'].gather(1, preds.long())
+    return preds.gather(1, views['inverse'])
+
+
+def vote(preds: torch.Tensor, weights: torch.Tensor) -> Tuple[torch.Tensor, torch.Tensor]:
+    """
+    Aggregate whole-grid predictions
+
+    Args:
+        preds: [num_views, area] predictions mapped back to the original frame
+        weights: [num_views] vote weight per view
+
+    Returns:
+        Distinct candidate grids [num_candidates, area] and their scores, best
+        first; ties go to the candidate of the earliest view (view 0, the
+        identity or the primary model, wins them)
+    """
+    candidates, inverse = torch.unique(preds, dim=0, return_inverse=True)
+    scores = torch.zeros(len(candidates), dtype=weights.dtype).index_add_(0, inverse, weights)
+    first_view = torch.full((len(candidates),), len(preds)).scatter_reduce_(
+        0, inverse, torch.arange(len(preds)), reduce='amin'
+    )
+    by_view = first_view.argsort()
+    order = by_view[scores[by_view].argsort(descending=True, stable=True)]
+    return candidates[order], scores[order]
+
+
+def solve_tta(model, tasks: List[Dict[str, Any]], max_steps: int = 16,
+              config: Optional[TTAConfig] = None,
+              early_exit: Optional[EarlyExitPolicy] = None,
+              bucketed: bool = False,
+              task_puzzle_ids: Optional[List[Optional[int]]] = None) -> List[Dict[str, Any]]:
+    """
+    Solve tasks by voting over augmented views of every test input
+
+    All views of all test inputs go through `model.run_blocks` together, in
+    chunks of `config.chunk_size` rows. Intermediate iterations are not
+    returned in this mode.
+
+    Args:
+        model: TRMInference instance
+        tasks: List of ARC-AGI task dicts
+        max_steps: Maximum recursive reasoning steps
+        config: TTA settings
+        early_exit: Optional policy for stopping views before max_steps
+        bucketed: If True, run each size bucket at its own sequence length
+        task_puzzle_ids: Puzzle id of each task's fitted embedding, or None for
+            the test index (see `TRMInference._conditioning`, which must stay
+            entered while this runs)
+
+    Returns:
+        One result dict per task with 'predictions' and a 'tta' throughput report.
+        Each prediction has the voted 'prediction', the top-2 'attempts', the
+        'agreement' (share of the vote for the winner) and the max 'steps' used
+    """
+    config = config or TTAConfig()
+    if config.vote not in ('majority', 'confidence'):
+        raise ValueError(f"Unknown vote method: {config.vote}")
+    start = time.perf_counter()
+
+    blocks, views, shapes = [], [], []
+    for task, task_puzzle_id in zip(tasks, task_puzzle_ids or [None] * len(tasks)):
+        for test_idx, test_input in enumerate(task['test']):
+            grid = test_input['input']
+            height, width = len(grid), len(grid[0])
+            view = make_views(model.preprocess_grid(grid), height, width, config)
+            blocks.append(RowBlock(
+                inputs=view['inputs'],
+                puzzle_ids=torch.full((config.num_views,), test_idx if task_puzzle_id is None else task_puzzle_id,
+                                      dtype=torch.int32),
+                shapes=view['shapes']
+            ))
+            views.append(view)
+            shapes.append((height, width))
+
+    runs = model.run_blocks(blocks, max_steps, early_exit=early_exit, bucketed=bucketed,
+                            max_rows=config.chunk_size)
+
+    rows = []
+    for view, run, (height, width) in zip(views, runs, shapes):
+        preds = invert_views(run['preds'], view)
+        if config.vote == 'confidence':
+            weights = torch.sigmoid(run['q_halt_logits'].float())
+        else:
+            weights = torch.ones(len(preds))
+        candidates, scores = vote(preds, weights)
+        rows.append({
+            'prediction': candidates[0].view(height, width).tolist(),
+            'attempts': [candidate.view(height, width).tolist() for candidate in candidates[:2]],
+            'agreement': float(scores[0] / scores.sum()),
+            'steps': int(run['steps'].max())
+        })
+
+    elapsed = time.perf_counter() - start
+    num_views = len(rows) * config.num_views
+    report = {
+        'views': num_views,
+        'seconds': elapsed,
+        'views_per_second': num_views / elapsed if elapsed > 0 else 0.0
+    }
+
+    results, offset = [], 0
+    for task in tasks:
+        num_tests = len(task['test'])
+        results.append({'predictions': rows[offset:offset + num_tests], 'tta': report})
+        offset += num_tests
+    return results